@@ -5,26 +5,29 @@ import os
 from datetime import datetime
 from modules.ui import load_css
 from modules.data_manager import (
-    load_data, save_data, add_item_to_path, 
-    save_temp_file, upload_and_delete, 
-    save_generated_notes_to_drive, read_notes_from_drive,
-    update_generated_notes, delete_drive_file, update_teacher_learning
+    load_data, refresh_data, save_data, flush_data, open_folder, iter_children, add_item_to_path, 
+    read_notes_from_drive,
+    update_generated_notes, delete_drive_file, update_teacher_learning,
+    log_revision, revision_page, iter_sessions, HISTORY_PAGE_SIZE
 )
-from modules.ai_engine import generate_hybrid_notes, learn_from_edits
+from modules.ai_engine import generate_and_save_notes, learn_from_edits
+from modules.search_index import notes_index
 
 # ==========================================
 # 1. SETUP & SESSION STATE
 # ==========================================
 if 'study_data' not in st.session_state:
     st.session_state.study_data = load_data()
+else:
+    refresh_data(st.session_state.study_data)  # pick up edits from other devices
 
 defaults = {
     'theme': 'light',
     'path': [],
     'study_start': None,
-    'total_hours': 142.0,
     'edit_mode': False,  # Track if we are editing notes
-    'clipboard_formula': "" # For the formula editor
+    'clipboard_formula': "", # For the formula editor
+    'history_pages': {}  # Session history pages already fetched from Firestore
 }
 for k, v in defaults.items():
     if k not in st.session_state: st.session_state[k] = v
@@ -33,10 +36,8 @@ st.set_page_config(page_title="StudyOS Cloud", layout="wide")
 load_css(st.session_state['theme'])
 
 def get_current_data():
-    data = st.session_state.study_data
-    for step in st.session_state.path:
-        data = data.get(step, {})
-    return data
+    # Fetches the folder being browsed if it isn't loaded yet (per-node layout)
+    return open_folder(st.session_state.study_data, st.session_state.path)
 
 # ==========================================
 # 2. HELPER UI FUNCTIONS
@@ -120,6 +121,7 @@ if is_lecture:
     if 'active_lecture' not in st.session_state or st.session_state.active_lecture != current_name:
         st.session_state.active_lecture = current_name
         st.session_state.lecture_start_time = time.time()
+        st.session_state.history_page = 0
     
     elapsed_seconds = time.time() - st.session_state.lecture_start_time
     elapsed_mins = int(elapsed_seconds // 60)
@@ -151,6 +153,8 @@ if is_lecture:
             if 'cached_notes' not in st.session_state or st.session_state.get('cached_id') != notes_id:
                 st.session_state.cached_notes = read_notes_from_drive(notes_id)
                 st.session_state.cached_id = notes_id
+                if st.session_state.cached_notes:
+                    notes_index().add(notes_id, st.session_state.path, st.session_state.cached_notes)
             
             cloud_text = st.session_state.cached_notes
 
@@ -181,9 +185,18 @@ if is_lecture:
                     if st.button("💾 SAVE & TEACH AI", use_container_width=True):
                         with st.spinner("Syncing to Cloud & Analyzing your edits..."):
                             
-                            # A. Update File in Drive
-                            new_id = update_generated_notes(new_text, st.session_state.path)
+                            # A. Update File in Drive (same file ID, skipped if unchanged)
+                            upload = update_generated_notes(new_text, st.session_state.path, notes_id)
+                            if upload is None:
+                                st.error("Could not save to Drive. Your edits are still in the editor.")
+                                st.stop()
+                            new_id = upload.file_id
                             current_data['drive_ids']['notes_id'] = new_id
+                            if new_id != notes_id:
+                                notes_index().remove(notes_id)
+                            if upload.action == "skipped":
+                                st.toast("No changes to upload.")
+                            notes_index().add(new_id, st.session_state.path, new_text)
                             
                             # B. THE LEARNING LOOP (Secret AI Agent)
                             # We compare what was there (cloud_text) vs what you wrote (new_text)
@@ -224,6 +237,7 @@ if is_lecture:
                     
                     if st.button("🗑️ DELETE & RESET"):
                         # Delete notes from Cloud too? Maybe just unlink.
+                        notes_index().remove(notes_id)
                         current_data['drive_ids'] = {}
                         save_data(st.session_state.study_data)
                         st.rerun()
@@ -231,6 +245,7 @@ if is_lecture:
             else:
                 st.error("Error fetching notes. File might be deleted from Drive.")
                 if st.button("Reset Link"):
+                    notes_index().remove(notes_id)
                     current_data['drive_ids'] = {}
                     save_data(st.session_state.study_data)
                     st.rerun()
@@ -245,41 +260,40 @@ if is_lecture:
             with c_up2:
                 audio_file = st.file_uploader("2. Lecture (Audio)", type=['mp3', 'wav', 'm4a'])
             
+            notes_mode = st.radio(
+                "Long slide decks:",
+                ["📚 Complete (every slide, in parts)", "⚡ Compact (best slides only, one call)"],
+                horizontal=True,
+                help="Decks that fit the prompt are always sent whole.")
+            force_regen = st.checkbox("♻️ Ignore cache (force a fresh AI generation)")
             if pdf_file and st.button("✨ GENERATE NOTES (AUTO-CLEANUP)", use_container_width=True):
                 status = st.empty()
                 progress = st.progress(0)
                 
-                # 1. STAGING
-                status.info("⏳ Step 1/4: Staging files locally...")
-                pdf_temp, _ = save_temp_file(pdf_file)
-                audio_temp = None
-                if audio_file:
-                    audio_temp, _ = save_temp_file(audio_file)
-                progress.progress(25)
-                
-                # 2. AI GENERATION
-                status.info("🧠 Step 2/4: AI is analyzing (this takes ~30s)...")
-                # Using Default teacher persona for now
-                ai_text = generate_hybrid_notes(pdf_temp, audio_temp, teacher_name="Default")
-                progress.progress(60)
-                
-                # 3. CLOUD SYNC
-                status.info("☁️ Step 3/4: Uploading Notes to Google Drive...")
-                notes_drive_id = save_generated_notes_to_drive(ai_text, st.session_state.path)
+                # 1-3. STAGING, AI GENERATION & CLOUD SYNC run as one pipeline: the uploads
+                # stay in RAM, and slide reading, the audio upload and the Drive folder
+                # lookup overlap instead of running one after another.
+                def show_progress(event):
+                    if event.state == "started":
+                        status.info(event.message)
+                    progress.progress(min(event.percent, 99))
+
+                ai_text, notes_drive_id = generate_and_save_notes(
+                    pdf_file, audio_file, st.session_state.path, teacher_name="Default",
+                    use_cache=not force_regen, on_progress=show_progress,
+                    chunked=False if "Compact" in notes_mode else None)
                 current_data['drive_ids']['notes_id'] = notes_drive_id
-                progress.progress(80)
+                if notes_drive_id:
+                    notes_index().add(notes_drive_id, st.session_state.path, ai_text)
                 
-                # 4. TOTAL WIPEOUT (Delete Input Files from Laptop AND Cloud)
-                status.info("🗑️ Step 4/4: Performing Total Wipeout...")
-                
-                # Note: We are deleting the local temp folder. 
-                # Since we didn't upload the raw PDF/Audio to Drive in this flow (only notes),
-                # we just need to clean the local disk.
-                import shutil
-                shutil.rmtree("temp_staging") 
+                # 4. TOTAL WIPEOUT
+                # The raw PDF/Audio never touched the local disk or Drive (only notes
+                # were uploaded), so there is nothing left to delete.
+                status.info("🗑️ Performing Total Wipeout...")
                 
                 current_data['notes_date'] = datetime.now().strftime("%Y-%m-%d")
                 save_data(st.session_state.study_data)
+                flush_data()  # the new notes link must not sit in the queue
                 
                 progress.progress(100)
                 status.success("Done! Laptop & Cloud storage clean.")
@@ -289,10 +303,25 @@ if is_lecture:
     # === TAB 2: REVISION HISTORY ===
     with tab2:
         st.markdown("#### 📅 Session Log")
-        history = current_data.get('revision_history', [])
+        page = st.session_state.get('history_page', 0)
+        history, total = revision_page(st.session_state.path, current_data, page,
+                                       cache=st.session_state.history_pages)
         
         if history:
             st.table(history)
+            pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            c_prev, c_info, c_next = st.columns([1, 2, 1])
+            if c_prev.button("⬅️ Newer", disabled=page == 0):
+                st.session_state.history_page = page - 1
+                st.rerun()
+            c_info.caption(f"Page {page + 1} of {pages} · {total} sessions")
+            if c_next.button("Older ➡️", disabled=page + 1 >= pages):
+                st.session_state.history_page = page + 1
+                st.rerun()
+        elif current_data.get('revision_daily') or current_data.get('revision_weekly'):
+            # Session history unreachable (offline): fall back to the synced roll-ups
+            st.table([{"date": day, "sessions": n, "minutes": m}
+                      for day, n, m in sorted(iter_sessions(current_data), reverse=True)])
         else:
             st.info("No sessions logged yet.")
             
@@ -312,8 +341,10 @@ if is_lecture:
                 "time_taken": f"{time_val}m",
                 "status": "Completed"
             }
-            current_data['revision_history'].append(new_entry)
-            st.session_state.total_hours += (time_val/60)
+            log_revision(st.session_state.study_data, st.session_state.path, new_entry)
+            if "review_queue" in st.session_state:
+                st.session_state.review_queue.log_session(st.session_state.path, current_data)
+            st.session_state.history_page = 0
             
             # Reset timer
             st.session_state.lecture_start_time = time.time()
@@ -344,7 +375,7 @@ else:
 
     # --- CONTENTS GRID (Standard for both Home & Folders) ---
     cols = st.columns(3)
-    keys = [k for k in current_data.keys() if k not in ["type", "drive_ids", "tasks", "revision_history", "notes_date"]]
+    keys = [k for k, _ in iter_children(current_data)]
     
     if not keys:
         st.info("Empty folder. Add something below!")
@@ -368,5 +399,6 @@ else:
         if st.form_submit_button("Create"):
             if name:
                 st.session_state.study_data = add_item_to_path(
-                    st.session_state.study_data, st.session_state.path, name, type_)
+                    st.session_state.study_data, st.session_state.path, name, type_,
+                    search_index=st.session_state.get("search_index"))
                 st.rerun()
\ No newline at end of file
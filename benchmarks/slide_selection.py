@@ -0,0 +1,62 @@
+"""Prompt size and runtime: first-30k truncation vs ranked slide selection.
+
+Builds synthetic lecture decks (filler slides, repeated template slides,
+a few topic slides spread through the deck and summary slides at the end)
+and reports how much of the budget each strategy uses, how long it takes
+and how many of the key slides end up in the prompt.
+
+    python -m benchmarks.slide_selection [--pages 100 300 1000]
+"""
+import argparse
+import random
+import time
+
+from modules.ai_engine import PROMPT_CHAR_BUDGET
+from modules.slide_selector import select_slides
+
+TOPIC = "Signals Fourier Transform"
+WORDS = ("signal system response input output sample value example figure table "
+         "circuit voltage current gain phase filter noise model method result").split()
+
+
+def synthetic_deck(pages: int, seed: int = 0):
+    """(pages, indexes of the key slides) for a deck of ``pages`` slides."""
+    rng = random.Random(seed)
+    deck = []
+    for i in range(pages):
+        if i % 7 == 3:  # the same template slide over and over
+            deck.append("Agenda: recap, examples, questions. Please read the assigned chapter.\n")
+        else:
+            deck.append(f"Slide {i}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "\n")
+    key = sorted(rng.sample(range(pages // 4, pages - 3), 5)) + [pages - 3, pages - 2, pages - 1]
+    for n, i in enumerate(key):
+        deck[i] = (f"Fourier transform key result {n}: duality, time shifting and the sinc spectrum "
+                   f"of the rectangular pulse, Parseval energy theorem.\n")
+    deck[-1] = "Summary for the exam: Fourier transform pairs, properties and Parseval.\n"
+    return deck, key
+
+
+def truncate(pages, budget):
+    return "".join(pages)[:budget]
+
+
+def run(page_counts, repeat=5):
+    print(f"{'pages':>6} {'strategy':>9} {'prompt chars':>13} {'ms':>8} {'key slides':>11}")
+    for count in page_counts:
+        deck, key = synthetic_deck(count)
+        for name, strategy in (("truncate", truncate),
+                               ("select", lambda p, b: select_slides(p, TOPIC, b))):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                prompt = strategy(deck, PROMPT_CHAR_BUDGET)
+            ms = (time.perf_counter() - start) * 1000 / repeat
+            covered = sum(1 for i in key if deck[i].strip() in prompt)
+            print(f"{count:>6} {name:>9} {len(prompt):>13} {ms:>8.1f} {covered:>7}/{len(key)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.pages, args.repeat)
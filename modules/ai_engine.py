@@ -1,10 +1,23 @@
 import google.generativeai as genai
 import PyPDF2
+import hashlib
+import io
+import mimetypes
+import multiprocessing
 import os
+import queue
 import time
 import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from dotenv import load_dotenv
-from modules.data_manager import load_teacher_profiles
+from modules import pdf_worker
+from modules.data_manager import load_teacher_profiles, save_generated_notes_to_drive
+from modules.drive_sync import authenticate, resolve_folder
+from modules.storage import ContentCache
+from modules.generator import CHUNK_CHARS, map_reduce_notes
+from modules.slide_selector import distinct_pages, select_slides
 
 # Load API Key
 load_dotenv()
@@ -14,26 +27,198 @@ if not api_key:
 else:
     genai.configure(api_key=api_key)
 
-def extract_text_from_pdf(pdf_path):
-    """Reads text from the temporary PDF file."""
+# CONSTANTS
+PROMPT_CHAR_BUDGET = 30000  # slide text sent to the model
+CHARS_PER_TOKEN = 4  # rough average for English slide text
+PARALLEL_MIN_PAGES = 40  # full extractions below this stay in-process
+PAGES_PER_CHUNK = 25
+MODEL_NAME = 'gemini-1.5-flash'
+PROMPT_VERSION = 2  # bump whenever the notes prompt changes
+CACHE_MAX_BYTES = {"pdf_text": 64 * 1024 * 1024, "gemini_files": 1024 * 1024,
+                   "notes": 32 * 1024 * 1024}
+GEMINI_FILE_TTL = 47 * 3600  # Gemini deletes uploads after 48 hours
+AUDIO_POLL_INITIAL = 0.5  # seconds between processing checks, growing ...
+AUDIO_POLL_BACKOFF = 1.5
+AUDIO_POLL_MAX = 5.0  # ... up to this
+AUDIO_POLL_TIMEOUT = 600
+PIPELINE_WORKERS = 4
+STAGE_MESSAGES = {
+    "persona": "🎭 Loading teacher persona...",
+    "fingerprint": "🔍 Checking for cached notes...",
+    "slides": "📄 Reading slides...",
+    "audio": "🎧 Uploading audio to AI Brain...",
+    "drive": "📁 Finding the lecture's Drive folder...",
+    "generate": "🧠 AI is writing the notes...",
+    "upload": "☁️ Uploading Notes to Google Drive...",
+}
+NOTES_STAGES = ("persona", "fingerprint", "slides", "audio", "generate")
+
+def extract_text_from_pdf(pdf_path, max_chars=None, max_tokens=None, workers=None):
+    """Reads text from a PDF path or an in-memory file (e.g. a Streamlit upload).
+
+    With a ``max_chars`` (or ``max_tokens``) budget, pages are read lazily
+    and extraction stops as soon as the budget is filled. Without one the
+    whole deck is read, big decks in parallel page ranges.
+    The app itself goes through ``extract_pages`` (slides are ranked and
+    chunked per page), so the budgeted path is only for callers that
+    want a plain prefix of the deck.
+    """
+    if max_tokens is not None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
     try:
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+        if max_chars is None:
+            return "".join(_extract_all(_pdf_bytes(pdf_path), workers))
+        parts, size = [], 0
+        for _, page_text in iter_pdf_pages(pdf_path):
+            parts.append(page_text[:max_chars - size])
+            size += len(parts[-1])
+            if size >= max_chars:
+                break
+        return "".join(parts)
     except Exception as e:
         print(f"PDF Error: {e}")
         return ""
 
+def extract_pages(pdf_path, workers=None):
+    """Text of every page, as a list (big decks are read in parallel)."""
+    try:
+        return _extract_all(_pdf_bytes(pdf_path), workers)
+    except Exception as e:
+        print(f"PDF Error: {e}")
+        return []
+
+def iter_pdf_pages(pdf_path, start=0, stop=None):
+    """Yields (page number, text + newline) one page at a time."""
+    if hasattr(pdf_path, 'read'):
+        pdf_path.seek(0)
+        yield from _iter_pages(pdf_path, start, stop)
+    elif isinstance(pdf_path, (bytes, bytearray)):
+        yield from _iter_pages(io.BytesIO(pdf_path), start, stop)
+    else:
+        with open(pdf_path, 'rb') as f:
+            yield from _iter_pages(f, start, stop)
+
+def _iter_pages(stream, start, stop):
+    reader = PyPDF2.PdfReader(stream)
+    for number in range(start, min(stop or len(reader.pages), len(reader.pages))):
+        yield number, (reader.pages[number].extract_text() or "") + "\n"
+
+def _pdf_bytes(pdf_path):
+    if isinstance(pdf_path, (bytes, bytearray)):
+        return bytes(pdf_path)
+    if hasattr(pdf_path, 'read'):
+        pdf_path.seek(0)
+        return pdf_path.read()
+    with open(pdf_path, 'rb') as f:
+        return f.read()
+
+def _extract_range(pdf_bytes, start, stop):
+    """Texts of pages [start, stop), in this process."""
+    return [text for _, text in iter_pdf_pages(pdf_bytes, start, stop)]
+
+def _extract_all(pdf_bytes, workers=None):
+    """Page texts of a whole deck; page ranges are extracted in a process pool for big decks.
+
+    Workers are spawned rather than forked (the app process runs sync
+    threads and a gRPC listener, which must not be forked) and get the
+    deck once each through ``pdf_worker.init``.
+    """
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+    if page_count < PARALLEL_MIN_PAGES:
+        return _extract_range(pdf_bytes, 0, page_count)
+    ranges = [(start, min(start + PAGES_PER_CHUNK, page_count))
+              for start in range(0, page_count, PAGES_PER_CHUNK)]
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=pdf_worker.init, initargs=(pdf_bytes,)) as pool:
+            chunks = pool.map(pdf_worker.extract_range, [r[0] for r in ranges], [r[1] for r in ranges])
+            return [page for chunk in chunks for page in chunk]
+    except (OSError, RuntimeError) as e:  # no process pool available here
+        print(f"PDF pool unavailable ({e}), extracting in-process.")
+        return _extract_range(pdf_bytes, 0, page_count)
+
+# --- CONTENT-ADDRESSED CACHE ---
+
+@lru_cache(maxsize=None)
+def _cache(namespace):
+    return ContentCache(namespace, CACHE_MAX_BYTES[namespace])
+
+def content_hash(source):
+    """SHA-256 of a file's bytes (a path, bytes or an in-memory file)."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    elif hasattr(source, 'read'):
+        source.seek(0)
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def cached_slide_pages(pdf_path, digest, use_cache=True):
+    """Every page's text, extracted once per distinct PDF."""
+    key = f"{digest}:pages"
+    if use_cache:
+        pages = _cache("pdf_text").get(key)
+        if pages is not None:
+            return json.loads(pages)
+    pages = extract_pages(pdf_path)
+    if pages:
+        _cache("pdf_text").set(key, json.dumps(pages, ensure_ascii=False))
+    return pages
+
+def cached_audio_upload(audio_path, digest, use_cache=True):
+    """Gemini file handle for the audio, re-using an earlier upload while it lives."""
+    cache = _cache("gemini_files")
+    if use_cache:
+        entry = cache.get(digest)
+        if entry is not None:
+            entry = json.loads(entry)
+            if time.time() - entry["uploaded_at"] < GEMINI_FILE_TTL:
+                try:
+                    audio_file = genai.get_file(entry["name"])
+                    if audio_file.state.name == "ACTIVE":
+                        print(f"⚡ Re-using uploaded audio: {entry['name']}")
+                        return audio_file
+                except Exception as e:
+                    print(f"Cached audio handle unusable: {e}")
+            cache.delete(digest)
+    audio_file = upload_audio_to_gemini(audio_path)
+    if audio_file:
+        cache.set(digest, json.dumps({"name": audio_file.name, "uploaded_at": time.time()}))
+    return audio_file
+
+def notes_cache_key(pdf_digest, audio_digest, persona):
+    """Key for generated notes: the inputs plus everything that shapes the prompt."""
+    persona_version = hashlib.sha256(
+        json.dumps(persona, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    parts = [pdf_digest, audio_digest, persona_version, PROMPT_VERSION, MODEL_NAME]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
 def upload_audio_to_gemini(audio_path):
-    """Uploads audio to Gemini's temporary server."""
-    print(f"🎧 Uploading audio to AI Brain: {os.path.basename(audio_path)}...")
+    """Uploads audio (a path or an in-memory file) to Gemini's temporary server."""
+    if hasattr(audio_path, 'read'):
+        display_name = getattr(audio_path, 'name', 'lecture_audio')
+        mime_type = (getattr(audio_path, 'type', None)
+                     or mimetypes.guess_type(display_name)[0] or 'audio/mpeg')
+        audio_path.seek(0)
+    else:
+        display_name = os.path.basename(audio_path)
+        mime_type = None
+    print(f"🎧 Uploading audio to AI Brain: {display_name}...")
     try:
-        audio_file = genai.upload_file(path=audio_path)
+        audio_file = genai.upload_file(path=audio_path, mime_type=mime_type, display_name=display_name)
+        delay, deadline = AUDIO_POLL_INITIAL, time.monotonic() + AUDIO_POLL_TIMEOUT
         while audio_file.state.name == "PROCESSING":
-            time.sleep(1)
+            if time.monotonic() > deadline:
+                raise TimeoutError("Audio processing timed out.")
+            time.sleep(delay)
+            delay = min(delay * AUDIO_POLL_BACKOFF, AUDIO_POLL_MAX)
             audio_file = genai.get_file(audio_file.name)
         if audio_file.state.name == "FAILED":
             raise ValueError("Audio processing failed.")
@@ -42,16 +227,158 @@ def upload_audio_to_gemini(audio_path):
         print(f"Audio Upload Error: {e}")
         return None
 
-def generate_hybrid_notes(pdf_path, audio_path=None, teacher_name="Default"):
+def _gemini(inputs):
+    """One Gemini call; the model callable used by the notes generators."""
+    return genai.GenerativeModel(MODEL_NAME).generate_content(inputs).text
+
+# --- GENERATION PIPELINE ---
+
+@dataclass
+class StageEvent:
+    """Progress of one pipeline stage; ``done``/``total`` count finished stages."""
+    stage: str
+    state: str  # "started", "done" or "skipped"
+    done: int
+    total: int
+
+    @property
+    def message(self):
+        return STAGE_MESSAGES.get(self.stage, self.stage)
+
+    @property
+    def percent(self):
+        return int(100 * self.done / self.total) if self.total else 100
+
+class Pipeline:
+    """Runs independent stages on a thread pool.
+
+    Progress events are queued by the workers and handed to ``on_progress``
+    on the caller's thread (Streamlit widgets can only be updated from
+    there) while it waits in ``result``.
+    """
+
+    def __init__(self, stages, on_progress=None, workers=PIPELINE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notes")
+        self._events = queue.Queue()
+        self._on_progress = on_progress
+        self.total = len(stages)
+        self.done = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, stage, fn, *args, **kwargs):
+        def run():
+            self._events.put((stage, "started"))
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._events.put((stage, "done"))
+        return self._pool.submit(run)
+
+    def skip(self, *stages):
+        for stage in stages:
+            self._events.put((stage, "skipped"))
+        self._drain()
+
+    def result(self, future):
+        while not future.done():
+            try:
+                self._emit(*self._events.get(timeout=0.05))
+            except queue.Empty:
+                pass
+        self._drain()
+        return future.result()
+
+    def _drain(self):
+        while True:
+            try:
+                self._emit(*self._events.get_nowait())
+            except queue.Empty:
+                return
+
+    def _emit(self, stage, state):
+        if state != "started":
+            self.done += 1
+        if self._on_progress:
+            self._on_progress(StageEvent(stage, state, self.done, self.total))
+
+def generate_hybrid_notes(pdf_path, audio_path=None, teacher_name="Default", use_cache=True,
+                          lecture_title="", chunked=None, model=None, on_progress=None):
     """
     Generates notes using the specific Teacher Persona.
+    The PDF and audio can be paths or in-memory files. A deck within the
+    prompt budget is sent whole (minus blank and near-duplicate slides);
+    longer decks (or ``chunked=True``) are generated map-reduce style so
+    every slide is covered: see ``modules.generator.map_reduce_notes``.
+    With ``chunked=False`` an over-budget deck is ranked against the lecture
+    title and persona vocabulary and the best slides packed into the budget.
+    Identical inputs (same file bytes, persona and prompt) return the cached
+    notes without a model call; ``use_cache=False`` forces regeneration.
+    ``model`` replaces the Gemini call (a callable taking the prompt parts).
+    Slide extraction and the audio upload run concurrently;
+    ``on_progress`` receives a ``StageEvent`` as each stage starts and ends.
     """
-    inputs = []
-    
-    # 0. LOAD TEACHER PERSONA
+    with Pipeline(NOTES_STAGES, on_progress) as pipeline:
+        return _generate_notes(pipeline, pdf_path, audio_path, teacher_name, use_cache,
+                               lecture_title, chunked, model)
+
+def generate_and_save_notes(pdf_path, audio_path, path_list, teacher_name="Default", use_cache=True,
+                            chunked=None, model=None, on_progress=None):
+    """The whole GENERATE NOTES flow: notes for the lecture at ``path_list``, saved to Drive.
+
+    The lecture's Drive folder is resolved alongside the generation stages,
+    so the final upload only has to send the file.
+    Returns (notes text, Drive file ID or None).
+    """
+    with Pipeline(NOTES_STAGES + ("drive", "upload"), on_progress) as pipeline:
+        folder = pipeline.submit("drive", _resolve_notes_folder, path_list)
+        text = _generate_notes(pipeline, pdf_path, audio_path, teacher_name, use_cache,
+                               " ".join(path_list), chunked, model)
+        if text.startswith("AI Error:"):
+            pipeline.skip("upload")
+            return text, None
+        pipeline.result(folder)
+        notes_id = pipeline.result(pipeline.submit("upload", save_generated_notes_to_drive, text, path_list))
+        return text, notes_id
+
+def _resolve_notes_folder(path_list):
+    try:
+        return resolve_folder(authenticate(), path_list)
+    except Exception as e:
+        print(f"Drive folder lookup failed: {e}")
+        return None
+
+def _generate_notes(pipeline, pdf_path, audio_path, teacher_name, use_cache, lecture_title,
+                    chunked, model):
+    model = model or _gemini
+
+    # 0. PERSONA + FINGERPRINTS (the notes cache is checked before any slow work)
+    profiles_future = pipeline.submit("persona", load_teacher_profiles)
+    digests = pipeline.submit("fingerprint", lambda: (
+        content_hash(pdf_path) if pdf_path else None,
+        content_hash(audio_path) if audio_path else None))
+    profiles = pipeline.result(profiles_future)
+    pdf_digest, audio_digest = pipeline.result(digests)
+    notes_key = notes_cache_key(pdf_digest, audio_digest,
+                                [teacher_name, profiles.get(teacher_name), lecture_title, chunked])
+    if use_cache:
+        cached = _cache("notes").get(notes_key)
+        if cached is not None:
+            print("⚡ Notes served from cache.")
+            pipeline.skip("slides", "audio", "generate")
+            return cached
+
+    # 1. Slides and audio upload overlap; the upload (and Gemini's processing) is usually the slowest
+    pages_future = pipeline.submit("slides", lambda: cached_slide_pages(
+        pdf_path, pdf_digest, use_cache=use_cache) if pdf_path else [])
+    audio_future = pipeline.submit("audio", lambda: cached_audio_upload(
+        audio_path, audio_digest, use_cache=use_cache) if audio_path else None)
+
     teacher_profile_text = ""
-    profiles = load_teacher_profiles()
-    
     if teacher_name in profiles:
         p_data = profiles[teacher_name]
         vocab_list = "\n".join([f"- Replace '{k}' with '{v}'" for k,v in p_data.get('vocabulary', {}).items()])
@@ -63,60 +390,42 @@ def generate_hybrid_notes(pdf_path, audio_path=None, teacher_name="Default"):
         """
         print(f"🎭 Applied Persona: {teacher_name}")
 
-    # 1. Add PDF Text
-    if pdf_path:
-        text = extract_text_from_pdf(pdf_path)
-        inputs.append(f"LECTURE SLIDES CONTENT:\n{text[:30000]}")
+    # 2. Slides: every distinct page, unless a single call was asked for and the deck
+    # is over the budget; then only the best-ranked pages that fit
+    pages = pipeline.result(pages_future)
+    fits = sum(len(page) for page in pages) <= PROMPT_CHAR_BUDGET
+    if chunked is None:
+        chunked = not fits
+    if chunked or fits:
+        pages = distinct_pages(pages)
+        if chunked:
+            print(f"📚 Chunked generation over {len(pages)} slides.")
+    else:
+        vocabulary = profiles.get(teacher_name, {}).get('vocabulary', {})
+        query = " ".join([lecture_title, *vocabulary.keys(), *vocabulary.values()])
+        pages = [select_slides(pages, query, PROMPT_CHAR_BUDGET)]
 
-    # 2. Add Audio
+    # 3. Audio
+    audio_inputs = []
     if audio_path:
-        audio_file = upload_audio_to_gemini(audio_path)
+        audio_file = pipeline.result(audio_future)
         if audio_file:
-            inputs.append(audio_file)
-            inputs.append("AUDIO RECORDING OF LECTURE (Hinglish).")
-
-    # 3. The Prompt
-    prompt = f"""
-    You are an expert Professor for Competitive Exams (GATE/UPSC).
-    Generate **Interactive Lecture Notes**.
-    
-    {teacher_profile_text}
-    
-    **CRITICAL RULE:** Output strict Markdown blocks.
-    
-    **STRUCTURE:**
-    # [Lecture Title]
-    
-    ## 🧠 Concept Block: Core Intuition
-    * **The 'Why':** Explain simply.
-    * **Teacher's Hint:** Capture any 'Desi' mnemonics from audio.
-    
-    ---
-    
-    ## 📝 Derivation Block: Formulas & Math
-    * Use LaTeX for math ($V_x$).
-    
-    ---
-    
-    ## 🔥 Exam Block: Critical Points
-    * **High Yield:** Mark "Important" points with 🔥.
-    * **Traps:** Mark mistakes with ⚠️.
-    
-    ---
-    
-    ## ⚡ Short Notes Block (Summary)
-    (5-line cheat sheet).
-    """
-    
-    inputs.append(prompt)
+            audio_inputs = [audio_file, "AUDIO RECORDING OF LECTURE (Hinglish)."]
+        else:
+            notes_key = None  # notes made without the audio must not be served for it later
 
+    # 4. Generate (one call unless the slides span several chunks)
     print("🧠 AI Thinking...")
+    chunk_chars = CHUNK_CHARS if chunked else PROMPT_CHAR_BUDGET
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(inputs)
-        return response.text
+        text = pipeline.result(pipeline.submit(
+            "generate", map_reduce_notes, pages, model, teacher_profile_text, audio_inputs,
+            chunk_chars=chunk_chars))
     except Exception as e:
         return f"AI Error: {str(e)}"
+    if notes_key:
+        _cache("notes").set(notes_key, text)
+    return text
 
 def learn_from_edits(original_text, edited_text):
     """
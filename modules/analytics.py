@@ -0,0 +1,135 @@
+import datetime
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from modules.data_manager import iter_children, iter_session_minutes
+from modules.retention import parse_session_day
+
+# CONSTANTS
+HEATMAP_WEEKS = 53
+ROLLING_WINDOW = 7  # days
+
+
+@dataclass
+class EventTable:
+    """Study minutes as parallel NumPy columns, one row per (day, node, material).
+
+    ``subject`` and ``material`` are indexes into ``subjects`` /
+    ``materials``. Several tables (e.g. a whole cohort) can be combined
+    with ``concat``.
+    """
+    day: np.ndarray = None
+    minutes: np.ndarray = None
+    subject: np.ndarray = None
+    material: np.ndarray = None
+    subjects: list = field(default_factory=list)
+    materials: list = field(default_factory=list)
+
+    @classmethod
+    def from_tree(cls, data: dict) -> "EventTable":
+        days, minutes, subjects, materials = [], [], [], []
+        material_index = {}
+        subject_names = []
+        for subject, node in iter_children(data):
+            s = len(subject_names)
+            subject_names.append(subject)
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                for date, material, mins in iter_session_minutes(current):
+                    day = parse_session_day(date)
+                    if day is None:
+                        continue
+                    days.append(day)
+                    minutes.append(mins)
+                    subjects.append(s)
+                    materials.append(material_index.setdefault(material, len(material_index)))
+                stack.extend(child for _, child in iter_children(current))
+        return cls(
+            day=np.array(days, dtype=np.int64),
+            minutes=np.array(minutes, dtype=float),
+            subject=np.array(subjects, dtype=np.int64),
+            material=np.array(materials, dtype=np.int64),
+            subjects=subject_names,
+            materials=list(material_index),
+        )
+
+    @classmethod
+    def concat(cls, tables: list) -> "EventTable":
+        """One table over several (students' or subjects') tables, names merged."""
+        subjects, materials = {}, {}
+        columns = {"day": [], "minutes": [], "subject": [], "material": []}
+        for table in tables:
+            s_map = np.array([subjects.setdefault(n, len(subjects)) for n in table.subjects], dtype=np.int64)
+            m_map = np.array([materials.setdefault(n, len(materials)) for n in table.materials], dtype=np.int64)
+            columns["day"].append(table.day)
+            columns["minutes"].append(table.minutes)
+            columns["subject"].append(s_map[table.subject])
+            columns["material"].append(m_map[table.material])
+        return cls(subjects=list(subjects), materials=list(materials),
+                   **{k: np.concatenate(v) for k, v in columns.items()})
+
+    def __len__(self):
+        return len(self.day)
+
+
+def daily_minutes(table: EventTable, start: int, end: int) -> np.ndarray:
+    """Minutes studied on each day ordinal in [start, end]."""
+    mask = (table.day >= start) & (table.day <= end)
+    return np.bincount(table.day[mask] - start, weights=table.minutes[mask],
+                       minlength=end - start + 1)
+
+
+def heatmap(table: EventTable, today=None, weeks=HEATMAP_WEEKS) -> np.ndarray:
+    """(7, weeks) grid of minutes, rows Monday..Sunday, last column this week."""
+    today = today or datetime.date.today()
+    end = today.toordinal() + (6 - today.weekday())  # this week's Sunday
+    start = end - 7 * weeks + 1  # a Monday
+    return daily_minutes(table, start, end).reshape(weeks, 7).T
+
+
+def streaks(table: EventTable, today=None) -> dict:
+    """Current and longest run of consecutive study days.
+
+    The current streak still counts if today has no session yet but
+    yesterday did.
+    """
+    days = np.unique(table.day[table.minutes > 0]) if len(table) else np.array([], dtype=np.int64)
+    if not len(days):
+        return {"current": 0, "longest": 0}
+    breaks = np.flatnonzero(np.diff(days) != 1)
+    run_starts = np.concatenate(([0], breaks + 1))
+    run_lengths = np.diff(np.concatenate((run_starts, [len(days)])))
+    today = (today or datetime.date.today()).toordinal()
+    current = int(run_lengths[-1]) if days[-1] >= today - 1 else 0
+    return {"current": current, "longest": int(run_lengths.max())}
+
+
+def breakdown(table: EventTable, by: str = "subject") -> dict:
+    """{subject or material: total minutes}, largest first."""
+    names = table.subjects if by == "subject" else table.materials
+    totals = np.bincount(getattr(table, by), weights=table.minutes, minlength=len(names))
+    order = np.argsort(-totals, kind="stable")
+    return {names[i]: float(totals[i]) for i in order if totals[i] > 0}
+
+
+def rolling_average(table: EventTable, today=None, days=90, window=ROLLING_WINDOW) -> np.ndarray:
+    """Trailing ``window``-day mean of daily minutes for each of the last ``days`` days."""
+    end = (today or datetime.date.today()).toordinal()
+    series = daily_minutes(table, end - days - window + 2, end)
+    return np.convolve(series, np.ones(window) / window, mode="valid")
+
+
+def summarize(data: dict, today=None) -> dict:
+    """Everything the analytics tab shows, computed from one pass over the tree."""
+    today = today or datetime.date.today()
+    table = EventTable.from_tree(data)
+    return {
+        "heatmap": heatmap(table, today),
+        "streaks": streaks(table, today),
+        "by_subject": breakdown(table, "subject"),
+        "by_material": breakdown(table, "material"),
+        "rolling": rolling_average(table, today),
+        "total_minutes": float(table.minutes.sum()),
+    }
@@ -1,99 +1,93 @@
 import streamlit as st
 import datetime
 from modules.tools import generate_formula_codex, render_mistake_notebook
+from modules.data_manager import LazyTree, fetch_all_nodes, load_subtree, iter_children, node_stats
+from modules.search_index import TrigramIndex, notes_index
+from modules.retention import brain_battery_scores
+from modules.scheduler import ReviewQueue
+from modules.analytics import summarize
 
-import math
-from typing import Optional, List, Dict, Any
+from typing import Dict, Any
 
 def calculate_brain_battery(data: Dict[str, Any]) -> int:
     """
     Calculates retention score using Spaced Repetition (Exponential Decay).
     Formula: R = exp(-t / S)
+    For a folder this is the mean over every lecture below it.
     """
-    history = data.get("revision_history", [])
-    
-    # Helper to parse dates
-    def _parse_date(item) -> Optional[datetime.date]:
-        if isinstance(item, dict):
-            ds = item.get("date")
-        else:
-            ds = item
-        if not isinstance(ds, str):
-            return None
-        try:
-            y, m, d = map(int, ds.split("-"))
-            return datetime.date(y, m, d)
-        except Exception:
-            return None
-
-    # 1. Extract valid dates
-    dates = [dt for dt in (_parse_date(x) for x in history) if dt is not None]
-    
-    if not dates:
-        return 0
+    return brain_battery_scores(data).get((), 0)
 
-    # 2. Determine Stability (S) based on count of revisions
-    n_revisions = len(dates)
-    last_rev = max(dates)
-    
-    if n_revisions == 1:
-        S = 1.0  # Weak memory
-    elif n_revisions == 2:
-        S = 3.0
-    elif n_revisions == 3:
-        S = 7.0
-    else:
-        # Strong memory: doubles each time (14, 28, 56...)
-        S = 7.0 * (2 ** (n_revisions - 3))
-        S = min(S, 365.0) # Cap at 1 year
-
-    # 3. Calculate Time Elapsed (t)
-    today = datetime.date.today()
-    t_days = (today - last_rev).days
-    
-    if t_days <= 0:
-        return 100
+def load_full_tree(full_data):
+    """Fetches every folder of a per-node ``LazyTree``, once.
 
-    # 4. Calculate Exponential Decay
-    # Formula: R = e^(-t/S)
-    retention = math.exp(-t_days / S)
-    
-    # Convert to 0-100 scale
-    score = int(round(retention * 100))
-    return max(0, min(score, 100))
-
-def search_database(data, query, path_prefix=[]):
-    """Recursive search."""
-    results = []
-    query = query.lower()
-    for key, val in data.items():
-        if key in ["type", "drive_ids", "tasks", "revision_history", "notes_date", "vocabulary"]: 
-            continue
-        
-        current_path = path_prefix + [key]
-        if query in key.lower():
-            item_type = val.get("type", "folder") if isinstance(val, dict) else "folder"
-            results.append((key, current_path, item_type))
-        if isinstance(val, dict):
-            results.extend(search_database(val, query, current_path))
-    return results
+    The brain battery, review queue and analytics need every lecture's
+    sessions, not just the folders opened so far. The nodes are read with
+    one Firestore query and the folders then attach from the local mirror;
+    while offline the dashboard works with what is loaded already.
+    """
+    if isinstance(full_data, LazyTree) and not full_data.fully_loaded and fetch_all_nodes():
+        load_subtree(full_data, [])
+        full_data.fully_loaded = True
+    return full_data
+
+def get_search_index(full_data):
+    """The session's trigram index, built on first use and then kept current.
+
+    In the per-node layout, folders fetched later are added as they load.
+    """
+    if "search_index" not in st.session_state:
+        index = TrigramIndex.build(full_data)
+        if isinstance(full_data, LazyTree):
+            full_data.on_attach.append(lambda path, node: index.add_subtree(node, path))
+        st.session_state.search_index = index
+    return st.session_state.search_index
+
+def get_review_queue(full_data):
+    """The session's review queue, built on first use and then kept current."""
+    if "review_queue" not in st.session_state:
+        st.session_state.review_queue = ReviewQueue.build(full_data)
+    return st.session_state.review_queue
+
+def get_analytics(full_data):
+    """Analytics for the tree, recomputed only after new sessions (or a new day)."""
+    totals = node_stats(full_data)
+    key = (totals["minutes"], totals["last_studied"], datetime.date.today())
+    if st.session_state.get("analytics_key") != key:
+        st.session_state.analytics = summarize(full_data)
+        st.session_state.analytics_key = key
+    return st.session_state.analytics
+
+def render_heatmap(grid):
+    """GitHub-style grid of study minutes (rows Mon..Sun, one column per week)."""
+    peak = grid.max() or 1
+    cells = []
+    for row in grid:
+        cells.append("".join(
+            f'<span title="{int(m)} min" style="display:inline-block;width:11px;height:11px;margin:1px;'
+            f'border-radius:2px;background:rgba(46,160,67,{0.1 + 0.9 * m / peak if m else 0.08:.2f})"></span>'
+            for m in row))
+    st.markdown('<div style="line-height:0">' + "<br>".join(cells) + "</div>", unsafe_allow_html=True)
+
+def search_database(data, query):
+    """Ranked substring / typo-tolerant search over folder and lecture names."""
+    return get_search_index(data).search(query)
 
 def render_dashboard(full_data):
     """Displays the Central Command Dashboard."""
+    load_full_tree(full_data)
     
     # TABS FOR ORGANIZATION
-    tab_overview, tab_tools, tab_syllabus = st.tabs(["🧠 OVERVIEW", "🛠️ POWER TOOLS", "📊 SYLLABUS"])
+    tab_overview, tab_tools, tab_syllabus, tab_analytics = st.tabs(
+        ["🧠 OVERVIEW", "🛠️ POWER TOOLS", "📊 SYLLABUS", "📈 ANALYTICS"])
 
     # --- TAB 1: OVERVIEW (Battery & Search) ---
     with tab_overview:
         st.markdown("### 🧠 Brain Battery")
         cols = st.columns(3)
         idx = 0
-        for subject in full_data.keys():
-            if subject in ["type", "revision_history", "drive_ids", "notes_date"]: 
-                continue
-                
-            health = calculate_brain_battery(full_data[subject])
+        battery = brain_battery_scores(full_data)  # every subject in one pass
+        for subject, _ in iter_children(full_data):
+            health = battery.get((subject,), 0)
             
             # Color Logic
             color = "green" if health > 75 else "orange" if health > 40 else "red"
@@ -104,6 +98,20 @@ def render_dashboard(full_data):
                 st.caption(f"Health: {health}%")
             idx += 1
             
+        st.markdown("---")
+        st.markdown("### 📅 Due for Review")
+        plan = get_review_queue(full_data).plan()
+        if plan:
+            for path, overdue in plan:
+                c1, c2 = st.columns([4, 1])
+                label = "due today" if overdue == 0 else f"{overdue} day{'s' if overdue > 1 else ''} overdue"
+                c1.write(f"**{path[-1]}** ({' > '.join(path)}) · {label}")
+                if c2.button("Go", key=f"review_{'/'.join(path)}"):
+                    st.session_state.path = path
+                    st.rerun()
+        else:
+            st.success("Nothing due today. 🎉")
+
         st.markdown("---")
         st.markdown("### 🔍 Global Search")
         search_query = st.text_input("Search Library...", placeholder="Topic, Lecture name...")
@@ -119,6 +127,17 @@ def render_dashboard(full_data):
             else: 
                 st.warning("No matches.")
 
+            hits = notes_index().search(search_query)
+            if hits:
+                st.markdown("#### 📝 In your notes")
+                for hit in hits:
+                    c1, c2 = st.columns([4, 1])
+                    c1.markdown(f"**{hit['path'][-1]}** ({' > '.join(hit['path'])})")
+                    c1.caption(hit["snippet"])
+                    if c2.button("Go", key=f"jump_notes_{hit['notes_id']}"):
+                        st.session_state.path = hit["path"]
+                        st.rerun()
+
     # --- TAB 2: POWER TOOLS (Codex & Mistakes) ---
     with tab_tools:
         c_tool1, c_tool2 = st.columns(2)
@@ -128,12 +147,13 @@ def render_dashboard(full_data):
             st.caption("Compiles all LaTeX $$ formulas from a subject into one sheet.")
             
             # Dropdown to pick subject
-            subjects = [k for k in full_data.keys() if k not in ["type", "revision_history", "drive_ids", "notes_date"]]
+            subjects = [name for name, _ in iter_children(full_data)]
             target_sub = st.selectbox("Select Subject", subjects)
             
             if st.button(f"Generate {target_sub} Codex"):
                 with st.spinner("Scanning all cloud notes... (This might take a moment)"):
-                    report = generate_formula_codex(target_sub, full_data[target_sub])
+                    subject_data = load_subtree(full_data, [target_sub])
+                    report = generate_formula_codex(target_sub, subject_data)
                     if report:
                         st.success("Codex Generated!")
                         st.download_button("📥 Download PDF/MD", report, f"{target_sub}_Codex.md")
@@ -147,37 +167,16 @@ def render_dashboard(full_data):
     with tab_syllabus:
         st.markdown("### 🏆 Syllabus Completion")
         
-        # 1. Calculate Progress Recursively
-        def get_progress(data):
-            total_tasks = 0
-            completed_tasks = 0
-            
-            if isinstance(data, dict):
-                # Check for tasks list in this item
-                if "tasks" in data:
-                    for t in data["tasks"]:
-                        total_tasks += 1
-                        # Assuming format "- [x] Task" for completed
-                        if "- [x]" in t or "- [X]" in t:
-                            completed_tasks += 1
-                            
-                # Recurse
-                for k, v in data.items():
-                    if isinstance(v, dict):
-                        t, c = get_progress(v)
-                        total_tasks += t
-                        completed_tasks += c
-            
-            return total_tasks, completed_tasks
+        # Totals are maintained on each folder ("stats"), so this is a read, not a walk
+        totals = node_stats(full_data)
+        m1, m2, m3 = st.columns(3)
+        m1.metric("⏱️ Study Hours", f"{totals['minutes'] / 60:.1f}")
+        m2.metric("🎓 Lectures", totals["lectures"])
+        m3.metric("📅 Last Studied", totals["last_studied"] or "—")
 
-        # 2. Render Bars for Top-Level Subjects
-        for subject in full_data.keys():
-            # Skip metadata keys
-            if subject in ["type", "revision_history", "drive_ids", "notes_date"]: 
-                continue
-            
-            # Get the numbers
-            tot, com = get_progress(full_data[subject])
+        for subject, node in iter_children(full_data):
+            stats = node.get("stats") or node_stats(node)
+            tot, com = stats["tasks"], stats["tasks_done"]
             
             # Display
             if tot > 0:
@@ -186,4 +185,30 @@ def render_dashboard(full_data):
                 st.progress(percent)
             else:
                 st.write(f"**{subject}** (No checklists found)")
-                st.caption("Add checklists inside lectures to track this.")
\ No newline at end of file
+                st.caption("Add checklists inside lectures to track this.")
+
+    # --- TAB 4: ANALYTICS (Heatmap, Streaks, Breakdowns) ---
+    with tab_analytics:
+        stats = get_analytics(full_data)
+        if not stats["total_minutes"]:
+            st.info("Log a study session to see your analytics.")
+            return
+
+        a1, a2, a3 = st.columns(3)
+        a1.metric("🔥 Current Streak", f"{stats['streaks']['current']} days")
+        a2.metric("🏅 Longest Streak", f"{stats['streaks']['longest']} days")
+        a3.metric("📈 7-Day Average", f"{stats['rolling'][-1]:.0f} min/day")
+
+        st.markdown("#### 🗓️ Study Heatmap (last year)")
+        render_heatmap(stats["heatmap"])
+
+        st.markdown("#### 📉 Daily Minutes (7-day rolling average)")
+        st.line_chart(stats["rolling"])
+
+        b1, b2 = st.columns(2)
+        with b1:
+            st.markdown("#### 📚 By Subject")
+            st.bar_chart({"minutes": stats["by_subject"]})
+        with b2:
+            st.markdown("#### 🧾 By Material")
+            st.bar_chart({"minutes": stats["by_material"]})
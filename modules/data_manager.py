@@ -1,30 +1,66 @@
+import atexit
+import copy
+import hashlib
 import json
 import os
-import shutil
-import io
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from functools import lru_cache
-from datetime import datetime  # <--- MAKE SURE YOU ADD THIS IMPORT
+from datetime import datetime, timedelta  # <--- MAKE SURE YOU ADD THIS IMPORT
 
 import streamlit as st
-from google.api_core.exceptions import GoogleAPIError
+from google.api_core.exceptions import GoogleAPIError, NotFound
 from google.cloud import firestore
-from modules.drive_sync import upload_to_drive, authenticate, delete_file_from_drive
-from googleapiclient.http import MediaIoBaseDownload
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from modules.storage import LocalMirror, MirrorReplicator, RevisionLog, NODE_MIRROR_DB_FILE
+from modules.drive_sync import (
+    upload_bytes_to_drive, delete_file_from_drive, file_cache, read_file_cached,
+    get_file_md5
+)
 
-TEMP_DIR = "temp_staging"
+NOTES_FILE_NAME = "generated_notes.md"
 
 TEACHER_DB_FILE = "teacher_profiles.json"
 USER_STATS_FILE = "user_stats.json"
 
+# Firestore allows 500 writes and 10 MiB per batch; stay under both.
+MAX_BATCH_WRITES = 500
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+COMMIT_WORKERS = 4
+COMMIT_RETRIES = 3
+COMMIT_BACKOFF = 0.5  # seconds, doubled on each retry
+
+# Keys that hold a node's own data rather than a child folder/lecture.
+NODE_FIELDS = {
+    "type", "drive_ids", "tasks", "revision_history", "notes_date", "stats",
+    "revision_daily", "revision_weekly",
+    "confidence", "flashcards", "vocabulary",
+}
+ROOT_ID = "root"
+DAILY_ROLLUP_DAYS = 371  # newer sessions are rolled up per day (a year's heatmap), older ones per week
+WEEKLY_ROLLUP_WEEKS = 104  # weekly buckets kept before folding into the oldest one
+HISTORY_PAGE_SIZE = 20
+HISTORY_FETCH_TIMEOUT = 3.0  # seconds; the history tab must not hang while offline
+REVISIONS_COLLECTION = "revisions"  # revisions/{node id}/sessions/{session id}
+_MINUTES = re.compile(r"(\d+(?:\.\d+)?)\s*m")
+
 class DataRepository:
     """Repository abstraction for user data stored in Firestore.
 
     Consumers call these methods without needing to know the storage backend.
+    The repository remembers the last state it read from or wrote to Firestore
+    so that ``save_all`` only sends the fields that actually changed.
     """
 
-    def __init__(self, collection_name: str = "users") -> None:
-        self._client = _cached_firestore_client()
+    def __init__(self, collection_name: str = "users", client=None) -> None:
+        self._client = client or _cached_firestore_client()
         self._collection = self._client.collection(collection_name)
+        # {doc_id: payload} as last seen in Firestore (None = never synced)
+        self._synced: dict | None = None
 
     def get_all(self) -> dict:
         """Return all user documents as a dict of {doc_id: data}.
@@ -32,18 +68,50 @@ class DataRepository:
         Fail-safe to an empty dict on errors.
         """
         try:
-            docs = self._collection.stream()
+            versions = self.get_versions()
         except GoogleAPIError as e:
             print(f"Could not load data from Firestore: {e}")
             return {}
         except Exception as e:
             print(f"Unexpected error loading Firestore data: {e}")
             return {}
+        return {doc_id: payload for doc_id, (payload, _) in versions.items()}
 
-        data: dict = {}
-        for doc in docs:
-            data[doc.id] = doc.to_dict() or {}
-        return data
+    def get_versions(self) -> dict:
+        """Return {doc_id: (data, update_time)} for every document.
+
+        Unlike ``get_all`` this raises on errors, so callers such as the
+        local mirror can tell "unreachable" apart from "empty".
+        """
+        versions: dict = {}
+        for doc in self._collection.stream():
+            versions[doc.id] = (doc.to_dict() or {}, getattr(doc, "update_time", None))
+        self._synced = {doc_id: copy.deepcopy(payload) for doc_id, (payload, _) in versions.items()}
+        return versions
+
+    def watch(self, on_change):
+        """Listens for remote changes with a Firestore snapshot listener.
+
+        Calls ``on_change(changed, removed)`` with {doc_id: (data,
+        update_time)} and a list of deleted ids. Returns the watch handle
+        (call ``unsubscribe()`` to stop).
+        """
+        def _handle(_docs, changes, read_time):
+            if self._synced is None:
+                self._synced = {}
+            changed, removed = {}, []
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    removed.append(doc.id)
+                    self._synced.pop(doc.id, None)
+                    continue
+                payload = doc.to_dict() or {}
+                changed[doc.id] = (payload, getattr(doc, "update_time", None) or read_time)
+                self._synced[doc.id] = copy.deepcopy(payload)
+            on_change(changed, removed)
+
+        return self._collection.on_snapshot(_handle)
 
     def get_student_data(self, student_id: str) -> dict:
         """Return a single student's document by id, or {} if missing."""
@@ -65,44 +133,331 @@ class DataRepository:
             self._collection.document(str(student_id)).set(payload or {})
         except GoogleAPIError as e:
             print(f"Could not save student '{student_id}' to Firestore: {e}")
+            return
         except Exception as e:
             print(f"Unexpected error saving student '{student_id}': {e}")
+            return
+        if self._synced is not None:
+            self._synced[str(student_id)] = copy.deepcopy(payload or {})
 
-    def save_all(self, data: dict) -> None:
-        """Batch-write all docs from a dict and remove stale ones.
+    def save_all(self, data: dict) -> "SaveResult":
+        """Write only what changed since the last sync and remove stale docs.
 
         Input shape: {doc_id: payload_dict}
+
+        Documents Firestore has not seen yet are written with ``set()``;
+        known documents get a field-level ``update()`` containing just the
+        changed paths. Stale ids come from the last synced state, so no
+        collection scan is needed once the data has been loaded.
+
+        Writes are split into batches under Firestore's limits and the
+        batches are committed in parallel. Returns a ``SaveResult``.
         """
         if not isinstance(data, dict):
             raise ValueError("save_all expects a dictionary payload.")
 
-        try:
-            existing_ids = {doc.id for doc in self._collection.stream()}
-        except GoogleAPIError as e:
-            print(f"Could not retrieve existing Firestore documents: {e}")
-            existing_ids = set()
-        except Exception as e:
-            print(f"Unexpected error while reading Firestore documents: {e}")
-            existing_ids = set()
+        if self._synced is None:
+            # Never loaded through this repository: fall back to one scan.
+            try:
+                self._synced = {doc.id: None for doc in self._collection.stream()}
+            except GoogleAPIError as e:
+                print(f"Could not retrieve existing Firestore documents: {e}")
+                self._synced = {}
+            except Exception as e:
+                print(f"Unexpected error while reading Firestore documents: {e}")
+                self._synced = {}
 
-        incoming_ids = {str(key) for key in data.keys()}
-        batch = self._client.batch()
+        incoming = {str(key): payload or {} for key, payload in data.items()}
+        return self.save_documents(incoming, set(self._synced) - set(incoming))
+
+    def save_documents(self, docs: dict, deleted_ids=()) -> "SaveResult":
+        """Write the given documents and delete ``deleted_ids``.
+
+        Other documents in the collection are left alone, which lets callers
+        push a partial set of changes.
+        """
+        if self._synced is None:
+            self._synced = {}
+        incoming = {str(key): payload or {} for key, payload in docs.items()}
+        result = SaveResult()
+        ops = []
 
         # Upserts
-        for doc_id, payload in data.items():
-            doc_ref = self._collection.document(str(doc_id))
-            batch.set(doc_ref, payload or {})
+        for doc_id, payload in incoming.items():
+            previous = self._synced.get(doc_id)
+            if previous is None:
+                ops.append(("set", doc_id, payload))
+                continue
+            changes = diff_fields(previous, payload)
+            if changes:
+                ops.append(("update", doc_id, changes))
+            else:
+                result.skipped.append(doc_id)
 
         # Deletes for stale docs
-        for stale_id in existing_ids - incoming_ids:
-            batch.delete(self._collection.document(stale_id))
+        for stale_id in deleted_ids:
+            ops.append(("delete", str(stale_id), None))
+
+        if not ops:
+            return result
+
+        chunks = _chunk_writes(ops)
+        with ThreadPoolExecutor(max_workers=min(COMMIT_WORKERS, len(chunks))) as pool:
+            futures = [pool.submit(self._commit_ops, chunk, incoming) for chunk in chunks]
+            for future in as_completed(futures):
+                for (kind, doc_id, _), error, write_result in future.result():
+                    if error is not None:
+                        result.failed[doc_id] = error
+                        continue
+                    result.written.append(doc_id)
+                    if write_result is not None:
+                        result.versions[doc_id] = getattr(write_result, "update_time", None)
+                    if kind == "delete":
+                        self._synced.pop(doc_id, None)
+                    else:
+                        self._synced[doc_id] = copy.deepcopy(incoming[doc_id])
+
+        if result.failed:
+            print(f"Could not save {len(result.failed)} document(s) to Firestore.")
+        return result
+
+    def _commit_ops(self, chunk: list, incoming: dict) -> list:
+        """Commits one chunk; returns [(op, error or None, write result or None)].
+
+        If the batch keeps failing, its writes are retried one at a time so a
+        single bad write cannot hold back the rest of the chunk. An
+        ``update()`` of a document deleted elsewhere is re-sent as a ``set()``
+        of the full payload.
+        """
+        error, write_results, missing = self._commit_chunk(chunk)
+        if error is None:
+            return [(op, None, write_results[i] if i < len(write_results) else None)
+                    for i, op in enumerate(chunk)]
+        if len(chunk) > 1:
+            return [outcome for op in chunk for outcome in self._commit_ops([op], incoming)]
+        kind, doc_id, _ = chunk[0]
+        if missing and kind == "update":
+            self._synced.pop(doc_id, None)
+            op = ("set", doc_id, incoming[doc_id])
+            error, write_results, _ = self._commit_chunk([op])
+            return [(op, error, write_results[0] if write_results else None)]
+        return [(chunk[0], error, None)]
+
+    def _commit_chunk(self, chunk: list) -> tuple:
+        """Commits one batch, retrying with backoff.
+
+        Returns (error or None, write results from Firestore, whether the
+        batch failed because a document to update does not exist).
+        """
+        error = None
+        for attempt in range(COMMIT_RETRIES):
+            batch = self._client.batch()
+            for kind, doc_id, payload in chunk:
+                doc_ref = self._collection.document(doc_id)
+                if kind == "set":
+                    batch.set(doc_ref, payload)
+                elif kind == "update":
+                    batch.update(doc_ref, payload)
+                else:
+                    batch.delete(doc_ref)
+            try:
+                return None, list(batch.commit() or []), False
+            except NotFound as e:
+                return f"Firestore error: {e}", [], True  # retrying the same batch cannot help
+            except GoogleAPIError as e:
+                error = f"Firestore error: {e}"
+            except Exception as e:
+                error = f"Unexpected error committing Firestore batch: {e}"
+            if attempt + 1 < COMMIT_RETRIES:
+                time.sleep(COMMIT_BACKOFF * (2 ** attempt))
+        return error, [], False
+
+
+@dataclass
+class SaveResult:
+    """Outcome of ``DataRepository.save_all`` per document id."""
+
+    written: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)  # {doc_id: error message}
+    versions: dict = field(default_factory=dict)  # {doc_id: update_time}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+def _chunk_writes(ops: list) -> list:
+    """Splits write ops into batches under the op-count and size limits."""
+    chunks, current, current_bytes = [], [], 0
+    for op in ops:
+        size = len(json.dumps(op[2], default=str)) if op[2] is not None else 0
+        if current and (len(current) >= MAX_BATCH_WRITES or current_bytes + size > MAX_BATCH_BYTES):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(op)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NodeRepository(DataRepository):
+    """Per-node layout: every folder and lecture is its own document.
+
+    Documents live in the ``nodes`` collection, keyed by ``node_id(path)``:
+    {"name", "path", "parent": parent node id, "fields": {...}}. Children
+    are found through the ``parent`` reference, so a folder can be loaded
+    without its siblings or subtrees.
+    """
+
+    def __init__(self, collection_name: str = "nodes", client=None) -> None:
+        super().__init__(collection_name, client)
+
+    def get_children_versions(self, parent_id: str) -> dict:
+        """Return {doc_id: (data, update_time)} for the children of one node."""
+        query = self._collection.where(filter=FieldFilter("parent", "==", parent_id))
+        versions: dict = {}
+        for doc in query.stream():
+            versions[doc.id] = (doc.to_dict() or {}, getattr(doc, "update_time", None))
+        if self._synced is None:
+            self._synced = {}
+        for doc_id, (payload, _) in versions.items():
+            self._synced[doc_id] = copy.deepcopy(payload)
+        return versions
+
+
+class SessionRepository:
+    """Study sessions in Firestore, one subcollection per node.
+
+    Every session is its own document under ``revisions/{node id}/sessions``,
+    so the history is shared by all devices while the node documents only
+    carry roll-ups. Pages are read newest first by the session's ``date``.
+    """
+
+    def __init__(self, collection_name: str = REVISIONS_COLLECTION, client=None) -> None:
+        self._client = client or _cached_firestore_client()
+        self._collection = self._client.collection(collection_name)
+
+    def _sessions(self, nid: str):
+        return self._collection.document(nid).collection("sessions")
+
+    def save_sessions(self, sessions: list) -> None:
+        """Writes [(node id, session id, entry)] in one batch. Raises on errors.
+
+        Session ids make the write idempotent, so a retried upload does
+        not duplicate sessions.
+        """
+        batch = self._client.batch()
+        for nid, session_id, entry in sessions:
+            batch.set(self._sessions(nid).document(session_id), entry)
+        batch.commit()
+
+    def get_page(self, nid: str, offset: int, limit: int, timeout: float | None = None) -> list:
+        """One page of sessions, newest first. With ``timeout`` the read is not retried."""
+        query = (self._sessions(nid)
+                 .order_by("date", direction=firestore.Query.DESCENDING)
+                 .offset(offset).limit(limit))
+        if timeout is None:
+            return [doc.to_dict() or {} for doc in query.stream()]
+        return [doc.to_dict() or {} for doc in query.stream(retry=None, timeout=timeout)]
+
+
+class SyncedTree(dict):
+    """Study tree read from the local mirror by one session.
+
+    ``base`` maps each document id to (fingerprint, remote_ts) of the copy
+    the session loaded. A save writes only the documents whose content
+    moved away from that copy and deletes only ids the session held, so
+    a session never overwrites changes it has not seen. ``version`` is the
+    mirror version the tree has caught up with (see ``refresh_data``).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.base = {}
+        self.version = 0
+
+
+class LazyTree(SyncedTree):
+    """Study tree whose folders are fetched on demand (per-node layout).
+
+    ``loaded`` holds the ids of the nodes whose children are present;
+    ``fully_loaded`` is set once every folder has been fetched. Callables
+    in ``on_attach`` are called with (path, node) whenever a folder's
+    children are attached, e.g. to keep a search index current.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.loaded = set()
+        self.fully_loaded = False
+        self.on_attach = []
+
+
+def iter_children(node: dict):
+    """Yields (name, child) for the folders/lectures directly under ``node``."""
+    for key, val in node.items():
+        if key not in NODE_FIELDS and isinstance(val, dict):
+            yield key, val
+
+
+def node_id(path) -> str:
+    """Stable document id for the node at ``path`` (Firestore ids can't hold '/')."""
+    if not path:
+        return ROOT_ID
+    return hashlib.sha1("\x1f".join(path).encode("utf-8")).hexdigest()
+
+
+def node_document(path, node: dict) -> dict:
+    """Per-node document for ``node``, without its children."""
+    return {
+        "name": path[-1],
+        "path": list(path),
+        "parent": node_id(path[:-1]),
+        "fields": {k: v for k, v in node.items() if k in NODE_FIELDS or not isinstance(v, dict)},
+    }
+
+
+def explode_tree(node: dict, path: tuple = ()) -> dict:
+    """Returns {node_id: document} for every node below ``path``."""
+    docs: dict = {}
+    for name, child in iter_children(node):
+        child_path = path + (name,)
+        docs[node_id(child_path)] = node_document(child_path, child)
+        docs.update(explode_tree(child, child_path))
+    return docs
+
+
+def fingerprint(payload) -> str:
+    """Content hash of a document, independent of key order."""
+    encoded = json.dumps(payload or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def diff_fields(old: dict, new: dict, prefix: tuple = ()) -> dict:
+    """Returns the Firestore field updates that turn ``old`` into ``new``.
+
+    Nested maps are compared key by key; any other value (lists included)
+    is replaced as a whole. Keys are quoted with ``FieldPath`` because
+    folder names contain spaces, colons and other special characters.
+    Removed keys map to ``DELETE_FIELD``.
+    """
+    changes: dict = {}
+    for key, value in new.items():
+        path = prefix + (str(key),)
+        if key not in old:
+            changes[FieldPath(*path).to_api_repr()] = value
+            continue
+        before = old[key]
+        if isinstance(before, dict) and isinstance(value, dict) and before:
+            changes.update(diff_fields(before, value, path))
+        elif before != value:
+            changes[FieldPath(*path).to_api_repr()] = value
+    for key in old.keys() - new.keys():
+        changes[FieldPath(*(prefix + (str(key),))).to_api_repr()] = firestore.DELETE_FIELD
+    return changes
 
-        try:
-            batch.commit()
-        except GoogleAPIError as e:
-            print(f"Could not save data to Firestore: {e}")
-        except Exception as e:
-            print(f"Unexpected error committing Firestore batch: {e}")
 
 def _get_firestore_client():
     """Returns a cached Firestore client configured via Streamlit secrets."""
@@ -122,98 +477,578 @@ def _cached_firestore_client():
     return _get_firestore_client()
 
 
+def _storage_layout():
+    """'documents' (one document per exam) or 'nodes' (one per folder/lecture)."""
+    try:
+        return st.secrets.get("storage_layout", "documents")
+    except Exception:
+        return "documents"
+
+
+@lru_cache(maxsize=1)
+def _default_repository():
+    """Shared repository so the synced state survives between calls."""
+    if _storage_layout() == "nodes":
+        return NodeRepository()
+    return DataRepository()
+
+
+@lru_cache(maxsize=1)
+def _default_mirror():
+    """Opens the local mirror and starts its Firestore replicator (once per process)."""
+    if _storage_layout() == "nodes":
+        mirror = LocalMirror(NODE_MIRROR_DB_FILE, parent_key="parent")
+    else:
+        mirror = LocalMirror()
+    try:
+        replicator = MirrorReplicator(mirror, _default_repository())
+    except Exception as e:
+        print(f"Firestore unavailable, running from local mirror only: {e}")
+        return mirror, None
+    if mirror.is_empty() and not mirror.scoped:
+        # First run on this machine: seed the mirror before serving reads.
+        replicator.pull()
+    # Pushes local writes and logged sessions; remote changes arrive via a snapshot listener.
+    replicator.add_outbox(flush_sessions)
+    replicator.start()
+    return mirror, replicator
+
+
 def load_data():
-    """Backward-compatible loader: delegates to DataRepository.get_all()."""
-    return DataRepository().get_all()
+    """Loads the study tree from the local mirror (kept in sync with Firestore).
+
+    In the per-node layout only the top-level nodes are loaded; deeper
+    folders are filled in by ``load_children`` as they are browsed.
+    """
+    mirror, _ = _default_mirror()
+    if not mirror.scoped:
+        tree = SyncedTree()
+        tree.version = mirror.version
+        for doc_id, (payload, remote_ts) in mirror.snapshot().items():
+            tree[doc_id] = payload
+            tree.base[doc_id] = (fingerprint(payload), remote_ts)
+        if ensure_stats(tree):  # trees saved before roll-up stats existed
+            save_data(tree)
+        return tree
+    tree = LazyTree()
+    tree.version = mirror.version
+    load_children(tree, [])
+    return tree
 
 
-def save_data(data):
-    """Backward-compatible saver: delegates to DataRepository.save_all()."""
-    return DataRepository().save_all(data)
-
-def clean_temp_folder():
-    """Wipes the temp folder to ensure 0 storage usage on D:"""
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-    os.makedirs(TEMP_DIR, exist_ok=True)
-
-def save_temp_file(file_obj):
-    """Saves a file TEMPORARILY to D: for uploading."""
-    clean_temp_folder()
-    
-    file_path = os.path.join(TEMP_DIR, file_obj.name)
-    with open(file_path, "wb") as f:
-        f.write(file_obj.getbuffer())
-        
-    return file_path, file_obj.name
+def refresh_data(data):
+    """Catches the session's tree up with remote changes that reached the mirror.
 
-def upload_and_delete(local_path, path_list):
+    Documents the session has not edited are replaced by the mirror's
+    copy (or dropped, or added when their folder is loaded); edited ones
+    are kept and resolved when saved. Cheap when nothing moved, so call
+    it on every rerun. Returns the ids that were refreshed.
     """
-    1. Uploads to Drive.
-    2. Deletes local file.
-    3. Returns Drive ID.
+    if not isinstance(data, SyncedTree):
+        return []
+    mirror, _ = _default_mirror()
+    if mirror.version == data.version:
+        return []
+    data.version, changes = mirror.changes_since(data.version)
+    if isinstance(data, LazyTree):
+        return _refresh_nodes(data, changes)
+    refreshed = []
+    for doc_id, (payload, remote_ts) in changes.items():
+        if not _untouched(data.base.get(doc_id), data.get(doc_id)):
+            continue
+        if payload is None:
+            data.pop(doc_id, None)
+            data.base.pop(doc_id, None)
+        else:
+            data[doc_id] = payload
+            data.base[doc_id] = (fingerprint(payload), remote_ts)
+        refreshed.append(doc_id)
+    return refreshed
+
+
+def _untouched(base, current) -> bool:
+    """True if the session still holds its base copy of a document (or never had it)."""
+    if base is None:
+        return current is None
+    return current is not None and fingerprint(current) == base[0]
+
+
+def _refresh_nodes(tree, changes):
+    nodes = {node_id(path): (path, node) for path, node in _walk(tree)}
+    nodes[ROOT_ID] = ((), tree)
+    refreshed = []
+    for doc_id, (doc, remote_ts) in changes.items():
+        path, node = nodes.get(doc_id, (None, None))
+        base = tree.base.get(doc_id)
+        if not _untouched(base, node_document(path, node) if node is not None else None):
+            continue
+        if doc is None:
+            if node is None:
+                continue
+            nodes.get(node_id(path[:-1]), ((), {}))[1].pop(path[-1], None)
+            for removed in [doc_id, *explode_tree(node, path)]:
+                tree.base.pop(removed, None)
+        else:
+            digest = fingerprint(doc)
+            if base is not None and base[0] == digest:
+                continue
+            if node is None:
+                if doc["parent"] not in tree.loaded or doc["parent"] not in nodes:
+                    continue  # its folder is fetched when opened
+                parent = nodes[doc["parent"]][1]
+                nodes[doc_id] = (tuple(doc["path"]), parent.setdefault(doc["name"], {}))
+                node = nodes[doc_id][1]
+            for key in [k for k, v in node.items() if k in NODE_FIELDS or not isinstance(v, dict)]:
+                del node[key]
+            node.update(copy.deepcopy(doc.get("fields", {})))
+            tree.base[doc_id] = (digest, remote_ts)
+        refreshed.append(doc_id)
+    return refreshed
+
+
+def _walk(node, path=()):
+    """Yields (path, node) for every node below ``path``."""
+    for name, child in iter_children(node):
+        child_path = path + (name,)
+        yield child_path, child
+        yield from _walk(child, child_path)
+
+
+def load_children(data, path_list):
+    """Returns the node at ``path_list``, fetching any folders on the way.
+
+    A no-op walk for fully loaded trees. For a ``LazyTree`` each folder's
+    children come from the local mirror, which asks Firestore for just that
+    folder the first time it is opened.
     """
+    current = data
+    for depth in range(len(path_list) + 1):
+        if isinstance(data, LazyTree):
+            _attach_children(data, current, path_list[:depth])
+        if depth == len(path_list):
+            break
+        current = current.get(path_list[depth], {})
+    return current
+
+
+def open_folder(data, path_list):
+    """``load_children`` for the folder on screen.
+
+    In the per-node layout the replicator then re-reads that folder on its
+    next round, so edits from other devices show up while it is browsed.
+    """
+    node = load_children(data, path_list)
+    _, replicator = _default_mirror()
+    if isinstance(data, LazyTree) and replicator is not None:
+        replicator.focus(node_id(path_list))
+    return node
+
+
+def fetch_all_nodes() -> bool:
+    """Brings every node into the local mirror with one Firestore read.
+
+    Call before walking a whole ``LazyTree``, so its folders attach from
+    the mirror instead of being queried one by one. False when Firestore
+    could not be reached.
+    """
+    mirror, replicator = _default_mirror()
+    if not mirror.scoped:
+        return True
+    return replicator is not None and replicator.fetch_all()
+
+
+def load_subtree(data, path_list):
+    """Like ``load_children`` but fetches every folder below the node too."""
+    node = load_children(data, path_list)
+    for name, _ in list(iter_children(node)):
+        load_subtree(data, list(path_list) + [name])
+    return node
+
+
+def notes_version(file_id):
+    """Current MD5 of a notes file on Drive, or None if it can't be read."""
     try:
-        drive_id = upload_to_drive(local_path, path_list)
-        if os.path.exists(local_path):
-            os.remove(local_path)
-        return drive_id
+        return get_file_md5(file_id)
     except Exception as e:
-        print(f"Error in process-and-flush: {e}")
+        print(f"Error checking notes version: {e}")
         return None
 
+
+def _attach_children(tree, node, path):
+    parent_id = node_id(path)
+    if parent_id in tree.loaded:
+        return
+    mirror, replicator = _default_mirror()
+    if not mirror.is_loaded(parent_id) and replicator is not None:
+        replicator.fetch_children(parent_id)
+    for doc_id, (doc, remote_ts) in mirror.snapshot(parent_id).items():
+        node.setdefault(doc["name"], copy.deepcopy(doc.get("fields", {})))
+        tree.base.setdefault(doc_id, (fingerprint(doc), remote_ts))
+    tree.loaded.add(parent_id)
+    for callback in tree.on_attach:
+        callback(path, node)
+
+
+def _tree_changes(tree, mirror):
+    """Documents to write and ids to delete for a ``SyncedTree`` save.
+
+    Only documents that differ from the session's base copy are written.
+    Only ids the session held and then removed are deleted (in the
+    per-node layout with everything below them); documents that reached
+    the mirror later, from another session or device, are left alone.
+    """
+    if isinstance(tree, LazyTree):
+        docs = explode_tree(tree)
+    else:
+        docs = {str(doc_id): payload or {} for doc_id, payload in tree.items()}
+    changed = {}
+    for doc_id, doc in docs.items():
+        digest = fingerprint(doc)
+        if tree.base.get(doc_id, (None, None))[0] != digest:
+            changed[doc_id] = (doc, digest)
+    deleted = []
+    for doc_id in tree.base.keys() - docs.keys():
+        deleted.extend(mirror.subtree_ids(doc_id) if isinstance(tree, LazyTree) else [doc_id])
+    return changed, deleted
+
+
+def save_data(data):
+    """Writes the study tree to the local mirror; Firestore is updated in the background.
+
+    Saves made within ``COALESCE_WINDOW`` of each other reach Firestore as
+    a single commit. Use ``flush_data()`` when the write must land now.
+    """
+    mirror, replicator = _default_mirror()
+    if isinstance(data, SyncedTree):
+        changed_docs, deleted = _tree_changes(data, mirror)
+        base = {doc_id: data.base[doc_id][1]
+                for doc_id in [*changed_docs, *deleted] if doc_id in data.base}
+        changed = mirror.write_documents(
+            {doc_id: doc for doc_id, (doc, _) in changed_docs.items()}, deleted, base)
+        for doc_id, (_, digest) in changed_docs.items():
+            data.base[doc_id] = (digest, base.get(doc_id))
+        for doc_id in deleted:
+            data.base.pop(doc_id, None)
+    else:
+        changed = mirror.write_tree(data)
+    if changed and replicator is not None:
+        replicator.notify()
+    return changed
+
+
+def flush_data():
+    """Pushes unsynced saves to Firestore now. Returns True when nothing is pending."""
+    _, replicator = _default_mirror()
+    return replicator.flush() if replicator is not None else False
+
+
+def sync_metrics():
+    """Queue depth and push latency of the background Firestore sync."""
+    mirror, replicator = _default_mirror()
+    if replicator is None:
+        return {"queue_depth": mirror.pending_count()}
+    return replicator.metrics()
+
+
+def _flush_at_exit():
+    if _default_mirror.cache_info().currsize:
+        flush_data()
+
+
+atexit.register(_flush_at_exit)
+
+
+def migrate_to_node_layout():
+    """Copies the per-exam documents into the per-node ``nodes`` collection."""
+    data = DataRepository().get_all()
+    ensure_stats(data)
+    return NodeRepository().save_documents(explode_tree(data))
+
+# --- ROLL-UP STATS ---
+
+def empty_stats() -> dict:
+    return {"tasks": 0, "tasks_done": 0, "minutes": 0.0, "lectures": 0, "last_studied": None}
+
+
+def _own_stats(node: dict) -> dict:
+    """What this node contributes by itself, ignoring its children."""
+    stats = empty_stats()
+    for task in node.get("tasks", []):
+        stats["tasks"] += 1
+        if "- [x]" in task or "- [X]" in task:
+            stats["tasks_done"] += 1
+    for day, _, minutes in iter_sessions(node):
+        stats["minutes"] += minutes
+        if day and (stats["last_studied"] is None or day > stats["last_studied"]):
+            stats["last_studied"] = day
+    if node.get("type") == "lecture":
+        stats["lectures"] = 1
+    return stats
+
+
+def combine_stats(items) -> dict:
+    """Sums a list of stats dicts (latest ``last_studied`` wins)."""
+    total = empty_stats()
+    for stats in items:
+        for key in ("tasks", "tasks_done", "minutes", "lectures"):
+            total[key] += stats.get(key, 0)
+        last = stats.get("last_studied")
+        if last and (total["last_studied"] is None or last > total["last_studied"]):
+            total["last_studied"] = last
+    return total
+
+
+def node_stats(node: dict) -> dict:
+    """Aggregates for ``node``: its own fields plus its children's stored stats."""
+    children = [child.get("stats") or node_stats(child) for _, child in iter_children(node)]
+    return combine_stats([_own_stats(node)] + children)
+
+
+def update_stats(data, path_list):
+    """Refreshes the stats of the node at ``path_list`` and of each ancestor.
+
+    Call after a task, session or child of that node changed. Only the
+    nodes on the path are touched; siblings keep their stored stats. The
+    root keeps none: ``node_stats(data)`` sums its subjects on the fly.
+    """
+    nodes = [data]
+    for name in path_list:
+        nodes.append(nodes[-1][name])
+    for node in reversed(nodes[1:]):
+        node["stats"] = node_stats(node)
+
+
+def ensure_stats(data) -> bool:
+    """Computes stats for subjects saved before they existed. True if any were added.
+
+    The per-node layout gets its stats when migrated, so lazily loaded
+    trees are not walked here.
+    """
+    changed = False
+    for name, child in list(iter_children(data)):
+        if "stats" not in child:
+            subtree = load_subtree(data, [name])
+            _build_stats(subtree)
+            changed = True
+    return changed
+
+
+def _build_stats(node):
+    for _, child in iter_children(node):
+        _build_stats(child)
+    node["stats"] = node_stats(node)
+
+
+# --- REVISION LOG ---
+
+@lru_cache(maxsize=1)
+def _revision_log():
+    return RevisionLog()
+
+
+@lru_cache(maxsize=1)
+def _session_repository():
+    return SessionRepository()
+
+
+def _session_minutes(entry) -> float:
+    minutes = _MINUTES.match(str(entry.get("time_taken", ""))) if isinstance(entry, dict) else None
+    return float(minutes.group(1)) if minutes else 0.0
+
+
+def _session_material(entry) -> str:
+    return (entry.get("material") if isinstance(entry, dict) else None) or "Other"
+
+
+def _session_day(entry) -> str:
+    return str(entry.get("date", "") if isinstance(entry, dict) else entry)[:10]
+
+
+def iter_sessions(node: dict):
+    """Yields (day "YYYY-MM-DD", sessions, minutes) for everything logged on ``node``.
+
+    Covers the daily and weekly roll-ups (a week is keyed by its Monday)
+    as well as any old-style ``revision_history`` entries.
+    """
+    for entry in node.get("revision_history", []):
+        yield _session_day(entry), 1, _session_minutes(entry)
+    for rollup in ("revision_daily", "revision_weekly"):
+        for day, bucket in node.get(rollup, {}).items():
+            yield day, bucket["sessions"], bucket["minutes"]
+
+
+def iter_session_minutes(node: dict):
+    """Yields (day, material, minutes) for everything logged on ``node``."""
+    for entry in node.get("revision_history", []):
+        yield _session_day(entry), _session_material(entry), _session_minutes(entry)
+    for rollup in ("revision_daily", "revision_weekly"):
+        for day, bucket in node.get(rollup, {}).items():
+            materials = bucket.get("materials") or {"Other": bucket["minutes"]}
+            for material, minutes in materials.items():
+                yield day, material, minutes
+
+
+def _add_to_rollup(node, entry):
+    day = _session_day(entry)
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return
+    minutes = _session_minutes(entry)
+    bucket = node.setdefault("revision_daily", {}).setdefault(day, {"sessions": 0, "minutes": 0.0})
+    bucket["sessions"] += 1
+    bucket["minutes"] += minutes
+    materials = bucket.setdefault("materials", {})
+    material = _session_material(entry)
+    materials[material] = materials.get(material, 0.0) + minutes
+
+
+def _merge_bucket(buckets, key, bucket):
+    target = buckets.setdefault(key, {"sessions": 0, "minutes": 0.0})
+    target["sessions"] += bucket["sessions"]
+    target["minutes"] += bucket["minutes"]
+    materials = target.setdefault("materials", {})
+    for material, minutes in bucket.get("materials", {}).items():
+        materials[material] = materials.get(material, 0.0) + minutes
+
+
+def _compact_rollups(node, today):
+    """Folds old days into weeks and old weeks into the oldest kept week."""
+    daily = node.get("revision_daily", {})
+    cutoff = (today - timedelta(days=DAILY_ROLLUP_DAYS)).strftime("%Y-%m-%d")
+    for day in [d for d in daily if d < cutoff]:
+        date = datetime.strptime(day, "%Y-%m-%d")
+        monday = date - timedelta(days=date.weekday())
+        _merge_bucket(node.setdefault("revision_weekly", {}), monday.strftime("%Y-%m-%d"), daily.pop(day))
+    weekly = node.get("revision_weekly", {})
+    if len(weekly) > WEEKLY_ROLLUP_WEEKS:
+        weeks = sorted(weekly)
+        keep = weeks[-WEEKLY_ROLLUP_WEEKS:]
+        for week in weeks[:-WEEKLY_ROLLUP_WEEKS]:
+            _merge_bucket(weekly, keep[0], weekly.pop(week))
+
+
+def log_revision(data, path_list, entry, today=None):
+    """Records one study session on the node at ``path_list``.
+
+    The node only gets its daily roll-up bumped, so its document stays
+    bounded; the entry itself goes to the node's Firestore subcollection
+    through the local outbox, which the background replicator uploads
+    (and keeps while offline). Old-style ``revision_history`` entries are
+    left where they are.
+    """
+    node = load_children(data, path_list)
+    _revision_log().append(node_id(path_list), {**entry, "session_id": uuid.uuid4().hex})
+    _add_to_rollup(node, entry)
+    _compact_rollups(node, today or datetime.now())
+    update_stats(data, path_list)
+    _, replicator = _default_mirror()
+    if replicator is not None:
+        replicator.notify()
+
+
+def flush_sessions() -> bool:
+    """Uploads the sessions waiting in the local outbox. Returns True when it is empty."""
+    log = _revision_log()
+    while True:
+        rows = log.pending()
+        if not rows:
+            return True
+        sessions = []
+        for seq, nid, entry in rows:
+            entry = dict(entry)
+            # Rows queued before sessions had ids get a stable one from their content
+            session_id = entry.pop("session_id", None) or hashlib.sha256(
+                f"{nid}|{seq}|{json.dumps(entry, sort_keys=True)}".encode("utf-8")).hexdigest()[:32]
+            sessions.append((nid, session_id, entry))
+        try:
+            _session_repository().save_sessions(sessions)
+        except Exception as e:
+            print(f"Could not upload study sessions: {e}")
+            return False
+        log.remove([seq for seq, _, _ in rows])
+
+
+def revision_page(path_list, node: dict, page: int = 0, page_size: int = HISTORY_PAGE_SIZE,
+                  cache=None):
+    """(entries newest first, total count) for one page of a node's history.
+
+    The history is: sessions still in the local outbox, then the ones in
+    Firestore (counted from the node's roll-ups, so no count query), then
+    any old-style ``revision_history`` entries.
+
+    Pass a dict (e.g. kept in ``st.session_state``) as ``cache`` so reruns
+    reuse fetched Firestore pages; a page is only read again once it
+    covers different sessions. Reads give up after ``HISTORY_FETCH_TIMEOUT``.
+    """
+    log = _revision_log()
+    nid = node_id(path_list)
+    pending = [{k: v for k, v in entry.items() if k != "session_id"}
+               for entry in log.page(nid, 0, log.count(nid))]
+    legacy = list(reversed(node.get("revision_history") or []))
+    logged = sum(sessions for _, sessions, _ in iter_sessions(node)) - len(legacy)
+    remote_total = max(logged - len(pending), 0)
+
+    start, end = page * page_size, (page + 1) * page_size
+    entries = pending[start:end]
+    remote_start, remote_end = max(start - len(pending), 0), min(end - len(pending), remote_total)
+    if remote_end > remote_start:
+        key = (nid, remote_start, remote_end, remote_total)
+        fetched = cache.get(key) if cache is not None else None
+        if fetched is None:
+            try:
+                fetched = _session_repository().get_page(
+                    nid, remote_start, remote_end - remote_start, timeout=HISTORY_FETCH_TIMEOUT)
+            except Exception as e:
+                print(f"Could not load session history: {e}")
+                fetched = []
+            if cache is not None:
+                cache[key] = fetched
+        entries += fetched
+    offset = len(pending) + remote_total
+    entries += legacy[max(start - offset, 0):max(end - offset, 0)]
+    return entries, len(pending) + remote_total + len(legacy)
+
+
 def delete_drive_file(file_id):
     """Wrapper to delete a file from Cloud permanently."""
     return delete_file_from_drive(file_id)
 
 def save_generated_notes_to_drive(content_string, path_list):
-    """Saves Markdown text directly to Drive (via temp file)."""
-    clean_temp_folder()
-    
-    # 1. Write temp file
-    temp_path = os.path.join(TEMP_DIR, "generated_notes.md")
-    with open(temp_path, "w", encoding="utf-8") as f:
-        f.write(content_string)
-        
-    # 2. Upload to Drive
-    drive_id = upload_to_drive(temp_path, path_list)
-    
-    # 3. Delete Temp
-    os.remove(temp_path)
-    
-    return drive_id
+    """Saves Markdown text directly to Drive (streamed from RAM, no temp file)."""
+    result = upload_bytes_to_drive(content_string, NOTES_FILE_NAME, path_list, "text/markdown")
+    _cache_notes(result, content_string)
+    return result.file_id if result else None
+
+def _cache_notes(result, content_string):
+    """Seeds the notes cache with what we just uploaded."""
+    if result is not None:
+        file_cache().put(result.file_id, content_string.encode('utf-8'), md5=result.md5)
 
-def update_generated_notes(content_string, path_list):
+def update_generated_notes(content_string, path_list, file_id=None):
     """
     Updates the existing notes by Overwriting them in the Cloud.
     Used when you click 'Save Edits'.
+    The file keeps its ID; if nothing changed, nothing is uploaded.
+    Returns an UploadResult (None on failure).
     """
-    return save_generated_notes_to_drive(content_string, path_list)
+    result = upload_bytes_to_drive(
+        content_string, NOTES_FILE_NAME, path_list, "text/markdown", file_id=file_id)
+    _cache_notes(result, content_string)
+    return result
 
-def read_notes_from_drive(file_id):
-    """Downloads notes from Drive DIRECTLY into RAM."""
-    service = authenticate()
-    if not service or not file_id: return None
-    
+def read_notes_from_drive(file_id, md5=None):
+    """Reads notes from Drive into RAM, via the shared revalidating cache."""
     try:
-        request = service.files().get_media(fileId=file_id)
-        file_stream = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_stream, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            
-        return file_stream.getvalue().decode('utf-8')
+        content = read_file_cached(file_id, md5)
+        return content.decode('utf-8') if content is not None else None
     except Exception as e:
         print(f"Could not read from Drive: {e}")
         return None
 
-def add_item_to_path(full_data, path_list, new_name, item_type="folder"):
-    """Creates folder structure in JSON database."""
-    current = full_data
-    for step in path_list:
-        current = current.get(step, {})
+def add_item_to_path(full_data, path_list, new_name, item_type="folder", search_index=None):
+    """Creates folder structure in JSON database (and indexes it for search)."""
+    current = load_children(full_data, path_list)
         
     if item_type == "lecture":
         current[new_name] = {
@@ -224,7 +1059,10 @@ def add_item_to_path(full_data, path_list, new_name, item_type="folder"):
         }
     else:
         current[new_name] = {"type": "folder"}
-        
+
+    if search_index is not None:
+        search_index.add(list(path_list) + [new_name], item_type)
+    update_stats(full_data, list(path_list) + [new_name])
     save_data(full_data)
     return full_data
 
@@ -1,78 +1,522 @@
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaIoBaseUpload
+import hashlib
+import httplib2
+import io
 import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from googleapiclient.errors import HttpError
+from modules.storage import KeyValueStore
 
 # CONSTANTS
 SCOPES = ['https://www.googleapis.com/auth/drive']
 SERVICE_ACCOUNT_FILE = 'service_account.json'
 PARENT_FOLDER_NAME = "StudyOS_Data"
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+HTTP_TIMEOUT = 60  # seconds
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # resumable upload chunk (multiple of 256 KiB)
+FILE_CACHE_DIR = ".drive_cache"
+FILE_CACHE_MEMORY_BYTES = 32 * 1024 * 1024
+FILE_CACHE_DISK_BYTES = 512 * 1024 * 1024
+FILE_CACHE_FRESH_FOR = 30  # seconds a validated entry is served without asking Drive
+
+# One Drive client per process; each thread gets its own keep-alive
+# connection because httplib2 is not thread-safe.
+_client_lock = threading.Lock()
+_thread_local = threading.local()
+_service = None
+_credentials = None
+
+_stats_lock = threading.Lock()
+DRIVE_STATS = {"client_builds": 0, "requests": 0, "errors": 0, "request_ms": 0.0}
+
+def _load_credentials():
+    """Service-account credentials, read from disk once and refreshed in place."""
+    global _credentials
+    if _credentials is None:
+        _credentials = service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    return _credentials
+
+def _thread_http():
+    """This thread's authorized connection (refreshes the token when it expires)."""
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(_load_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        _thread_local.http = http
+    return http
 
 def authenticate():
-    """Logs into the Google Service Account."""
+    """Returns the shared Drive client, logging into the Service Account on first use."""
+    global _service
+    if _service is not None:
+        return _service
     if not os.path.exists(SERVICE_ACCOUNT_FILE):
         return None
-        
+
+    with _client_lock:
+        if _service is None:
+            try:
+                _service = build('drive', 'v3', http=_thread_http(), cache_discovery=False)
+            except Exception as e:
+                print(f"Authentication Error: {e}")
+                return None
+            with _stats_lock:
+                DRIVE_STATS["client_builds"] += 1
+    return _service
+
+def _record(started, failed=False):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _stats_lock:
+        DRIVE_STATS["requests"] += 1
+        DRIVE_STATS["request_ms"] += elapsed_ms
+        if failed:
+            DRIVE_STATS["errors"] += 1
+
+def execute(request):
+    """Runs a Drive API request on this thread's pooled connection."""
+    started = time.perf_counter()
     try:
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        return build('drive', 'v3', credentials=creds)
-    except Exception as e:
-        print(f"Authentication Error: {e}")
-        return None
+        response = request.execute(http=_thread_http())
+    except Exception:
+        _record(started, failed=True)
+        raise
+    _record(started)
+    return response
+
+def download_file(service, file_id):
+    """Downloads a file's content into RAM and returns the bytes."""
+    started = time.perf_counter()
+    try:
+        request = service.files().get_media(fileId=file_id)
+        request.http = _thread_http()
+        file_stream = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_stream, request)
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+    except Exception:
+        _record(started, failed=True)
+        raise
+    _record(started)
+    return file_stream.getvalue()
+
+def get_drive_stats():
+    """Client builds, request count, errors and average request latency."""
+    with _stats_lock:
+        stats = dict(DRIVE_STATS)
+    stats["avg_request_ms"] = stats["request_ms"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+def _quote(value):
+    """Escapes a name for use inside a Drive query string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+def _list_folders(service, folder_name, parent_id=None):
+    query = f"name='{_quote(folder_name)}' and mimeType='{FOLDER_MIME}' and trashed=false"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
+    results = execute(service.files().list(
+        q=query, fields="files(id, name, createdTime)", orderBy="createdTime"))
+    return results.get('files', [])
 
 def find_or_create_folder(service, folder_name, parent_id=None):
     """Finds a folder ID by name, or creates it if missing."""
     if not service: return None
     
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-        
-    results = service.files().list(q=query, fields="files(id, name)").execute()
-    items = results.get('files', [])
+    items = _list_folders(service, folder_name, parent_id)
     
     if not items:
         file_metadata = {
             'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder'
+            'mimeType': FOLDER_MIME
         }
         if parent_id:
             file_metadata['parents'] = [parent_id]
         
-        folder = service.files().create(body=file_metadata, fields='id').execute()
-        return folder.get('id')
+        folder = execute(service.files().create(body=file_metadata, fields='id'))
+        folder_id = folder.get('id')
+
+        # Another process may have created the same folder at the same time:
+        # everyone keeps the oldest one and the extra copies are removed.
+        items = _list_folders(service, folder_name, parent_id)
+        if items and items[0]['id'] != folder_id:
+            execute(service.files().delete(fileId=folder_id))
+            return items[0]['id']
+        return folder_id
     else:
         return items[0]['id']
 
+# --- FOLDER-ID CACHE ---
+# {"StudyOS_Data\x1fExam\x1fSubject": folder_id}, persisted next to the
+# study tree so a deep upload usually needs no folder lookups at all.
+
+_path_locks = defaultdict(threading.Lock)
+_path_locks_guard = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _folder_cache():
+    return KeyValueStore("drive_folders")
+
+def _path_key(path):
+    return "\x1f".join(path)
+
+def _path_lock(path):
+    with _path_locks_guard:
+        return _path_locks[_path_key(path)]
+
+def resolve_folder(service, path_list):
+    """Returns the Drive folder ID for StudyOS_Data/<path_list>, creating folders as needed.
+
+    Served from the folder-ID cache when possible; on a miss only the
+    missing tail of the path is looked up (and created if absent).
+    """
+    if not service: return None
+    path = (PARENT_FOLDER_NAME,) + tuple(path_list)
+    cache = _folder_cache()
+
+    # Deepest ancestor we already know
+    depth = len(path)
+    while depth > 0 and cache.get(_path_key(path[:depth])) is None:
+        depth -= 1
+    parent_id = cache.get(_path_key(path[:depth])) if depth else None
+
+    for i in range(depth, len(path)):
+        prefix = path[:i + 1]
+        with _path_lock(prefix):
+            folder_id = cache.get(_path_key(prefix))
+            if folder_id is None:
+                folder_id = find_or_create_folder(service, prefix[-1], parent_id)
+                cache.set(_path_key(prefix), folder_id)
+        parent_id = folder_id
+    return parent_id
+
+def forget_folder(path_list):
+    """Drops a folder (and everything cached below it) from the cache."""
+    key = _path_key((PARENT_FOLDER_NAME,) + tuple(path_list))
+    cache = _folder_cache()
+    for cached_key, _ in cache.items():
+        if cached_key == key or cached_key.startswith(key + "\x1f"):
+            cache.delete(cached_key)
+
+def warm_folder_cache(service, path_list=()):
+    """Caches every folder below StudyOS_Data/<path_list> from one paged listing."""
+    if not service: return 0
+    roots = _list_folders(service, PARENT_FOLDER_NAME)
+    if not roots:
+        return 0
+
+    children = defaultdict(list)
+    page_token = None
+    while True:
+        results = execute(service.files().list(
+            q=f"mimeType='{FOLDER_MIME}' and trashed=false",
+            fields="nextPageToken, files(id, name, parents)",
+            pageSize=1000, pageToken=page_token))
+        for item in results.get('files', []):
+            for parent in item.get('parents', []):
+                children[parent].append(item)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    found = {}
+    stack = [((PARENT_FOLDER_NAME,), roots[0]['id'])]
+    prefix = (PARENT_FOLDER_NAME,) + tuple(path_list)
+    while stack:
+        path, folder_id = stack.pop()
+        if path[:len(prefix)] == prefix[:len(path)]:
+            found[_path_key(path)] = folder_id
+        for child in children.get(folder_id, []):
+            child_path = path + (child['name'],)
+            if child_path[:len(prefix)] == prefix[:len(child_path)]:
+                stack.append((child_path, child['id']))
+    _folder_cache().set_many(found)
+    return len(found)
+
+@dataclass
+class UploadResult:
+    """What an upload did: 'created', 'updated' in place, or 'skipped' (same content)."""
+
+    file_id: str
+    action: str
+    md5: str
+
+def _md5_of_stream(stream):
+    digest = hashlib.md5()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
 def upload_to_drive(local_path, path_list):
     """Uploads file to Google Drive under the correct hierarchy."""
+    with open(local_path, 'rb') as f:
+        md5 = _md5_of_stream(f)
+    media = MediaFileUpload(local_path, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    result = _upload(os.path.basename(local_path), path_list, media, md5)
+    return result.file_id if result else None
+
+def upload_bytes_to_drive(content, file_name, path_list, mimetype='application/octet-stream',
+                          file_id=None):
+    """Uploads straight from RAM: bytes, a str or any file-like object.
+
+    The data is streamed to Drive in resumable chunks; nothing is written
+    to local disk. The target is ``file_id`` when given, otherwise the
+    file called ``file_name`` in the folder. If that file already has the
+    same MD5 nothing is sent; if it differs it is updated in place so its
+    ID (and every link to it) stays the same.
+
+    Returns an ``UploadResult``, or None if the upload failed.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = io.BytesIO(content)
+    md5 = _md5_of_stream(content)
+    media = MediaIoBaseUpload(content, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    return _upload(file_name, path_list, media, md5, file_id)
+
+def _upload(file_name, path_list, media, md5, file_id=None):
     service = authenticate()
     if not service: return None
 
     try:
-        current_parent_id = find_or_create_folder(service, PARENT_FOLDER_NAME)
-        for folder in path_list:
-            current_parent_id = find_or_create_folder(service, folder, current_parent_id)
-            
-        file_name = os.path.basename(local_path)
-        
-        # Deduplication check
-        query = f"name='{file_name}' and '{current_parent_id}' in parents and trashed=false"
-        results = service.files().list(q=query).execute()
-        if results.get('files', []):
-            return results.get('files', [])[0]['id']
-
-        # Upload
-        file_metadata = {'name': file_name, 'parents': [current_parent_id]}
-        media = MediaFileUpload(local_path, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        return file.get('id')
+        existing = _get_file(service, file_id) if file_id else None
+        if existing is None:
+            try:
+                current_parent_id = resolve_folder(service, path_list)
+                existing = _find_file(service, file_name, current_parent_id)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # A cached folder was deleted in Drive: look the path up again.
+                forget_folder(path_list)
+                current_parent_id = resolve_folder(service, path_list)
+                existing = _find_file(service, file_name, current_parent_id)
+
+        if existing is None:
+            file_metadata = {'name': file_name, 'parents': [current_parent_id]}
+            file = execute(service.files().create(body=file_metadata, media_body=media, fields='id'))
+            return UploadResult(file.get('id'), "created", md5)
+
+        # Content check: unchanged files are not sent again
+        if existing.get('md5Checksum') == md5:
+            return UploadResult(existing['id'], "skipped", md5)
+        execute(service.files().update(fileId=existing['id'], media_body=media, fields='id'))
+        return UploadResult(existing['id'], "updated", md5)
         
     except Exception as e:
         print(f"⚠️ Upload Failed: {e}")
         return None
 
+def _get_file(service, file_id):
+    """Metadata of a file by ID, or None if it is gone."""
+    try:
+        meta = execute(service.files().get(fileId=file_id, fields="id, md5Checksum, trashed"))
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+    return None if meta.get('trashed') else meta
+
+def _find_file(service, file_name, parent_id):
+    """Deduplication check: the file with this name in the folder, if any."""
+    query = f"name='{_quote(file_name)}' and '{parent_id}' in parents and trashed=false"
+    results = execute(service.files().list(q=query, fields="files(id, md5Checksum)"))
+    items = results.get('files', [])
+    return items[0] if items else None
+
+# --- FILE CACHE ---
+
+class DriveFileCache:
+    """Shared memory + disk LRU cache of Drive file contents, keyed by file ID.
+
+    Cached bytes are revalidated against Drive's ``md5Checksum`` /
+    ``modifiedTime`` (one small metadata request) and only downloaded again
+    when the file really changed. Entries validated in the last
+    ``fresh_for`` seconds are served without asking Drive at all.
+    """
+
+    def __init__(self, directory=FILE_CACHE_DIR, max_memory_bytes=FILE_CACHE_MEMORY_BYTES,
+                 max_disk_bytes=FILE_CACHE_DISK_BYTES, fresh_for=FILE_CACHE_FRESH_FOR,
+                 index=None):
+        self._dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # {file_id: bytes}, oldest first
+        self._memory_bytes = 0
+        # {file_id: {"md5", "modified", "size", "used"}}
+        self._index = index if index is not None else KeyValueStore("drive_file_cache")
+        self._validated = {}  # {file_id: monotonic time of last check}
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.fresh_for = fresh_for
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+    def get(self, service, file_id, md5=None):
+        """Returns the file's bytes, downloading only if the cached copy is stale.
+
+        Callers that already know the file's current ``md5`` can pass it to
+        skip the revalidation request.
+        """
+        meta = self._index.get(file_id)
+        if meta is not None and md5 is not None and meta.get("md5") == md5:
+            data = self._read(file_id)
+            if data is not None:
+                self._validated[file_id] = time.monotonic()
+                self._count("revalidated")
+                return data
+        if md5 is not None:
+            meta = None
+        if meta is not None:
+            checked = self._validated.get(file_id)
+            if checked is not None and time.monotonic() - checked < self.fresh_for:
+                data = self._read(file_id)
+                if data is not None:
+                    self._count("hits")
+                    return data
+            remote = execute(service.files().get(
+                fileId=file_id, fields="md5Checksum, modifiedTime"))
+            if self._matches(meta, remote):
+                data = self._read(file_id)
+                if data is not None:
+                    self._validated[file_id] = time.monotonic()
+                    self._count("revalidated")
+                    return data
+        else:
+            remote = {"md5Checksum": md5} if md5 is not None else None
+
+        self._count("misses")
+        if remote is None:
+            remote = execute(service.files().get(
+                fileId=file_id, fields="md5Checksum, modifiedTime"))
+        data = download_file(service, file_id)
+        self.put(file_id, data, remote.get('md5Checksum'), remote.get('modifiedTime'))
+        return data
+
+    def put(self, file_id, data, md5=None, modified=None):
+        """Stores fresh content, e.g. right after we uploaded it ourselves."""
+        path = os.path.join(self._dir, file_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._index.set(file_id, {
+            "md5": md5, "modified": modified, "size": len(data), "used": time.time()})
+        self._validated[file_id] = time.monotonic()
+        self._remember(file_id, data)
+        self._evict_disk()
+
+    def invalidate(self, file_id):
+        with self._lock:
+            data = self._memory.pop(file_id, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+        self._validated.pop(file_id, None)
+        self._index.delete(file_id)
+        try:
+            os.remove(os.path.join(self._dir, file_id))
+        except FileNotFoundError:
+            pass
+
+    def set_limits(self, max_memory_bytes=None, max_disk_bytes=None):
+        """Changes the size limits and evicts down to them."""
+        if max_memory_bytes is not None:
+            self.max_memory_bytes = max_memory_bytes
+        if max_disk_bytes is not None:
+            self.max_disk_bytes = max_disk_bytes
+        with self._lock:
+            self._evict_memory()
+        self._evict_disk()
+
+    def stats(self):
+        """Hit/revalidation/miss counts, hit rate and current sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_bytes"] = self._memory_bytes
+        stats["disk_bytes"] = sum(meta["size"] for _, meta in self._index.items())
+        served = stats["hits"] + stats["revalidated"]
+        total = served + stats["misses"]
+        stats["hit_rate"] = served / total if total else 0.0
+        return stats
+
+    @staticmethod
+    def _matches(meta, remote):
+        if meta.get("md5") and remote.get("md5Checksum"):
+            return meta["md5"] == remote["md5Checksum"]
+        return bool(meta.get("modified")) and meta["modified"] == remote.get("modifiedTime")
+
+    def _read(self, file_id):
+        with self._lock:
+            data = self._memory.get(file_id)
+            if data is not None:
+                self._memory.move_to_end(file_id)
+                return data
+        try:
+            with open(os.path.join(self._dir, file_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        meta = self._index.get(file_id)
+        if meta is not None:
+            self._index.set(file_id, dict(meta, used=time.time()))
+        self._remember(file_id, data)
+        return data
+
+    def _remember(self, file_id, data):
+        with self._lock:
+            old = self._memory.pop(file_id, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[file_id] = data
+            self._memory_bytes += len(data)
+            self._evict_memory()
+
+    def _evict_memory(self):
+        while self._memory and self._memory_bytes > self.max_memory_bytes:
+            _, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+
+    def _evict_disk(self):
+        entries = sorted(self._index.items(), key=lambda item: item[1].get("used", 0))
+        total = sum(meta["size"] for _, meta in entries)
+        for file_id, meta in entries:
+            if total <= self.max_disk_bytes:
+                break
+            self.invalidate(file_id)
+            total -= meta["size"]
+            self._count("evictions")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+@lru_cache(maxsize=1)
+def file_cache():
+    """The process-wide Drive file cache (shared by all sessions)."""
+    return DriveFileCache()
+
+def read_file_cached(file_id, md5=None):
+    """Returns a Drive file's bytes through the shared cache, or None."""
+    service = authenticate()
+    if not service or not file_id: return None
+    return file_cache().get(service, file_id, md5)
+
+def get_file_md5(file_id):
+    """Drive's current MD5 of a file (one metadata request), or None."""
+    service = authenticate()
+    if not service or not file_id: return None
+    meta = _get_file(service, file_id)
+    return meta.get('md5Checksum') if meta else None
+
 def delete_file_from_drive(file_id):
     """
     PERMANENTLY deletes a file from Google Drive.
@@ -82,7 +526,8 @@ def delete_file_from_drive(file_id):
     if not service or not file_id: return False
 
     try:
-        service.files().delete(fileId=file_id).execute()
+        execute(service.files().delete(fileId=file_id))
+        file_cache().invalidate(file_id)
         print(f"🗑️ Deleted from Cloud: {file_id}")
         return True
     except Exception as e:
@@ -1 +1,109 @@
-
\ No newline at end of file
+from concurrent.futures import ThreadPoolExecutor
+
+# CONSTANTS
+CHUNK_CHARS = 12000  # slide text per map call
+MAX_PARALLEL_CHUNKS = 4  # concurrent model calls
+
+
+def notes_prompt(teacher_profile_text=""):
+    """The standard notes instructions (Concept / Derivation / Exam / Short Notes)."""
+    return f"""
+    You are an expert Professor for Competitive Exams (GATE/UPSC).
+    Generate **Interactive Lecture Notes**.
+
+    {teacher_profile_text}
+
+    **CRITICAL RULE:** Output strict Markdown blocks.
+
+    **STRUCTURE:**
+    # [Lecture Title]
+
+    ## 🧠 Concept Block: Core Intuition
+    * **The 'Why':** Explain simply.
+    * **Teacher's Hint:** Capture any 'Desi' mnemonics from audio.
+
+    ---
+
+    ## 📝 Derivation Block: Formulas & Math
+    * Use LaTeX for math ($V_x$).
+
+    ---
+
+    ## 🔥 Exam Block: Critical Points
+    * **High Yield:** Mark "Important" points with 🔥.
+    * **Traps:** Mark mistakes with ⚠️.
+
+    ---
+
+    ## ⚡ Short Notes Block (Summary)
+    (5-line cheat sheet).
+    """
+
+
+def map_prompt(index, total, teacher_profile_text=""):
+    return f"""
+    You are an expert Professor for Competitive Exams (GATE/UPSC).
+    These slides are part {index} of {total} of ONE lecture.
+    Write detailed partial notes for THIS PART ONLY, as Markdown bullets under
+    the headings "Concepts", "Formulas & Derivations" (LaTeX, e.g. $V_x$) and
+    "Exam Points" (🔥 for important, ⚠️ for traps).
+    Do not write a title, an introduction or a summary; other parts are handled separately.
+
+    {teacher_profile_text}
+    """
+
+
+def reduce_prompt(teacher_profile_text=""):
+    return f"""
+    The PARTIAL NOTES above were written for consecutive parts of one lecture, in order.
+    Merge them into a single set of notes: keep every formula and exam point,
+    drop repetitions, and keep the lecture's order within each block.
+    {notes_prompt(teacher_profile_text)}
+    """
+
+
+def split_sections(pages, chunk_chars=CHUNK_CHARS) -> list:
+    """Consecutive pages grouped into chunks of at most ``chunk_chars`` characters.
+
+    Chunks break between pages; a single page longer than a chunk is cut on its own.
+    """
+    sections, current, size = [], [], 0
+    for page in pages:
+        if size + len(page) > chunk_chars and current:
+            sections.append("".join(current))
+            current, size = [], 0
+        while len(page) > chunk_chars:
+            sections.append(page[:chunk_chars])
+            page = page[chunk_chars:]
+        current.append(page)
+        size += len(page)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def map_reduce_notes(pages, model, teacher_profile_text="", reduce_inputs=(),
+                     chunk_chars=CHUNK_CHARS, workers=MAX_PARALLEL_CHUNKS) -> str:
+    """Notes for a deck of any length.
+
+    ``model`` is any callable taking a list of prompt parts and returning
+    text (Gemini in the app, a stand-in in tests). Sections are summarised
+    concurrently, at most ``workers`` at a time, then one reduce call merges
+    the partial notes into the standard structure; ``reduce_inputs`` (e.g.
+    the lecture audio) only go to that call. A deck that fits in one chunk
+    takes a single call.
+    """
+    sections = split_sections(pages, chunk_chars)
+    if len(sections) <= 1:
+        slides = [f"LECTURE SLIDES CONTENT:\n{sections[0]}"] if sections else []
+        return model([*slides, *reduce_inputs, notes_prompt(teacher_profile_text)])
+
+    total = len(sections)
+    with ThreadPoolExecutor(max_workers=min(workers, total)) as pool:
+        partials = list(pool.map(
+            lambda item: model([f"LECTURE SLIDES CONTENT (part {item[0]} of {total}):\n{item[1]}",
+                                map_prompt(item[0], total, teacher_profile_text)]),
+            enumerate(sections, 1)))
+
+    merged = "\n\n".join(f"--- PART {i} OF {total} ---\n{text}" for i, text in enumerate(partials, 1))
+    return model([f"PARTIAL NOTES:\n{merged}", *reduce_inputs, reduce_prompt(teacher_profile_text)])
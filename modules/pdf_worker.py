@@ -0,0 +1,22 @@
+"""Process-pool side of PDF extraction.
+
+Pool workers are started with "spawn", so each one imports this module
+from scratch: it deliberately imports nothing but PyPDF2. The deck's bytes
+arrive once per worker through ``init``; tasks only carry page ranges.
+"""
+import io
+
+import PyPDF2
+
+_reader = None
+
+
+def init(pdf_bytes):
+    global _reader
+    _reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+
+
+def extract_range(start, stop):
+    """Texts (+ newline) of pages [start, stop) of this worker's deck."""
+    return [(_reader.pages[number].extract_text() or "") + "\n"
+            for number in range(start, min(stop, len(_reader.pages)))]
@@ -0,0 +1,136 @@
+import datetime
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+
+from modules.data_manager import iter_children, iter_sessions
+
+# CONSTANTS
+MAX_STABILITY = 365.0  # days; memory strength is capped at one year
+_DATE = re.compile(r"\s*(\d{4})-(\d{1,2})-(\d{1,2})")
+
+
+def stability(n_revisions):
+    """Stability S (days) after ``n_revisions`` sessions: 1, 3, 7, then doubling.
+
+    Works element-wise on NumPy arrays as well as on plain ints.
+    """
+    n = np.asarray(n_revisions, dtype=float)
+    doubling = np.minimum(7.0 * 2.0 ** np.maximum(n - 3, 0), MAX_STABILITY)
+    s = np.select([n <= 1, n == 2, n == 3], [1.0, 3.0, 7.0], doubling)
+    return float(s) if s.ndim == 0 else s
+
+
+def parse_session_day(item):
+    """Day ordinal of a history entry ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM"), or None."""
+    ds = item.get("date") if isinstance(item, dict) else item
+    return _parse_day(ds) if isinstance(ds, str) else None
+
+
+@lru_cache(maxsize=4096)
+def _parse_day(ds):
+    match = _DATE.match(ds)
+    if match is None:
+        return None
+    try:
+        return datetime.date(*map(int, match.groups())).toordinal()
+    except ValueError:
+        return None
+
+
+def is_study_unit(node: dict) -> bool:
+    """Lectures, plus any folder that has sessions logged on it directly."""
+    return node.get("type") == "lecture" or next(iter_sessions(node), None) is not None
+
+
+@dataclass
+class HistoryTable:
+    """Every study session in a tree, flattened into columns.
+
+    ``paths[i]`` is node i's path (relative to the table's root), with
+    ``parent``/``depth`` describing the tree (the root's parent is -1);
+    ``unit`` marks the nodes that carry a retention score. One row per
+    day with sessions in ``event_node`` (node index) / ``event_day`` (day
+    ordinal) / ``event_count`` (sessions that day, or that week for the
+    weekly roll-up).
+    """
+    paths: list = field(default_factory=list)
+    parent: np.ndarray = None
+    depth: np.ndarray = None
+    unit: np.ndarray = None
+    event_node: np.ndarray = None
+    event_day: np.ndarray = None
+    event_count: np.ndarray = None
+
+    @classmethod
+    def from_tree(cls, data: dict) -> "HistoryTable":
+        paths, parent, unit, event_node, event_day, event_count = [], [], [], [], [], []
+        stack = [((), -1, data)]
+        while stack:
+            path, parent_index, node = stack.pop()
+            index = len(paths)
+            paths.append(path)
+            parent.append(parent_index)
+            unit.append(is_study_unit(node))
+            for date, sessions, _ in iter_sessions(node):
+                day = parse_session_day(date)
+                if day is not None:
+                    event_node.append(index)
+                    event_day.append(day)
+                    event_count.append(sessions)
+            stack.extend((path + (name,), index, child) for name, child in iter_children(node))
+        return cls(
+            paths=paths,
+            parent=np.array(parent, dtype=np.int64),
+            depth=np.array([len(path) for path in paths], dtype=np.int64),
+            unit=np.array(unit, dtype=bool),
+            event_node=np.array(event_node, dtype=np.int64),
+            event_day=np.array(event_day, dtype=np.int64),
+            event_count=np.array(event_count, dtype=np.int64),
+        )
+
+    def session_counts(self) -> np.ndarray:
+        return np.bincount(self.event_node, weights=self.event_count,
+                           minlength=len(self.paths)).astype(np.int64)
+
+    def last_session(self) -> np.ndarray:
+        """Day ordinal of each node's latest session (0 where there is none)."""
+        last = np.zeros(len(self.paths), dtype=np.int64)
+        np.maximum.at(last, self.event_node, self.event_day)
+        return last
+
+
+def retention(table: HistoryTable, today=None) -> np.ndarray:
+    """R = exp(-t / S) for every node at once, 0 for never-studied nodes."""
+    today = (today or datetime.date.today()).toordinal()
+    counts = table.session_counts()
+    elapsed = today - table.last_session()
+    r = np.exp(-np.maximum(elapsed, 0) / stability(np.maximum(counts, 1)))
+    return np.where(counts > 0, r, 0.0)
+
+
+def rollup(table: HistoryTable, scores: np.ndarray, weights=None) -> dict:
+    """Weighted mean of the study units' scores under every node.
+
+    Returns {path: score 0-100}; nodes with no study unit below them are
+    left out. ``weights`` (one per node) defaults to 1 for every unit.
+    """
+    w = np.ones(len(table.paths)) if weights is None else np.asarray(weights, dtype=float)
+    weight = np.where(table.unit, w, 0.0)
+    total = weight * scores
+    # Push sums up one level at a time, deepest level first
+    for level in range(int(table.depth.max(initial=0)), 0, -1):
+        nodes = np.flatnonzero(table.depth == level)
+        np.add.at(total, table.parent[nodes], total[nodes])
+        np.add.at(weight, table.parent[nodes], weight[nodes])
+    mean = np.divide(total, weight, out=np.zeros(len(table.paths)), where=weight > 0)
+    percent = np.clip(np.rint(mean * 100), 0, 100).astype(int)
+    return {table.paths[i]: int(percent[i]) for i in np.flatnonzero(weight > 0)}
+
+
+def brain_battery_scores(data: dict, today=None) -> dict:
+    """{path: health 0-100} for every folder and lecture in ``data``."""
+    table = HistoryTable.from_tree(data)
+    return rollup(table, retention(table, today))
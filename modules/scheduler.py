@@ -1 +1,115 @@
-
\ No newline at end of file
+import datetime
+import heapq
+import math
+
+import numpy as np
+
+from modules.data_manager import iter_sessions
+from modules.retention import HistoryTable, parse_session_day, stability
+
+# CONSTANTS
+TARGET_RETENTION = 0.5  # a lecture is due once R = exp(-t/S) falls to this
+DAILY_PLAN_SIZE = 10
+
+
+def review_interval(n_revisions):
+    """Days from the last session until retention drops to TARGET_RETENTION."""
+    days = np.ceil(stability(n_revisions) * math.log(1 / TARGET_RETENTION))
+    return np.maximum(days, 1).astype(np.int64) if np.ndim(days) else max(int(days), 1)
+
+
+def next_due_day(history):
+    """Day ordinal a lecture with this revision history is next due, or None."""
+    return _due_from_sessions((item, 1) for item in history)
+
+
+def _due_from_sessions(sessions):
+    """Same, from (date, number of sessions) pairs."""
+    last, count = None, 0
+    for date, n in sessions:
+        day = parse_session_day(date)
+        if day is not None:
+            last = day if last is None else max(last, day)
+            count += n
+    return None if last is None else last + review_interval(count)
+
+
+class ReviewQueue:
+    """Min-heap of studied lectures keyed by the day they are next due.
+
+    Built once from the tree; ``log_session`` re-keys a single lecture by
+    pushing a fresh entry and leaving the old one to be skipped lazily, so
+    updates cost O(log n). Due lectures are read off the top of the heap
+    without popping, in O(k log k) for the first k.
+    """
+
+    def __init__(self):
+        self._heap = []  # [(due day, path)], may hold stale entries
+        self._due = {}  # {path: current due day}
+
+    @classmethod
+    def build(cls, data: dict) -> "ReviewQueue":
+        queue = cls()
+        table = HistoryTable.from_tree(data)
+        counts = table.session_counts()
+        studied = np.flatnonzero(table.unit & (counts > 0))
+        due = table.last_session()[studied] + review_interval(counts[studied])
+        queue._due = {table.paths[i]: int(d) for i, d in zip(studied, due)}
+        queue._heap = [(d, path) for path, d in queue._due.items()]
+        heapq.heapify(queue._heap)
+        return queue
+
+    def __len__(self):
+        return len(self._due)
+
+    def log_session(self, path, node: dict):
+        """Re-schedules the lecture at ``path`` after its history changed."""
+        self.update(path, _due_from_sessions((day, n) for day, n, _ in iter_sessions(node)))
+
+    def update(self, path, due_day):
+        path = tuple(path)
+        if due_day is None:
+            self._due.pop(path, None)
+            return
+        if self._due.get(path) == due_day:
+            return
+        self._due[path] = due_day
+        heapq.heappush(self._heap, (due_day, path))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._compact()
+
+    def due_on(self, path):
+        return self._due.get(tuple(path))
+
+    def due(self, today=None, limit=None) -> list:
+        """[(path list, days overdue)] for lectures due by ``today``, most overdue first."""
+        today = (today or datetime.date.today()).toordinal()
+        results = []
+        for due_day, path in self._ordered():
+            if due_day > today or (limit is not None and len(results) >= limit):
+                break
+            results.append((list(path), today - due_day))
+        return results
+
+    def plan(self, today=None, size=DAILY_PLAN_SIZE) -> list:
+        """Today's capped review plan: the ``size`` most overdue lectures."""
+        return self.due(today, limit=size)
+
+    def _ordered(self):
+        """Yields live heap entries in order, walking the heap without popping it."""
+        heap = self._heap
+        frontier = [(heap[0], 0)] if heap else []
+        seen = set()
+        while frontier:
+            entry, i = heapq.heappop(frontier)
+            if self._due.get(entry[1]) == entry[0] and entry[1] not in seen:
+                seen.add(entry[1])
+                yield entry
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def _compact(self):
+        """Drops stale entries once they outnumber live ones."""
+        self._heap = [(d, path) for path, d in self._due.items()]
+        heapq.heapify(self._heap)
@@ -0,0 +1,255 @@
+import hashlib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from modules.data_manager import iter_children
+
+# CONSTANTS
+MIN_SIMILARITY = 0.5  # share of the query's trigrams a fuzzy match must contain
+MAX_RESULTS = 25
+NOTES_INDEX_DB_FILE = "studyos_search.db"
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 160
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was "
+    "were will with we you".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def trigrams(text: str) -> set:
+    """Lowercase character trigrams of ``text``."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """In-memory trigram index over the names of every folder and lecture.
+
+    Built once from the tree, then kept current with ``add`` as nodes are
+    created, so a search touches only the posting lists of the query's
+    trigrams instead of walking the whole library. Substring matches rank
+    first; names sharing most of the query's trigrams are returned as
+    typo-tolerant matches after them.
+    """
+
+    def __init__(self):
+        # Parallel lists indexed by entry id
+        self._names = []
+        self._lowered = []
+        self._lengths = []
+        self._paths = []
+        self._types = []
+        self._by_path = {}  # {path tuple: entry id}
+        self._postings = defaultdict(set)  # {trigram: {entry id}}
+
+    @classmethod
+    def build(cls, data: dict) -> "TrigramIndex":
+        index = cls()
+        index.add_subtree(data, ())
+        return index
+
+    def __len__(self):
+        return len(self._by_path)
+
+    def add(self, path, item_type="folder"):
+        """Indexes (or re-types) the node at ``path``."""
+        path = tuple(path)
+        entry_id = self._by_path.get(path)
+        if entry_id is not None:
+            self._types[entry_id] = item_type
+            return
+        name = path[-1]
+        entry_id = len(self._names)
+        self._names.append(name)
+        self._lowered.append(name.lower())
+        self._lengths.append(len(name))
+        self._paths.append(path)
+        self._types.append(item_type)
+        self._by_path[path] = entry_id
+        for gram in trigrams(name):
+            self._postings[gram].add(entry_id)
+
+    def add_subtree(self, node: dict, path):
+        """Indexes every folder/lecture below ``node`` (which sits at ``path``)."""
+        for name, child in iter_children(node):
+            child_path = tuple(path) + (name,)
+            self.add(child_path, child.get("type", "folder"))
+            self.add_subtree(child, child_path)
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> list:
+        """Returns [(name, path list, item_type)] best match first.
+
+        Order: names starting with the query, then names containing it
+        (shortest first within each group, so an exact match leads), then
+        fuzzy matches by trigram similarity.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        grams = trigrams(query)
+        if grams:
+            # Every trigram of a substring match is in the name: intersect, smallest first.
+            postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings) if postings[0] else ()
+        else:
+            # One- or two-letter queries are too short for trigrams: scan the names.
+            candidates = range(len(self._names))
+
+        lowered = self._lowered
+        matches = [i for i in candidates if query in lowered[i]]
+        prefixed = [i for i in matches if lowered[i].startswith(query)]
+        ranked = heapq.nsmallest(limit, prefixed, key=self._lengths.__getitem__)
+        if len(ranked) < limit:
+            prefixed = set(prefixed)
+            contained = [i for i in matches if i not in prefixed]
+            ranked += heapq.nsmallest(limit - len(ranked), contained, key=self._lengths.__getitem__)
+        if len(ranked) < limit and grams:
+            ranked += self._fuzzy(grams, set(matches), limit - len(ranked))
+        return [(self._names[i], list(self._paths[i]), self._types[i]) for i in ranked]
+
+    def _fuzzy(self, grams, exclude, limit):
+        """Typo-tolerant matches: ids sharing at least MIN_SIMILARITY of the query's trigrams."""
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        needed = MIN_SIMILARITY * len(grams)
+        scored = [(-count, self._lengths[i], i) for i, count in shared.items()
+                  if count >= needed and i not in exclude]
+        return [i for _, _, i in heapq.nsmallest(limit, scored)]
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens of ``text`` without stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+class NotesIndex:
+    """Persistent inverted index over lecture notes, ranked with BM25.
+
+    One row per notes file (its lecture path, length and text for
+    snippets) plus a ``postings`` table of term frequencies. Notes are
+    (re)indexed one at a time as they are generated, saved or fetched;
+    re-adding unchanged text is a no-op.
+    """
+
+    def __init__(self, path: str = NOTES_INDEX_DB_FILE) -> None:
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS notes (
+                notes_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                notes_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, notes_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_notes ON postings (notes_id);"""
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def add(self, notes_id: str, path, content: str) -> bool:
+        """Indexes one notes file. Returns False if it was already up to date."""
+        if not notes_id or content is None:
+            return False
+        path_json = json.dumps(list(path), ensure_ascii=False)
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        terms = Counter(tokenize(content))
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT digest, path FROM notes WHERE notes_id = ?", (notes_id,)).fetchone()
+            if row == (digest, path_json):
+                return False
+            # A lecture has one notes file: drop whatever was indexed for it before
+            stale = [r[0] for r in self._conn.execute(
+                "SELECT notes_id FROM notes WHERE path = ?", (path_json,))]
+            for old_id in set(stale) | {notes_id}:
+                self._delete(old_id)
+            self._conn.execute(
+                "INSERT INTO notes (notes_id, path, length, digest, content) VALUES (?, ?, ?, ?, ?)",
+                (notes_id, path_json, sum(terms.values()), digest, content),
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (term, notes_id, tf) VALUES (?, ?, ?)",
+                [(term, notes_id, tf) for term, tf in terms.items()],
+            )
+        return True
+
+    def remove(self, notes_id: str) -> None:
+        with self._lock, self._conn:
+            self._delete(notes_id)
+
+    def _delete(self, notes_id):
+        self._conn.execute("DELETE FROM postings WHERE notes_id = ?", (notes_id,))
+        self._conn.execute("DELETE FROM notes WHERE notes_id = ?", (notes_id,))
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Returns [{"notes_id", "path", "score", "snippet"}], best match first."""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        marks = ",".join("?" * len(terms))
+        with self._lock:
+            count, avg_length = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM notes").fetchone()
+            if not count:
+                return []
+            rows = self._conn.execute(
+                f"SELECT p.term, p.notes_id, p.tf, n.length FROM postings p "
+                f"JOIN notes n USING (notes_id) WHERE p.term IN ({marks})", terms).fetchall()
+
+            by_term = defaultdict(list)
+            for term, notes_id, tf, length in rows:
+                by_term[term].append((notes_id, tf, length))
+            scores = Counter()
+            for term, hits in by_term.items():
+                idf = math.log(1 + (count - len(hits) + 0.5) / (len(hits) + 0.5))
+                for notes_id, tf, length in hits:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                    scores[notes_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            results = []
+            for notes_id, score in scores.most_common(limit):
+                path, content = self._conn.execute(
+                    "SELECT path, content FROM notes WHERE notes_id = ?", (notes_id,)).fetchone()
+                results.append({
+                    "notes_id": notes_id,
+                    "path": json.loads(path),
+                    "score": score,
+                    "snippet": make_snippet(content, terms),
+                })
+        return results
+
+
+def make_snippet(content: str, terms, width: int = SNIPPET_CHARS) -> str:
+    """A window of ``content`` around the first query term, with terms in bold."""
+    pattern = re.compile(r"\b(" + "|".join(map(re.escape, terms)) + r")\b", re.IGNORECASE)
+    match = pattern.search(content)
+    start = max(0, match.start() - width // 3) if match else 0
+    window = " ".join(content[start:start + width].split())
+    window = pattern.sub(r"**\1**", window)
+    return ("…" if start else "") + window + ("…" if start + width < len(content) else "")
+
+
+@lru_cache(maxsize=1)
+def notes_index() -> NotesIndex:
+    """The process-wide notes index (a local file shared by all sessions)."""
+    return NotesIndex()
@@ -0,0 +1,107 @@
+import math
+import zlib
+from collections import Counter
+
+from modules.search_index import BM25_B, BM25_K1, tokenize
+
+# CONSTANTS
+SHINGLE_SIZE = 5  # words per shingle
+DUPLICATE_JACCARD = 0.8  # pages at least this similar to a kept page are dropped
+CENTRALITY_WEIGHT = 0.5  # how much "typical of the deck" counts next to the query score
+SUMMARY_BOOST = 0.5
+SUMMARY_CUES = {"summary", "conclusion", "recap", "important", "exam", "key", "formula", "formulas"}
+MIN_PAGE_CHARS = 20  # title-only / blank slides
+
+
+def shingles(tokens) -> set:
+    """Hashed word ``SHINGLE_SIZE``-grams of a page."""
+    if len(tokens) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))} if tokens else set()
+    return {zlib.crc32(" ".join(tokens[i:i + SHINGLE_SIZE]).encode("utf-8"))
+            for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def score_pages(pages, query: str) -> list:
+    """Relevance of each page: BM25 against ``query`` plus similarity to the deck as a whole.
+
+    Both parts are scaled to 0..1; pages with summary cues get a boost.
+    """
+    docs = [Counter(tokenize(page)) for page in pages]
+    n = len(docs)
+    if not n:
+        return []
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = sum(lengths) / n or 1
+    df = Counter(term for doc in docs for term in doc)
+    idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    query_terms = set(tokenize(query))
+    bm25 = []
+    for doc, length in zip(docs, lengths):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+        bm25.append(sum(idf[t] * doc[t] * (BM25_K1 + 1) / (doc[t] + norm)
+                        for t in query_terms if t in doc))
+
+    # Cosine similarity of each page's TF-IDF vector to the deck's centroid
+    centroid = Counter()
+    vectors = []
+    for doc in docs:
+        vector = {t: tf * idf[t] for t, tf in doc.items()}
+        vectors.append(vector)
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(v * v for v in centroid.values())) or 1
+    centrality = []
+    for vector in vectors:
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1
+        centrality.append(sum(w * centroid[t] for t, w in vector.items()) / (norm * centroid_norm))
+
+    top_bm25 = max(bm25) or 1
+    top_centrality = max(centrality) or 1
+    return [
+        b / top_bm25 + CENTRALITY_WEIGHT * c / top_centrality
+        + (SUMMARY_BOOST if SUMMARY_CUES & doc.keys() else 0.0)
+        for b, c, doc in zip(bm25, centrality, docs)
+    ]
+
+
+def select_slides(pages, query: str = "", budget: int = 30000) -> str:
+    """Best pages that fit in ``budget`` characters, joined in deck order.
+
+    Pages are packed best-first until the budget is full, skipping blank
+    pages and near-duplicates of an already chosen page (shingle Jaccard
+    >= DUPLICATE_JACCARD). Ranking only decides what is left out when the
+    deck does not fit; a deck under the budget comes back whole.
+    """
+    scores = score_pages(pages, query)
+    if not scores:
+        return ""
+    chosen, kept_shingles, used = [], [], 0
+    for i in sorted(range(len(pages)), key=lambda i: -scores[i]):
+        page = pages[i]
+        if len(page.strip()) < MIN_PAGE_CHARS or used + len(page) > budget:
+            continue
+        page_shingles = shingles(tokenize(page))
+        if any(jaccard(page_shingles, kept) >= DUPLICATE_JACCARD for kept in kept_shingles):
+            continue
+        chosen.append(i)
+        kept_shingles.append(page_shingles)
+        used += len(page)
+    return "".join(pages[i] for i in sorted(chosen))
+
+
+def distinct_pages(pages) -> list:
+    """Pages in deck order, minus blank ones and near-duplicates of an earlier page."""
+    kept, kept_shingles = [], []
+    for page in pages:
+        if len(page.strip()) < MIN_PAGE_CHARS:
+            continue
+        page_shingles = shingles(tokenize(page))
+        if any(jaccard(page_shingles, seen) >= DUPLICATE_JACCARD for seen in kept_shingles):
+            continue
+        kept.append(page)
+        kept_shingles.append(page_shingles)
+    return kept
@@ -1 +1,733 @@
-
\ No newline at end of file
+import json
+import sqlite3
+import threading
+import time
+
+# CONSTANTS
+MIRROR_DB_FILE = "studyos_mirror.db"
+NODE_MIRROR_DB_FILE = "studyos_nodes.db"
+REVISION_LOG_DB_FILE = "studyos_revisions.db"
+CONTENT_CACHE_DB_FILE = "studyos_cache.db"
+SYNC_INTERVAL = 30  # seconds between background push/pull rounds
+RESYNC_TTL = 600  # seconds a listener-fed mirror goes without a full pull
+COALESCE_WINDOW = 0.5  # seconds to gather a burst of saves into one push
+
+
+class LocalMirror:
+    """Durable local copy of the study tree, one row per top-level document.
+
+    Every write lands here synchronously (local-disk time). Rows changed
+    since the last push are flagged ``dirty`` so the replicator knows what
+    to send to Firestore; deleted documents are kept as tombstones until
+    the delete has been pushed.
+
+    Conflicts are resolved per document by timestamp: ``local_ts`` is when
+    we last wrote the row, ``remote_ts`` the Firestore ``update_time`` we
+    last saw. The newer side wins.
+
+    With ``parent_key`` set (per-node layout) each row also records its
+    parent id, so a folder's children can be listed without loading the
+    whole tree, and the mirror remembers which folders it has fetched.
+    """
+
+    def __init__(self, path: str = MIRROR_DB_FILE, parent_key: str | None = None) -> None:
+        self._parent_key = parent_key
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                payload TEXT,
+                local_ts REAL NOT NULL DEFAULT 0,
+                remote_ts REAL,
+                dirty INTEGER NOT NULL DEFAULT 0,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                parent TEXT
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "parent" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN parent TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_parent ON documents(parent)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS loaded_parents (parent TEXT PRIMARY KEY)")
+        self._conn.commit()
+        # {doc_id: payload json} of live rows, so unchanged docs skip the disk
+        self._payloads = {
+            doc_id: payload
+            for doc_id, payload in self._conn.execute(
+                "SELECT doc_id, payload FROM documents WHERE deleted = 0")
+        }
+        # Bumped on every content change; {doc_id: version of its last change}
+        self._version = 0
+        self._changed_at = {}
+
+    @property
+    def scoped(self) -> bool:
+        """True for a per-node mirror that is loaded folder by folder."""
+        return self._parent_key is not None
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone()
+        return row is None
+
+    def load(self) -> dict:
+        """Returns the tree as {doc_id: payload}, without tombstones."""
+        with self._lock:
+            return {doc_id: json.loads(payload) for doc_id, payload in self._payloads.items()}
+
+    @property
+    def version(self) -> int:
+        """Counter that moves whenever a row's content changes."""
+        return self._version
+
+    def changes_since(self, version: int) -> tuple:
+        """Returns (current version, {doc_id: (payload or None, remote_ts)}).
+
+        Covers the rows whose content changed after ``version``; deleted
+        rows map to (None, None). Lets a session holding a ``snapshot``
+        catch up without reading the whole mirror again.
+        """
+        changes = {}
+        with self._lock:
+            for doc_id, changed_at in self._changed_at.items():
+                if changed_at <= version:
+                    continue
+                if doc_id not in self._payloads:
+                    changes[doc_id] = (None, None)
+                    continue
+                row = self._conn.execute(
+                    "SELECT remote_ts FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+                changes[doc_id] = (json.loads(self._payloads[doc_id]), row[0] if row else None)
+            return self._version, changes
+
+    def _touch(self, doc_ids) -> None:
+        if doc_ids:
+            self._version += 1
+            for doc_id in doc_ids:
+                self._changed_at[doc_id] = self._version
+
+    def snapshot(self, parent: str | None = None) -> dict:
+        """Returns {doc_id: (payload, remote_ts)} of the live rows.
+
+        With ``parent`` only that folder's children are read. ``remote_ts``
+        is the Firestore version the row is based on; pass it back to
+        ``write_documents`` as ``base`` when saving edits made on this copy.
+        """
+        query = "SELECT doc_id, remote_ts FROM documents WHERE deleted = 0"
+        params = ()
+        if parent is not None:
+            query += " AND parent = ?"
+            params = (parent,)
+        with self._lock:
+            return {
+                doc_id: (json.loads(self._payloads[doc_id]), remote_ts)
+                for doc_id, remote_ts in self._conn.execute(query, params)
+            }
+
+    def write_tree(self, data: dict) -> list:
+        """Stores the whole tree, touching only rows whose content changed.
+
+        Documents missing from ``data`` become tombstones. Returns the ids
+        that changed.
+        """
+        return self.write_documents(data, set(self._payloads) - {str(k) for k in data})
+
+    def write_documents(self, docs: dict, deleted=(), base=None) -> list:
+        """Upserts ``docs`` and tombstones ``deleted``; other rows are untouched.
+
+        ``base`` maps doc_id -> the ``remote_ts`` of the copy the edit was
+        made on (see ``snapshot``). Written rows are stamped with it, so a
+        remote version the writer never saw still counts as new and goes
+        through the usual conflict check in ``apply_remote``.
+
+        Returns the ids that changed.
+        """
+        base = base or {}
+        now = time.time()
+        changed = []
+        with self._lock, self._conn:
+            for doc_id, payload in docs.items():
+                doc_id = str(doc_id)
+                encoded = json.dumps(payload or {}, ensure_ascii=False)
+                if self._payloads.get(doc_id) == encoded:
+                    continue
+                self._conn.execute(
+                    """INSERT INTO documents (doc_id, payload, local_ts, dirty, deleted, parent)
+                       VALUES (?, ?, ?, 1, 0, ?)
+                       ON CONFLICT(doc_id) DO UPDATE SET
+                           payload = excluded.payload, local_ts = excluded.local_ts,
+                           dirty = 1, deleted = 0, parent = excluded.parent""",
+                    (doc_id, encoded, now, self._parent_of(payload)),
+                )
+                self._stamp_base(doc_id, base)
+                self._payloads[doc_id] = encoded
+                changed.append(doc_id)
+            for doc_id in deleted:
+                doc_id = str(doc_id)
+                if self._payloads.pop(doc_id, None) is None:
+                    continue
+                self._conn.execute(
+                    "UPDATE documents SET local_ts = ?, dirty = 1, deleted = 1 WHERE doc_id = ?",
+                    (now, doc_id),
+                )
+                self._stamp_base(doc_id, base)
+                changed.append(doc_id)
+            self._touch(changed)
+        return changed
+
+    def _stamp_base(self, doc_id, base):
+        if doc_id in base:
+            self._conn.execute(
+                "UPDATE documents SET remote_ts = ? WHERE doc_id = ?", (base[doc_id], doc_id))
+
+    def pending_count(self) -> int:
+        """Number of rows waiting to be pushed."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents WHERE dirty = 1").fetchone()[0]
+
+    def children(self, parent_id: str) -> dict:
+        """Returns {doc_id: payload} of the live rows under ``parent_id``."""
+        return {doc_id: payload for doc_id, (payload, _) in self.snapshot(parent_id).items()}
+
+    def subtree_ids(self, doc_id: str) -> list:
+        """Returns ``doc_id`` and the ids of every live row below it."""
+        with self._lock:
+            rows = self._conn.execute(
+                """WITH RECURSIVE sub(id) AS (
+                       SELECT ?
+                       UNION SELECT d.doc_id FROM documents d JOIN sub ON d.parent = sub.id
+                       WHERE d.deleted = 0
+                   ) SELECT id FROM sub""",
+                (doc_id,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_loaded(self, parent_id: str) -> None:
+        """Remembers that every child of ``parent_id`` has been fetched."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO loaded_parents (parent) VALUES (?)", (parent_id,))
+
+    def is_loaded(self, parent_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM loaded_parents WHERE parent = ?", (parent_id,)).fetchone()
+        return row is not None
+
+    def mark_all_loaded(self) -> None:
+        """Remembers that every row's children have been fetched (after a full pull)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR IGNORE INTO loaded_parents (parent)
+                   SELECT doc_id FROM documents WHERE deleted = 0
+                   UNION SELECT parent FROM documents WHERE parent IS NOT NULL""")
+
+    def _parent_of(self, payload):
+        if self._parent_key and isinstance(payload, dict):
+            return payload.get(self._parent_key)
+        return None
+
+    def pending(self) -> tuple:
+        """Returns (upserts, deletes, stamps) for rows awaiting a push.
+
+        ``stamps`` maps doc_id -> local_ts so ``mark_pushed`` can tell
+        whether the row was edited again while the push was in flight.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, payload, local_ts, deleted FROM documents WHERE dirty = 1"
+            ).fetchall()
+        upserts, deletes, stamps = {}, [], {}
+        for doc_id, payload, local_ts, deleted in rows:
+            stamps[doc_id] = local_ts
+            if deleted:
+                deletes.append(doc_id)
+            else:
+                upserts[doc_id] = json.loads(payload)
+        return upserts, deletes, stamps
+
+    def mark_pushed(self, doc_id: str, local_ts: float, update_time=None) -> None:
+        """Records a successful push of the row as it was at ``local_ts``.
+
+        The dirty flag stays set if the row changed again meanwhile.
+        ``update_time`` is the version Firestore assigned to our write, so
+        the next pull does not mistake our own write for a remote edit.
+        """
+        remote_ts = _to_epoch(update_time)
+        with self._lock, self._conn:
+            if remote_ts is not None:
+                self._conn.execute(
+                    "UPDATE documents SET remote_ts = ? WHERE doc_id = ?", (remote_ts, doc_id))
+            self._conn.execute(
+                "UPDATE documents SET dirty = 0 WHERE doc_id = ? AND local_ts = ?",
+                (doc_id, local_ts),
+            )
+            self._conn.execute(
+                "DELETE FROM documents WHERE doc_id = ? AND deleted = 1 AND dirty = 0",
+                (doc_id,),
+            )
+
+    def apply_remote(self, remote: dict, parent: str | None = None, removed=None) -> list:
+        """Merges a Firestore pull of {doc_id: (payload, update_time)}.
+
+        A remote document is taken when it changed since we last saw it and
+        either we have no unpushed edit or the remote edit is newer. Clean
+        rows that vanished remotely are deleted; with ``parent`` given, the
+        pull only covered that folder's children and only they are
+        considered. A listener delta passes ``removed`` instead, and only
+        those ids are deleted. Returns the ids that changed locally.
+        """
+        changed = []
+        query = "SELECT doc_id, remote_ts, local_ts, dirty, deleted FROM documents"
+        params = ()
+        if removed is not None:
+            query += " WHERE 0"
+        elif parent is not None:
+            query += " WHERE parent = ?"
+            params = (parent,)
+        with self._lock, self._conn:
+            rows = {
+                doc_id: (remote_ts, local_ts, dirty, deleted)
+                for doc_id, remote_ts, local_ts, dirty, deleted in self._conn.execute(query, params)
+            }
+            for doc_id in (remote.keys() | set(removed or ())) - rows.keys():
+                row = self._conn.execute(
+                    "SELECT remote_ts, local_ts, dirty, deleted FROM documents WHERE doc_id = ?",
+                    (doc_id,),
+                ).fetchone()
+                if row is not None:
+                    rows[doc_id] = row
+            for doc_id, (payload, update_time) in remote.items():
+                remote_ts = _to_epoch(update_time)
+                seen_ts, local_ts, dirty, _ = rows.get(doc_id, (None, 0.0, 0, 0))
+                if seen_ts is not None and remote_ts is not None and remote_ts <= seen_ts:
+                    continue  # nothing new remotely
+                if dirty and remote_ts is not None and local_ts >= remote_ts:
+                    # Our edit is newer: keep it, just remember the remote version.
+                    self._conn.execute(
+                        "UPDATE documents SET remote_ts = ? WHERE doc_id = ?", (remote_ts, doc_id))
+                    continue
+                encoded = json.dumps(payload or {}, ensure_ascii=False)
+                self._conn.execute(
+                    """INSERT INTO documents (doc_id, payload, local_ts, remote_ts, dirty, deleted, parent)
+                       VALUES (?, ?, ?, ?, 0, 0, ?)
+                       ON CONFLICT(doc_id) DO UPDATE SET
+                           payload = excluded.payload, local_ts = excluded.local_ts,
+                           remote_ts = excluded.remote_ts, dirty = 0, deleted = 0,
+                           parent = excluded.parent""",
+                    (doc_id, encoded, remote_ts or 0.0, remote_ts, self._parent_of(payload)),
+                )
+                if self._payloads.get(doc_id) != encoded:
+                    changed.append(doc_id)
+                self._payloads[doc_id] = encoded
+            for doc_id, (seen_ts, _, dirty, _) in rows.items():
+                if doc_id in remote or dirty or seen_ts is None:
+                    continue
+                self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                if self._payloads.pop(doc_id, None) is not None:
+                    changed.append(doc_id)
+            self._touch(changed)
+        return changed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MirrorReplicator:
+    """Background thread that keeps a ``LocalMirror`` in sync with Firestore.
+
+    Each round pushes dirty rows through ``repository.save_documents``.
+    Remote changes arrive through ``repository.watch`` (a Firestore
+    snapshot listener) when available, with a full ``get_versions`` pull
+    every ``ttl`` seconds as a safety net. Without a listener every round
+    also pulls; a per-node mirror only re-reads the folders browsed since
+    the last round (see ``focus``). Failures (offline, slow network) are logged and
+    retried next round; the mirror keeps serving reads and writes meanwhile.
+
+    The mirror is created once per process, so every Streamlit session
+    reads the library from this shared in-memory copy.
+    """
+
+    def __init__(self, mirror: LocalMirror, repository, interval: float = SYNC_INTERVAL,
+                 ttl: float = RESYNC_TTL, coalesce: float = COALESCE_WINDOW) -> None:
+        self._mirror = mirror
+        self._repository = repository
+        self._interval = interval
+        self._ttl = ttl
+        self._coalesce = coalesce
+        self._push_lock = threading.Lock()
+        self._metrics = {"pushes": 0, "pushed_docs": 0, "last_push_ms": 0.0, "total_push_ms": 0.0}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._watch = None
+        self._last_pull = None
+        self._outboxes = []
+        self._focus_lock = threading.Lock()
+        self._focused = set()
+        self.last_error = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.listen()
+            self._thread = threading.Thread(target=self._run, name="mirror-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def listening(self) -> bool:
+        """True while a snapshot listener is feeding remote changes."""
+        return self._watch is not None and getattr(self._watch, "is_active", True)
+
+    def listen(self) -> bool:
+        """Attaches the snapshot listener. Returns False if polling is needed."""
+        watch = getattr(self._repository, "watch", None)
+        if self._watch is not None or watch is None or self._mirror.scoped:
+            return self.listening
+        try:
+            self._watch = watch(self._on_remote_change)
+        except Exception as e:
+            print(f"Snapshot listener unavailable, polling instead: {e}")
+        return self.listening
+
+    def _on_remote_change(self, changed: dict, removed: list) -> None:
+        self._mirror.apply_remote(changed, removed=removed)
+
+    def add_outbox(self, flush) -> None:
+        """Drains another local queue on the sync thread, after each push.
+
+        ``flush()`` uploads what is waiting and returns True once the queue
+        is empty. Call ``notify()`` after queueing something.
+        """
+        self._outboxes.append(flush)
+
+    def focus(self, parent_id: str) -> None:
+        """Marks a folder as on screen, so the next pull re-reads its children."""
+        with self._focus_lock:
+            self._focused.add(parent_id)
+
+    def notify(self) -> None:
+        """Asks for a push soon, e.g. right after a local write."""
+        self._wake.set()
+
+    def flush(self) -> bool:
+        """Pushes everything pending right now, in the calling thread.
+
+        For shutdown and for critical paths that must not wait for the
+        coalescing window. Returns True when nothing is left unpushed.
+        """
+        return self.push()
+
+    def metrics(self) -> dict:
+        """Queue depth (unpushed documents) and push counts/latency."""
+        metrics = dict(self._metrics)
+        metrics["queue_depth"] = self._mirror.pending_count()
+        pushes = metrics["pushes"]
+        metrics["avg_push_ms"] = metrics.pop("total_push_ms") / pushes if pushes else 0.0
+        return metrics
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sync_once()
+            if self._wake.wait(self._interval) and not self._stop.is_set():
+                # A save arrived: let the rest of the burst land before pushing.
+                self._stop.wait(self._coalesce)
+            self._wake.clear()
+
+    def sync_once(self) -> bool:
+        """One push + pull round. Returns True when both succeeded.
+
+        Registered outboxes are drained right after the push. The pull runs
+        even if the push failed, so remote changes keep arriving while some
+        local write is stuck. It is skipped while a listener is active and
+        the last full pull is younger than the TTL.
+        """
+        pushed = self.push()
+        for flush in self._outboxes:
+            pushed = flush() and pushed
+        push_error = self.last_error
+        fresh = self._last_pull is not None and time.monotonic() - self._last_pull < self._ttl
+        if self.listening and fresh:
+            return pushed
+        pulled = self.pull()
+        if not pushed:
+            self.last_error = push_error
+        return pulled and pushed
+
+    def push(self) -> bool:
+        with self._push_lock:
+            upserts, deletes, stamps = self._mirror.pending()
+            if not upserts and not deletes:
+                return True
+            started = time.perf_counter()
+            try:
+                result = self._repository.save_documents(upserts, deletes)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Mirror push failed: {e}")
+                return False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._metrics["pushes"] += 1
+            self._metrics["pushed_docs"] += len(result.written)
+            self._metrics["last_push_ms"] = elapsed_ms
+            self._metrics["total_push_ms"] += elapsed_ms
+            for doc_id in list(result.written) + list(result.skipped):
+                self._mirror.mark_pushed(doc_id, stamps[doc_id], result.versions.get(doc_id))
+            if result.failed:
+                self.last_error = next(iter(result.failed.values()))
+                return False
+            return True
+
+    def fetch_children(self, parent_id: str) -> bool:
+        """Pulls one folder's children into the mirror (per-node layout)."""
+        try:
+            remote = self._repository.get_children_versions(parent_id)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Could not fetch folder from Firestore: {e}")
+            return False
+        self._mirror.apply_remote(remote, parent=parent_id)
+        self._mirror.mark_loaded(parent_id)
+        return True
+
+    def fetch_all(self) -> bool:
+        """Pulls every document with a single read and marks all folders loaded.
+
+        For a per-node mirror this replaces one children query per folder.
+        """
+        try:
+            remote = self._repository.get_versions()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Could not fetch the library from Firestore: {e}")
+            return False
+        self._mirror.apply_remote(remote)
+        self._mirror.mark_all_loaded()
+        return True
+
+    def pull(self) -> bool:
+        with self._focus_lock:
+            focused, self._focused = self._focused, set()
+        try:
+            if self._mirror.scoped:
+                for parent in list(focused):
+                    remote = self._repository.get_children_versions(parent)
+                    self._mirror.apply_remote(remote, parent=parent)
+                    focused.discard(parent)
+            else:
+                self._mirror.apply_remote(self._repository.get_versions())
+        except Exception as e:
+            with self._focus_lock:
+                self._focused |= focused  # retried next round
+            self.last_error = str(e)
+            print(f"Mirror pull failed: {e}")
+            return False
+        self._last_pull = time.monotonic()
+        self.last_error = None
+        return True
+
+
+class KeyValueStore:
+    """Small persistent {key: JSON value} map, kept next to the mirror.
+
+    Each ``namespace`` gets its own rows in a shared ``kv`` table. Values
+    are cached in memory, so reads never touch the disk after start-up.
+    """
+
+    def __init__(self, namespace: str, path: str = MIRROR_DB_FILE) -> None:
+        self._namespace = namespace
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self._conn.commit()
+        self._values = {
+            key: json.loads(value)
+            for key, value in self._conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ?", (namespace,))
+        }
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, values: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                [(self._namespace, k, json.dumps(v, ensure_ascii=False)) for k, v in values.items()],
+            )
+            self._values.update(values)
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ?", (self._namespace, key))
+            self._values.pop(key, None)
+
+    def items(self) -> list:
+        with self._lock:
+            return list(self._values.items())
+
+
+class RevisionLog:
+    """Outbox of study sessions logged on this device, one row per session.
+
+    Sessions wait here until they reach their Firestore subcollection
+    (see ``data_manager.flush_sessions``), so logging works offline and a
+    failed upload is retried. Rows are read back a page at a time.
+    """
+
+    def __init__(self, path: str = REVISION_LOG_DB_FILE) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS revisions (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                node_id TEXT NOT NULL,
+                entry TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS revisions_by_node ON revisions (node_id, seq);"""
+        )
+        self._conn.commit()
+
+    def append(self, node_id: str, entry: dict) -> None:
+        self.append_many(node_id, [entry])
+
+    def append_many(self, node_id: str, entries: list) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO revisions (node_id, entry) VALUES (?, ?)",
+                [(node_id, json.dumps(entry, ensure_ascii=False)) for entry in entries],
+            )
+
+    def count(self, node_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM revisions WHERE node_id = ?", (node_id,)).fetchone()[0]
+
+    def page(self, node_id: str, page: int = 0, page_size: int = 20) -> list:
+        """Entries for ``node_id``, newest first, ``page_size`` at a time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM revisions WHERE node_id = ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (node_id, page_size, page * page_size),
+            ).fetchall()
+        return [json.loads(entry) for (entry,) in rows]
+
+    def pending(self, limit: int = 500) -> list:
+        """[(seq, node_id, entry)] for the oldest ``limit`` rows."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, node_id, entry FROM revisions ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, node_id, json.loads(entry)) for seq, node_id, entry in rows]
+
+    def remove(self, seqs) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM revisions WHERE seq = ?", [(seq,) for seq in seqs])
+
+
+class ContentCache:
+    """Size-bounded LRU of text values keyed by content hash, kept on disk.
+
+    Each ``namespace`` is bounded separately: once its values exceed
+    ``max_bytes`` the least recently used entries are dropped.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, path: str = CONTENT_CACHE_DB_FILE) -> None:
+        self._namespace = namespace
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                used INTEGER NOT NULL,  -- logical clock, higher = more recent
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                (self._namespace, key)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE cache SET used = (SELECT MAX(used) + 1 FROM cache) WHERE namespace = ? AND key = ?",
+                (self._namespace, key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, size, used) "
+                "VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(used), 0) + 1 FROM cache))",
+                (self._namespace, key, value, size))
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (self._namespace, key))
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+                (self._namespace,)).fetchone()[0]
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+            (self._namespace,)).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM cache WHERE namespace = ? ORDER BY used",
+                (self._namespace,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (self._namespace, key))
+            total -= size
+
+
+def _to_epoch(update_time):
+    """Firestore timestamps (datetime-like) -> float seconds."""
+    if update_time is None:
+        return None
+    if isinstance(update_time, (int, float)):
+        return float(update_time)
+    return update_time.timestamp()
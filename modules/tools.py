@@ -1,63 +1,227 @@
+import hashlib
 import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import streamlit as st
-from modules.data_manager import read_notes_from_drive, load_user_stats
+from modules.data_manager import (
+    read_notes_from_drive, notes_version, iter_children, load_user_stats
+)
+from modules.storage import KeyValueStore
+
+CODEX_WORKERS = 8  # concurrent Drive round trips while building a codex
+
+_MATH_SPECIAL = re.compile(r'[\\$`]')
+_SPACING_COMMANDS = re.compile(r'\\(?:[,;:! ]|q?quad(?![A-Za-z]))')
+_LATEX_TOKEN = re.compile(r'\\[A-Za-z]+|\\.|\S')
+_DOLLAR = re.compile(r'\$')
+_BLANK_LINE = re.compile(r'(?=\n\n)')
+FORMULA_PARSER_VERSION = 3  # bump when extraction changes so indexed notes are re-parsed
+
+def iter_math(text):
+    """
+    Yields (kind, body) for every math span in markdown, in one left-to-right scan.
+    kind is "display" for $$...$$ and \\[...\\], "inline" for $...$ and \\(...\\).
+    Escaped dollars (\\$) and `code` spans / fenced blocks are skipped.
+    An opener that is never closed (a stray backtick or $$) is literal text.
+    """
+    n = len(text)
+    i = 0
+    inline = _inline_bounds(text)
+    unclosed = set()  # closers with no occurrence left, so they aren't searched again
+    while True:
+        match = _MATH_SPECIAL.search(text, i)
+        if match is None:
+            return
+        i = match.start()
+        c = text[i]
+
+        if c == '\\':
+            opener = text[i + 1:i + 2]
+            if opener in ('[', '('):
+                closer = '\\]' if opener == '[' else '\\)'
+                end = -1 if closer in unclosed else text.find(closer, i + 2)
+                if end != -1:
+                    yield ("display" if opener == '[' else "inline"), text[i + 2:end]
+                    i = end + 2
+                    continue
+                unclosed.add(closer)
+            i += 2  # escaped character, e.g. \\$
+        elif c == '`':
+            run = _run_length(text, i, '`')
+            fence = '`' * run
+            end = -1 if fence in unclosed else text.find(fence, i + run)
+            if end == -1:
+                unclosed.add(fence)
+                i += run  # a stray backtick
+            else:
+                i = end + run
+        elif text.startswith('$$', i):
+            end = -1 if '$$' in unclosed else _find_unescaped(text, '$$', i + 2, n)
+            if end == -1:
+                unclosed.add('$$')
+                i += 2
+                continue
+            yield "display", text[i + 2:end]
+            i = end + 2
+        else:
+            end = _close_inline(text, i, *inline)
+            if end == -1:
+                i += 1  # a literal dollar (e.g. a price)
+                continue
+            yield "inline", text[i + 1:end]
+            i = end + 1
+
+def _run_length(text, i, char):
+    j = i
+    while j < len(text) and text[j] == char:
+        j += 1
+    return j - i
+
+def _find_unescaped(text, token, start, stop):
+    """Index of the next ``token`` in text[start:stop] not preceded by a backslash."""
+    while True:
+        end = text.find(token, start, stop)
+        if end == -1 or _backslashes_before(text, end) % 2 == 0:
+            return end
+        start = end + 1
+
+def _backslashes_before(text, i):
+    count = 0
+    while i > count and text[i - count - 1] == '\\':
+        count += 1
+    return count
+
+def _inline_bounds(text):
+    """Sorted offsets of the unescaped $ signs and of the blank lines in text.
+
+    Computed once per scan so each inline opener finds its closer by bisection.
+    """
+    dollars = [m.start() for m in _DOLLAR.finditer(text) if _backslashes_before(text, m.start()) % 2 == 0]
+    return dollars, [m.start() for m in _BLANK_LINE.finditer(text)]
+
+def _close_inline(text, i, dollars, blank_lines):
+    """Closing $ of inline math opened at i, or -1 if this $ is just a dollar sign.
+
+    Uses the pandoc rule: no space after the opener, no space before the
+    closer and no digit right after it. Inline math never spans a blank line.
+    ``dollars`` and ``blank_lines`` come from ``_inline_bounds(text)``.
+    """
+    if i + 1 >= len(text) or text[i + 1].isspace():
+        return -1
+    k = bisect_right(dollars, i)
+    if k == len(dollars):
+        return -1
+    end = dollars[k]
+    b = bisect_left(blank_lines, i)
+    if b < len(blank_lines) and blank_lines[b] < end:
+        return -1
+    if text[end - 1].isspace() or text[end + 1:end + 2].isdigit():
+        return -1
+    return end
+
+def normalize_formula(formula):
+    """Canonical form used for dedup: no spacing commands, no insignificant whitespace."""
+    tokens = _LATEX_TOKEN.findall(_SPACING_COMMANDS.sub(' ', formula))
+    parts = []
+    for prev, token in zip([""] + tokens, tokens):
+        # A space only matters between a control word and a following letter (\alpha x)
+        if prev[:1] == '\\' and prev[1:].isalpha() and token[:1].isalpha():
+            parts.append(' ')
+        parts.append(token)
+    return "".join(parts)
+
+def formula_key(formula):
+    return hashlib.sha1(normalize_formula(formula).encode('utf-8')).hexdigest()
 
 def extract_formulas_from_text(text):
     """
-    Finds all LaTeX equations in a markdown string.
-    Returns a list of formulas.
+    Finds all LaTeX equations ($$, $, \\[ \\], \\( \\)) in a markdown string.
+    Returns a list of formulas with whitespace collapsed, without repeats.
     """
-    # Regex for $$ ... $$ (Display Math)
-    display_math = re.findall(r'\$\$(.*?)\$\$', text, re.DOTALL)
-    # Regex for $ ... $ (Inline Math) - Optional, can be noisy
-    # inline_math = re.findall(r'\$(.*?)\$', text)
-    
-    return display_math
+    formulas = []
+    seen = set()
+    for _, body in iter_math(text):
+        formula = " ".join(body.split())
+        key = normalize_formula(formula)
+        if key and key not in seen:
+            seen.add(key)
+            formulas.append(formula)
+    return formulas
+
+def dedupe_formulas(lectures):
+    """
+    Merges [(source, formulas)] into one entry per unique formula.
+    Returns {key: {"formula", "sources"}} in first-seen order.
+    """
+    index = {}
+    for source, formulas in lectures:
+        for formula in formulas:
+            entry = index.setdefault(formula_key(formula), {"formula": formula, "sources": []})
+            if source not in entry["sources"]:
+                entry["sources"].append(source)
+    return index
 
-def generate_formula_codex(subject_name, subject_data):
+@lru_cache(maxsize=1)
+def _formula_index():
+    """Persisted {notes_id: {"md5", "parser", "formulas"}} so rebuilds skip unchanged notes."""
+    return KeyValueStore("formula_index")
+
+def lecture_formulas(notes_id):
+    """Formulas in one notes file, re-parsed only if the notes changed on Drive."""
+    index = _formula_index()
+    md5 = notes_version(notes_id)
+    cached = index.get(notes_id)
+    if (cached is not None and md5 is not None and cached["md5"] == md5
+            and cached.get("parser") == FORMULA_PARSER_VERSION):
+        return cached["formulas"]
+
+    content = read_notes_from_drive(notes_id, md5)
+    if content is None:
+        return cached["formulas"] if cached is not None else []
+    formulas = extract_formulas_from_text(content)
+    if md5 is not None:
+        index.set(notes_id, {"md5": md5, "parser": FORMULA_PARSER_VERSION, "formulas": formulas})
+    return formulas
+
+def _find_lectures(data, current_path, found):
+    """Collects (source, notes_id) for every lecture with notes, in tree order."""
+    notes_id = data.get("drive_ids", {}).get("notes_id")
+    if notes_id:
+        found.append((" > ".join(current_path), notes_id))
+    for key, val in iter_children(data):
+        _find_lectures(val, current_path + [key], found)
+    return found
+
+def generate_formula_codex(subject_name, subject_data, workers=CODEX_WORKERS):
     """
     Scans an entire subject folder (e.g., "Signals") for formulas.
+    Notes are fetched concurrently and unchanged lectures reuse their
+    indexed formulas instead of being downloaded again. Each distinct
+    formula is listed once, under the first lecture it appears in.
     """
-    compiled_formulas = []
-    total_notes = 0
-    
-    def traverse(data, current_path):
-        nonlocal total_notes
-        if isinstance(data, dict):
-            # Check if this is a lecture with notes
-            if "drive_ids" in data and "notes_id" in data["drive_ids"]:
-                notes_id = data["drive_ids"]["notes_id"]
-                if notes_id:
-                    # Download content from Cloud RAM
-                    content = read_notes_from_drive(notes_id)
-                    if content:
-                        formulas = extract_formulas_from_text(content)
-                        if formulas:
-                            compiled_formulas.append({
-                                "source": " > ".join(current_path),
-                                "formulas": formulas
-                            })
-                            total_notes += 1
-            
-            # Recurse
-            for key, val in data.items():
-                if key not in ["drive_ids", "type"]:
-                    traverse(val, current_path + [key])
+    lectures = _find_lectures(subject_data, [subject_name], [])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lecture_formulas, [notes_id for _, notes_id in lectures]))
+    with_formulas = [(source, formulas) for (source, _), formulas in zip(lectures, results) if formulas]
+    unique = dedupe_formulas(with_formulas)
 
-    # Start scanning
-    traverse(subject_data, [subject_name])
+    by_source = {}
+    for entry in unique.values():
+        by_source.setdefault(entry["sources"][0], []).append(entry)
     
     # Generate Markdown Report
-    report = f"# 📜 Formula Codex: {subject_name}\n"
-    report += f"*Compiled from {total_notes} Lecture Notes*\n\n---\n"
-    
-    for item in compiled_formulas:
-        report += f"### 📂 {item['source']}\n"
-        for form in item['formulas']:
-            report += f"$$ {form} $$\n\n"
-        report += "---\n"
+    parts = [f"# 📜 Formula Codex: {subject_name}\n",
+             f"*Compiled from {len(with_formulas)} Lecture Notes · {len(unique)} unique formulas*\n\n---\n"]
+    for source, entries in by_source.items():
+        parts.append(f"### 📂 {source}\n")
+        for entry in entries:
+            parts.append(f"$$ {entry['formula']} $$\n\n")
+            if len(entry["sources"]) > 1:
+                parts.append(f"*Also in: {', '.join(entry['sources'][1:])}*\n\n")
+        parts.append("---\n")
         
-    return report
+    return "".join(parts)
 
 def render_mistake_notebook():
     """
@@ -0,0 +1,308 @@
+import copy
+import datetime
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import parse_field_path
+
+
+# --- IN-PROCESS FIRESTORE STAND-IN ---
+# Implements just the client surface the modules use, so repository and
+# sync logic can be tested without the emulator.
+
+_clock = itertools.count(1)
+
+
+def _next_time():
+    """Server clock that is always ahead of the local wall clock."""
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        microseconds=next(_clock))
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data, update_time):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    def __init__(self, store, doc_id):
+        self._store = store
+        self.id = doc_id
+
+    def get(self):
+        data, ts = self._store.docs.get(self.id, (None, None))
+        return FakeSnapshot(self.id, data, ts)
+
+    def set(self, payload):
+        return self._store.write(self.id, copy.deepcopy(payload))
+
+    def update(self, changes):
+        if self.id not in self._store.docs:
+            raise NotFound(f"No document to update: {self.id}")
+        data = copy.deepcopy(self._store.docs[self.id][0])
+        for path, value in changes.items():
+            parts = parse_field_path(path)
+            node = data
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            if value is firestore.DELETE_FIELD:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = copy.deepcopy(value)
+        return self._store.write(self.id, data)
+
+    def collection(self, name):
+        return self._store._client.collection(f"{self._store.name}/{self.id}/{name}")
+
+    def delete(self):
+        ts = _next_time()
+        if self._store.docs.pop(self.id, None) is not None:
+            self._store.notify("REMOVED", FakeSnapshot(self.id, None, ts), ts)
+        return ts
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+        self._updated = []
+
+    def set(self, ref, payload):
+        self._ops.append(lambda: ref.set(payload))
+
+    def update(self, ref, changes):
+        self._updated.append(ref)
+        self._ops.append(lambda: ref.update(changes))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        self._client.commits.append(len(self._ops))
+        if len(self._ops) > 500:
+            raise ValueError("maximum 500 writes allowed per request")
+        if self._client.fail_commits:
+            self._client.fail_commits -= 1
+            raise RuntimeError("simulated outage")
+        for ref in self._updated:  # batches are atomic: check before applying anything
+            if ref.id not in ref._store.docs:
+                raise NotFound(f"No document to update: {ref.id}")
+        return [SimpleNamespace(update_time=op()) for op in self._ops]
+
+
+class FakeCollection:
+    def __init__(self, client, name=""):
+        self._client = client
+        self.name = name
+        self.docs = {}  # {doc_id: (data, update_time)}
+        self.streams = 0
+        self.listeners = []
+
+    def write(self, doc_id, data):
+        ts = _next_time()
+        kind = "MODIFIED" if doc_id in self.docs else "ADDED"
+        self.docs[doc_id] = (data, ts)
+        self.notify(kind, FakeSnapshot(doc_id, copy.deepcopy(data), ts), ts)
+        return ts
+
+    def on_snapshot(self, callback):
+        self.listeners.append(callback)
+        changes = [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=snap)
+                   for snap in self.stream()]
+        callback([], changes, _next_time())
+        return SimpleNamespace(unsubscribe=lambda: self.listeners.remove(callback), is_active=True)
+
+    def notify(self, kind, snapshot, read_time):
+        change = SimpleNamespace(type=SimpleNamespace(name=kind), document=snapshot)
+        for callback in list(self.listeners):
+            callback([], [change], read_time)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self, str(doc_id) if doc_id is not None else f"auto{next(_clock)}")
+
+    def stream(self):
+        self.streams += 1
+        if self._client.offline:
+            raise RuntimeError("network unreachable")
+        return [FakeSnapshot(k, copy.deepcopy(v[0]), v[1]) for k, v in list(self.docs.items())]
+
+    def where(self, filter):
+        return FakeQuery(self).where(filter)
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return FakeQuery(self).order_by(field_path, direction)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=None, start=0, count=None):
+        self._collection = collection
+        self._filters = filters
+        self._order = order
+        self._start = start
+        self._count = count
+
+    def _with(self, **changes):
+        state = {"filters": self._filters, "order": self._order,
+                 "start": self._start, "count": self._count, **changes}
+        return FakeQuery(self._collection, **state)
+
+    def where(self, filter):
+        assert filter.op_string == "=="
+        return self._with(filters=self._filters + (filter,))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._with(order=(field_path, direction == "DESCENDING"))
+
+    def offset(self, n):
+        return self._with(start=n)
+
+    def limit(self, n):
+        return self._with(count=n)
+
+    def stream(self, retry=None, timeout=None):
+        snaps = [
+            snap for snap in self._collection.stream()
+            if all(snap.to_dict().get(f.field_path) == f.value for f in self._filters)
+        ]
+        if self._order:
+            field_path, descending = self._order
+            snaps.sort(key=lambda snap: snap.to_dict().get(field_path), reverse=descending)
+        end = None if self._count is None else self._start + self._count
+        return snaps[self._start:end]
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.collections = {}
+        self.commits = []
+        self.fail_commits = 0
+        self.offline = False
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def fake_firestore():
+    return FakeFirestore()
+
+
+# --- IN-PROCESS DRIVE STAND-IN ---
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+        self.http = None
+
+    def execute(self, http=None):
+        return self._fn()
+
+
+class FakeDriveFiles:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q="", fields=None, orderBy=None, pageSize=None, pageToken=None):
+        def run():
+            self._drive.calls.append("list")
+            items = [f for f in self._drive.files.values() if self._drive.matches(f, q)]
+            return {"files": [dict(f) for f in items]}
+        return _Call(run)
+
+    def create(self, body, fields=None, media_body=None):
+        def run():
+            self._drive.calls.append("create")
+            file_id = f"id{len(self._drive.files) + 1}"
+            self._drive.files[file_id] = {
+                "id": file_id, "name": body["name"], "parents": body.get("parents", []),
+                "mimeType": body.get("mimeType", "text/plain"),
+                "createdTime": str(len(self._drive.files)),
+            }
+            if media_body is not None:
+                self._drive.store(file_id, media_body.getbytes(0, media_body.size()))
+            return {"id": file_id}
+        return _Call(run)
+
+    def update(self, fileId, media_body=None, fields=None):
+        def run():
+            self._drive.calls.append("update")
+            self._drive.store(fileId, media_body.getbytes(0, media_body.size()))
+            return {"id": fileId}
+        return _Call(run)
+
+    def get(self, fileId, fields=None):
+        def run():
+            self._drive.calls.append("get")
+            if fileId not in self._drive.files:
+                from googleapiclient.errors import HttpError
+                raise HttpError(SimpleNamespace(status=404, reason="Not Found"), b"")
+            return dict(self._drive.files[fileId])
+        return _Call(run)
+
+    def delete(self, fileId):
+        def run():
+            self._drive.calls.append("delete")
+            self._drive.files.pop(fileId)
+        return _Call(run)
+
+
+class FakeDrive:
+    """Understands the name / parent / mimeType clauses drive_sync sends."""
+
+    def __init__(self):
+        self.files = {}
+        self.contents = {}
+        self.calls = []
+
+    def store(self, file_id, data):
+        import hashlib
+        self.contents[file_id] = data
+        self.files[file_id]["md5Checksum"] = hashlib.md5(data).hexdigest()
+
+    def matches(self, item, q):
+        import re
+        for name in re.findall(r"name='((?:[^'\\]|\\.)*)'", q):
+            if item["name"] != name.replace("\\'", "'").replace("\\\\", "\\"):
+                return False
+        for parent in re.findall(r"'([^']+)' in parents", q):
+            if parent not in item["parents"]:
+                return False
+        for mime in re.findall(r"mimeType='([^']+)'", q):
+            if item["mimeType"] != mime:
+                return False
+        return True
+
+
+@pytest.fixture
+def fake_drive(tmp_path, monkeypatch):
+    from modules import drive_sync
+    from modules.storage import KeyValueStore
+
+    drive = FakeDrive()
+    service = SimpleNamespace(files=lambda: FakeDriveFiles(drive))
+    store = KeyValueStore("drive_folders", str(tmp_path / "kv.db"))
+    monkeypatch.setattr(drive_sync, "_thread_http", lambda: None)
+    monkeypatch.setattr(drive_sync, "_folder_cache", lambda: store)
+    monkeypatch.setattr(drive_sync, "authenticate", lambda: service)
+    cache = drive_sync.DriveFileCache(
+        str(tmp_path / "files"), index=KeyValueStore("drive_file_cache", str(tmp_path / "kv.db")))
+    monkeypatch.setattr(drive_sync, "file_cache", lambda: cache)
+
+    def download(_service, file_id):
+        drive.calls.append("download")
+        return drive.contents[file_id]
+    monkeypatch.setattr(drive_sync, "download_file", download)
+    drive.service = service
+    return drive
@@ -0,0 +1,212 @@
+from modules import ai_engine
+
+
+def _pdf(pages):
+    """A minimal valid PDF whose page i reads 'Page i'."""
+    n = len(pages)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                   " ".join(f"{3 + 2 * i} 0 R" for i in range(n)), n)]
+    font = 3 + 2 * n
+    for i, text in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 100] "
+                       f"/Contents {4 + 2 * i} 0 R /Resources << /Font << /F1 {font} 0 R >> >> >>")
+        stream = f"BT /F1 12 Tf 10 50 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+
+def test_budget_stops_reading_pages(tmp_path, monkeypatch):
+    path = tmp_path / "deck.pdf"
+    path.write_bytes(_pdf([f"Page {i}" for i in range(50)]))
+    read = []
+    iter_pages = ai_engine._iter_pages
+
+    def counting(stream, start, stop):
+        for number, text in iter_pages(stream, start, stop):
+            read.append(number)
+            yield number, text
+    monkeypatch.setattr(ai_engine, "_iter_pages", counting)
+
+    text = ai_engine.extract_text_from_pdf(str(path), max_chars=20)
+    assert text == "Page 0\nPage 1\nPage 2"[:20]
+    assert read == [0, 1, 2]
+    assert len(ai_engine.extract_text_from_pdf(str(path), max_tokens=3)) == 12
+
+
+def test_full_extraction_in_parallel_keeps_page_order(tmp_path):
+    path = tmp_path / "deck.pdf"
+    path.write_bytes(_pdf([f"Page {i}" for i in range(60)]))
+    text = ai_engine.extract_text_from_pdf(str(path), workers=2)
+    assert text.split("\n")[:-1] == [f"Page {i}" for i in range(60)]
+
+
+def test_identical_inputs_reuse_cached_notes(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from modules.storage import ContentCache
+
+    caches = {}
+    monkeypatch.setattr(ai_engine, "_cache", lambda ns: caches.setdefault(
+        ns, ContentCache(ns, 10_000, str(tmp_path / "cache.db"))))
+    monkeypatch.setattr(ai_engine, "load_teacher_profiles", lambda: {})
+    calls = []
+
+    class Model:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, inputs):
+            calls.append(inputs)
+            return SimpleNamespace(text=f"# Notes {len(calls)}")
+    monkeypatch.setattr(ai_engine.genai, "GenerativeModel", Model)
+
+    pdf = tmp_path / "deck.pdf"
+    pdf.write_bytes(_pdf(["Page 0", "Page 1"]))
+    assert ai_engine.generate_hybrid_notes(str(pdf)) == "# Notes 1"
+    assert ai_engine.generate_hybrid_notes(str(pdf)) == "# Notes 1"
+    assert len(calls) == 1
+    assert ai_engine.generate_hybrid_notes(str(pdf), use_cache=False) == "# Notes 2"
+
+
+def test_content_cache_evicts_least_recently_used(tmp_path):
+    from modules.storage import ContentCache
+
+    cache = ContentCache("notes", 10, str(tmp_path / "cache.db"))
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.get("a")
+    cache.set("c", "12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == "12345" and cache.size() == 10
+
+
+def test_long_decks_are_generated_in_chunks(tmp_path, monkeypatch):
+    from modules.storage import ContentCache
+
+    monkeypatch.setattr(ai_engine, "_cache", lambda ns: ContentCache(ns, 10_000, str(tmp_path / "cache.db")))
+    monkeypatch.setattr(ai_engine, "load_teacher_profiles", lambda: {})
+    monkeypatch.setattr(ai_engine, "PROMPT_CHAR_BUDGET", 100)
+    monkeypatch.setattr(ai_engine, "CHUNK_CHARS", 60)
+    calls = []
+
+    def model(inputs):
+        calls.append(inputs[0])
+        return "# Notes" if inputs[0].startswith("PARTIAL NOTES") else "part"
+
+    pdf = tmp_path / "deck.pdf"
+    pdf.write_bytes(_pdf([f"Slide number {i} about topic {i}" for i in range(10)]))
+    assert ai_engine.generate_hybrid_notes(str(pdf), model=model) == "# Notes"
+    assert len(calls) > 2 and "Slide number 9" in "".join(calls)
+
+
+def test_generation_stages_overlap_and_report_progress(tmp_path, monkeypatch):
+    import threading
+    import time
+    from modules.storage import ContentCache
+
+    monkeypatch.setattr(ai_engine, "_cache", lambda ns: ContentCache(ns, 10_000, str(tmp_path / "cache.db")))
+    monkeypatch.setattr(ai_engine, "load_teacher_profiles", lambda: {})
+
+    def slow(result):
+        def stage(*args, **kwargs):
+            time.sleep(0.2)
+            return result
+        return stage
+    monkeypatch.setattr(ai_engine, "cached_slide_pages", slow(["Slide about Fourier series\n"]))
+    monkeypatch.setattr(ai_engine, "cached_audio_upload", slow("AUDIO"))
+    monkeypatch.setattr(ai_engine, "_resolve_notes_folder", slow("folder-id"))
+    monkeypatch.setattr(ai_engine, "save_generated_notes_to_drive", lambda text, path: "notes-id")
+    events, threads = [], set()
+
+    def on_progress(event):
+        events.append(event)
+        threads.add(threading.current_thread())
+
+    start = time.perf_counter()
+    text, notes_id = ai_engine.generate_and_save_notes(
+        b"%PDF", b"audio", ["Signals", "Lecture 1"], on_progress=on_progress,
+        model=lambda inputs: "# Notes" if "AUDIO" in inputs else "no audio")
+    elapsed = time.perf_counter() - start
+
+    assert (text, notes_id) == ("# Notes", "notes-id")
+    assert elapsed < 0.4  # three 0.2 s stages overlap instead of adding up to 0.6 s
+    assert threads == {threading.current_thread()}
+    assert events[-1].stage == "upload" and events[-1].percent == 100
+    assert {e.stage for e in events} == {"persona", "fingerprint", "slides", "audio",
+                                         "drive", "generate", "upload"}
+
+
+def test_audio_processing_poll_backs_off(monkeypatch):
+    from types import SimpleNamespace
+
+    states = iter(["PROCESSING", "PROCESSING", "PROCESSING", "ACTIVE"])
+    sleeps = []
+    monkeypatch.setattr(ai_engine.genai, "upload_file", lambda **kw: SimpleNamespace(
+        name="files/1", state=SimpleNamespace(name="PROCESSING")))
+    monkeypatch.setattr(ai_engine.genai, "get_file", lambda name: SimpleNamespace(
+        name=name, state=SimpleNamespace(name=next(states))))
+    monkeypatch.setattr(ai_engine.time, "sleep", sleeps.append)
+
+    assert ai_engine.upload_audio_to_gemini("lecture.mp3").state.name == "ACTIVE"
+    assert sleeps == [0.5, 0.75, 1.125, 1.6875]
+
+
+def test_short_decks_are_sent_whole_and_long_ones_ranked_on_request(tmp_path, monkeypatch):
+    from modules.storage import ContentCache
+
+    monkeypatch.setattr(ai_engine, "_cache", lambda ns: ContentCache(ns, 10_000, str(tmp_path / "cache.db")))
+    monkeypatch.setattr(ai_engine, "load_teacher_profiles", lambda: {})
+    prompts = []
+
+    def model(inputs):
+        prompts.append(inputs[0])
+        return "# Notes"
+
+    pdf = tmp_path / "deck.pdf"
+    pdf.write_bytes(_pdf([f"Slide {i} covers topic number {i} in detail" for i in range(8)]))
+    ai_engine.generate_hybrid_notes(str(pdf), model=model, lecture_title="topic 3")
+    assert all(f"Slide {i} covers" in prompts[-1] for i in range(8))
+
+    monkeypatch.setattr(ai_engine, "PROMPT_CHAR_BUDGET", 100)
+    ai_engine.generate_hybrid_notes(str(pdf), model=model, lecture_title="topic 3", chunked=False)
+    assert len(prompts) == 2 and "Slide 3 covers" in prompts[-1]
+    assert len(prompts[-1]) <= len("LECTURE SLIDES CONTENT:\n") + 100
+
+
+def test_pool_is_spawned_and_gets_the_deck_once_per_worker(monkeypatch):
+    from modules import pdf_worker
+
+    pdf = _pdf([f"Page {i}" for i in range(60)])
+    pools = []
+
+    class InlinePool:
+        def __init__(self, max_workers, mp_context, initializer, initargs):
+            pools.append((max_workers, mp_context.get_start_method(), initargs))
+            initializer(*initargs)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def map(self, fn, *iterables):
+            pools.append(list(zip(*iterables)))
+            return map(fn, *iterables)
+    monkeypatch.setattr(ai_engine, "ProcessPoolExecutor", InlinePool)
+
+    pages = ai_engine.extract_pages(pdf, workers=2)
+    assert pages == [f"Page {i}\n" for i in range(60)]
+    assert pools[0] == (2, "spawn", (pdf,))
+    assert pools[1] == [(0, 25), (25, 50), (50, 60)]  # tasks carry page ranges only
+    assert pdf_worker.extract_range(0, 1) == ["Page 0\n"]
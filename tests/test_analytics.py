@@ -0,0 +1,47 @@
+import datetime
+
+import numpy as np
+
+from modules.analytics import EventTable, breakdown, heatmap, rolling_average, streaks, summarize
+
+TODAY = datetime.date(2025, 1, 10)  # a Friday
+
+
+def _session(date, minutes, material="📄 Notes"):
+    return {"date": date, "time_taken": f"{minutes}m", "material": material}
+
+
+def _tree():
+    return {
+        "Signals": {"type": "folder", "L1": {"type": "lecture", "revision_history": [
+            _session("2025-01-08 10:00", 30), _session("2025-01-09 10:00", 20, "⚡ Flashcards"),
+        ]}},
+        "Analog": {"type": "folder", "L2": {"type": "lecture", "revision_daily": {
+            "2025-01-10": {"sessions": 1, "minutes": 45.0, "materials": {"📄 Notes": 45.0}},
+            "2025-01-05": {"sessions": 1, "minutes": 10.0, "materials": {"📄 Notes": 10.0}},
+        }}},
+    }
+
+
+def test_breakdowns_and_streaks():
+    table = EventTable.from_tree(_tree())
+    assert breakdown(table, "subject") == {"Analog": 55.0, "Signals": 50.0}
+    assert breakdown(table, "material") == {"📄 Notes": 85.0, "⚡ Flashcards": 20.0}
+    assert streaks(table, TODAY) == {"current": 3, "longest": 3}
+    assert streaks(table, datetime.date(2025, 1, 12))["current"] == 0
+
+
+def test_heatmap_and_rolling_average():
+    table = EventTable.from_tree(_tree())
+    grid = heatmap(table, TODAY, weeks=2)
+    assert grid.shape == (7, 2)
+    assert grid[4, 1] == 45.0  # Friday of this week
+    assert grid[6, 0] == 10.0  # last Sunday
+    assert np.isclose(rolling_average(table, TODAY, days=1)[-1], 105 / 7)
+
+
+def test_cohort_tables_concat_and_summary():
+    one = EventTable.from_tree(_tree())
+    cohort = EventTable.concat([one, one])
+    assert breakdown(cohort, "subject") == {"Analog": 110.0, "Signals": 100.0}
+    assert summarize(_tree(), TODAY)["total_minutes"] == 105.0
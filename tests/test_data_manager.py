@@ -0,0 +1,136 @@
+from google.cloud import firestore
+from modules.data_manager import DataRepository, diff_fields
+
+
+def test_diff_only_touched_lecture():
+    """Logging a session only sends that lecture's history."""
+    old = {
+        "Signals": {"type": "folder", "Lec 01: Intro": {"type": "lecture", "revision_history": []}},
+        "Analog": {"type": "folder"},
+    }
+    new = {
+        "Signals": {"type": "folder", "Lec 01: Intro": {"type": "lecture", "revision_history": [{"date": "2025-01-10"}]}},
+        "Analog": {"type": "folder"},
+    }
+    assert diff_fields(old, new) == {
+        "Signals.`Lec 01: Intro`.revision_history": [{"date": "2025-01-10"}]
+    }
+
+
+def test_diff_new_and_removed_keys():
+    old = {"a": {"type": "folder", "old": {"type": "lecture"}}}
+    new = {"a": {"type": "folder", "fresh": {"type": "folder"}}}
+    changes = diff_fields(old, new)
+    assert changes["a.fresh"] == {"type": "folder"}
+    assert changes["a.old"] is firestore.DELETE_FIELD
+
+
+def test_diff_unchanged_is_empty():
+    tree = {"a": {"b": [1, 2], "c": {}}}
+    assert diff_fields(tree, {"a": {"b": [1, 2], "c": {}}}) == {}
+
+
+def test_save_all_writes_only_changed_docs(fake_firestore):
+    repo = DataRepository(client=fake_firestore)
+    repo.save_all({"GATE": {"type": "folder"}, "UPSC": {"type": "folder"}})
+    data = repo.get_all()
+    data["GATE"]["Lec"] = {"type": "lecture"}
+
+    result = repo.save_all(data)
+
+    assert result.written == ["GATE"]
+    assert result.skipped == ["UPSC"]
+    assert fake_firestore.collection("users").streams == 2  # first save + get_all
+    assert DataRepository(client=fake_firestore).get_all() == data
+
+
+def test_save_all_chunks_large_writes(fake_firestore):
+    repo = DataRepository(client=fake_firestore)
+    result = repo.save_all({f"doc{i}": {"n": i} for i in range(1200)})
+
+    assert result.ok and len(result.written) == 1200
+    assert max(fake_firestore.commits) <= 500
+
+
+def test_save_all_reports_failures(fake_firestore, monkeypatch):
+    monkeypatch.setattr("modules.data_manager.COMMIT_BACKOFF", 0)
+    fake_firestore.fail_commits = 10
+    result = DataRepository(client=fake_firestore).save_all({"GATE": {"type": "folder"}})
+
+    assert not result.ok
+    assert list(result.failed) == ["GATE"]
+
+
+def test_stats_update_along_the_ancestor_path_only():
+    from modules.data_manager import ensure_stats, node_stats, update_stats
+
+    tree = {
+        "Signals": {
+            "type": "folder",
+            "Lec 01": {"type": "lecture", "tasks": ["- [x] Read", "- [ ] Solve"],
+                       "revision_history": [{"date": "2025-01-08 14:30", "time_taken": "30m"}]},
+            "Lec 02": {"type": "lecture", "tasks": [], "revision_history": []},
+        },
+        "Analog": {"type": "folder"},
+    }
+    assert ensure_stats(tree)
+    assert not ensure_stats(tree)
+    assert tree["Signals"]["stats"] == {"tasks": 2, "tasks_done": 1, "minutes": 30.0,
+                                        "lectures": 2, "last_studied": "2025-01-08"}
+
+    tree["Signals"]["Lec 02"]["revision_history"].append({"date": "2025-01-10 09:00", "time_taken": "45m"})
+    analog_stats = tree["Analog"]["stats"]
+    update_stats(tree, ["Signals", "Lec 02"])
+    assert tree["Signals"]["Lec 02"]["stats"]["minutes"] == 45.0
+    assert tree["Signals"]["stats"]["minutes"] == 75.0
+    assert tree["Signals"]["stats"]["last_studied"] == "2025-01-10"
+    assert tree["Analog"]["stats"] is analog_stats
+    assert node_stats(tree)["lectures"] == 2
+
+
+def test_log_revision_keeps_node_bounded_and_history_shared(tmp_path, fake_firestore, monkeypatch):
+    from datetime import datetime
+    from modules import data_manager as dm
+    from modules.storage import LocalMirror, MirrorReplicator, RevisionLog
+
+    log = RevisionLog(str(tmp_path / "revisions.db"))
+    sessions = dm.SessionRepository(client=fake_firestore)
+    mirror = LocalMirror(str(tmp_path / "mirror.db"))
+    replicator = MirrorReplicator(mirror, dm.DataRepository(client=fake_firestore))
+    replicator.add_outbox(dm.flush_sessions)
+    monkeypatch.setattr(dm, "_revision_log", lambda: log)
+    monkeypatch.setattr(dm, "_session_repository", lambda: sessions)
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+    legacy = [{"date": "2024-01-02 10:00", "time_taken": "20m"}]
+    lecture = {"type": "lecture", "tasks": [], "revision_history": list(legacy)}
+    tree = {"Signals": {"type": "folder", "Lec 01": lecture}}
+
+    today = datetime(2025, 1, 10)
+    for i in range(25):
+        dm.log_revision(tree, ["Signals", "Lec 01"],
+                        {"date": f"2025-01-{1 + i % 10:02d} 09:{i:02d}", "time_taken": "30m"}, today)
+    assert fake_firestore.commits == []  # uploads wait for the sync thread
+
+    fake_firestore.fail_commits = 1  # offline: sessions stay in the outbox
+    assert not replicator.sync_once()
+    assert log.count(dm.node_id(["Signals", "Lec 01"])) == 25
+    assert replicator.sync_once()
+
+    assert lecture["revision_history"] == legacy  # old entries stay in the synced tree
+    assert len(lecture["revision_daily"]) == 10
+    assert sum(n for _, n, _ in dm.iter_sessions(lecture)) == 26
+    assert tree["Signals"]["stats"]["minutes"] == 25 * 30 + 20
+    assert log.count(dm.node_id(["Signals", "Lec 01"])) == 0
+
+    # Another device (empty outbox) pages the same history from Firestore
+    monkeypatch.setattr(dm, "_revision_log", lambda: RevisionLog(str(tmp_path / "other.db")))
+    pages = {}
+    entries, total = dm.revision_page(["Signals", "Lec 01"], lecture, page=1, cache=pages)
+    assert total == 26
+    assert len(entries) == 6 and entries[-1]["date"] == "2024-01-02 10:00"
+    assert entries[0]["date"] == "2025-01-02 09:11"
+    assert all("session_id" not in entry for entry in entries)
+
+    # Reruns on the same page are served from the cache, even offline
+    fake_firestore.offline = True
+    assert dm.revision_page(["Signals", "Lec 01"], lecture, page=1, cache=pages) == (entries, total)
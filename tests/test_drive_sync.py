@@ -0,0 +1,100 @@
+from modules import drive_sync
+
+
+def test_deep_folder_resolved_once(fake_drive):
+    path = ["GATE 2027", "Signals & Systems", "Unit 1", "Lec 01"]
+    folder_id = drive_sync.resolve_folder(fake_drive.service, path)
+    assert fake_drive.calls.count("create") == 5
+
+    fake_drive.calls.clear()
+    assert drive_sync.resolve_folder(fake_drive.service, path) == folder_id
+    assert fake_drive.calls == []  # served from the cache
+
+
+def test_existing_folders_are_reused(fake_drive):
+    service = fake_drive.service
+    root = drive_sync.find_or_create_folder(service, "StudyOS_Data")
+    exam = drive_sync.find_or_create_folder(service, "Teacher's Notes", root)
+    fake_drive.calls.clear()
+
+    assert drive_sync.resolve_folder(service, ["Teacher's Notes"]) == exam
+    assert "create" not in fake_drive.calls
+
+
+def test_forgotten_folder_is_looked_up_again(fake_drive):
+    service = fake_drive.service
+    first = drive_sync.resolve_folder(service, ["GATE", "Signals"])
+    drive_sync.forget_folder(["GATE"])
+    fake_drive.calls.clear()
+
+    assert drive_sync.resolve_folder(service, ["GATE", "Signals"]) == first
+    assert fake_drive.calls == ["list", "list"]
+
+
+def test_warm_up_fills_cache_from_one_listing(fake_drive):
+    service = fake_drive.service
+    leaf = drive_sync.resolve_folder(service, ["GATE", "Signals", "Unit 1"])
+    drive_sync.forget_folder([])
+    fake_drive.calls.clear()
+
+    assert drive_sync.warm_folder_cache(service, ["GATE"]) == 4
+    fake_drive.calls.clear()
+    assert drive_sync.resolve_folder(service, ["GATE", "Signals", "Unit 1"]) == leaf
+    assert fake_drive.calls == []
+
+
+def test_upload_skips_unchanged_and_updates_in_place(fake_drive):
+    first = drive_sync.upload_bytes_to_drive("# Notes", "generated_notes.md", ["GATE"])
+    assert first.action == "created"
+
+    fake_drive.calls.clear()
+    same = drive_sync.upload_bytes_to_drive("# Notes", "generated_notes.md", ["GATE"],
+                                            file_id=first.file_id)
+    assert (same.file_id, same.action) == (first.file_id, "skipped")
+    assert fake_drive.calls == ["get"]
+
+    edited = drive_sync.upload_bytes_to_drive("# Notes v2", "generated_notes.md", ["GATE"],
+                                              file_id=first.file_id)
+    assert (edited.file_id, edited.action) == (first.file_id, "updated")
+    assert fake_drive.contents[first.file_id] == b"# Notes v2"
+
+
+def test_upload_recreates_deleted_target(fake_drive):
+    result = drive_sync.upload_bytes_to_drive(b"data", "generated_notes.md", ["GATE"],
+                                              file_id="missing")
+    assert result.action == "created"
+
+
+def test_file_cache_revalidates_before_downloading(fake_drive):
+    service = fake_drive.service
+    cache = drive_sync.file_cache()
+    cache.fresh_for = 0
+    result = drive_sync.upload_bytes_to_drive(b"# Notes", "generated_notes.md", ["GATE"])
+
+    assert cache.get(service, result.file_id) == b"# Notes"
+    assert "download" in fake_drive.calls
+    fake_drive.calls.clear()
+
+    assert cache.get(service, result.file_id) == b"# Notes"
+    cache._memory.clear()
+    assert cache.get(service, result.file_id) == b"# Notes"
+    assert fake_drive.calls == ["get", "get"]
+
+    fake_drive.store(result.file_id, b"# Edited elsewhere")
+    assert cache.get(service, result.file_id) == b"# Edited elsewhere"
+    assert cache.stats()["revalidated"] == 2
+
+
+def test_file_cache_serves_fresh_entries_and_evicts(fake_drive):
+    service = fake_drive.service
+    cache = drive_sync.file_cache()
+    cache.put("a", b"x" * 10, md5="m1")
+    cache.put("b", b"y" * 10, md5="m2")
+    fake_drive.calls.clear()
+
+    assert cache.get(service, "a") == b"x" * 10
+    assert fake_drive.calls == []
+
+    cache.set_limits(max_memory_bytes=10, max_disk_bytes=10)
+    assert cache.stats()["disk_bytes"] == 10
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from modules.generator import map_reduce_notes, split_sections
+
+
+def test_sections_break_between_pages():
+    pages = ["a" * 40, "b" * 40, "c" * 40, "d" * 250]
+    sections = split_sections(pages, chunk_chars=100)
+    assert sections == ["a" * 40 + "b" * 40, "c" * 40, "d" * 100, "d" * 100, "d" * 50]
+    assert "".join(sections) == "".join(pages)
+
+
+def test_map_reduce_runs_chunks_concurrently_and_merges_in_order():
+    lock = threading.Lock()
+    active, peak, reduce_calls = [0], [0], []
+
+    def model(inputs):
+        if inputs[0].startswith("PARTIAL NOTES"):
+            reduce_calls.append(inputs)
+            return "# Merged"
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return "notes for " + inputs[0].split("\n", 1)[1].strip()
+
+    pages = [f"slide {i}\n" for i in range(8)]
+    start = time.perf_counter()
+    assert map_reduce_notes(pages, model, reduce_inputs=["AUDIO"], chunk_chars=16, workers=3) == "# Merged"
+    elapsed = time.perf_counter() - start
+
+    assert peak[0] == 3
+    assert elapsed < 4 * 0.05 * 1.5  # 4 chunks, 3 at a time: two rounds, not four
+    merged, audio, prompt = reduce_calls[0]
+    assert audio == "AUDIO" and "Short Notes Block" in prompt
+    assert merged.index("slide 0") < merged.index("slide 2") < merged.index("slide 6")
+
+
+def test_short_decks_take_one_call():
+    calls = []
+    map_reduce_notes(["slide 0\n"], lambda inputs: calls.append(inputs) or "# Notes")
+    assert len(calls) == 1 and calls[0][0] == "LECTURE SLIDES CONTENT:\nslide 0\n"
@@ -0,0 +1,44 @@
+import datetime
+
+import numpy as np
+
+from modules.retention import HistoryTable, brain_battery_scores, retention, stability
+
+TODAY = datetime.date(2025, 1, 10)
+
+
+def test_stability_matches_scalar_and_vector():
+    assert [stability(n) for n in (1, 2, 3, 4, 5, 20)] == [1.0, 3.0, 7.0, 14.0, 28.0, 365.0]
+    assert np.array_equal(stability(np.array([1, 2, 3, 5])), [1.0, 3.0, 7.0, 28.0])
+
+
+def test_logged_sessions_with_time_are_counted():
+    data = {"type": "lecture", "revision_history": [
+        {"date": "2025-01-08 14:30", "material": "📄 Notes"},
+        {"date": "2025-01-09"},
+        {"date": "garbage"},
+    ]}
+    table = HistoryTable.from_tree(data)
+    assert table.session_counts().tolist() == [2]
+    # S = 3 for two sessions, last one a day ago
+    assert np.isclose(retention(table, TODAY)[0], np.exp(-1 / 3))
+
+
+def test_rolls_lectures_up_into_folders_and_subjects():
+    data = {
+        "Signals": {
+            "type": "folder",
+            "Unit 1": {
+                "type": "folder",
+                "L1": {"type": "lecture", "revision_history": [{"date": "2025-01-10 09:00"}]},
+                "L2": {"type": "lecture", "revision_history": []},
+            },
+            "L3": {"type": "lecture", "revision_history": [{"date": "2025-01-10"}]},
+        },
+        "Empty": {"type": "folder"},
+    }
+    scores = brain_battery_scores(data, TODAY)
+    assert scores[("Signals", "Unit 1", "L1")] == 100
+    assert scores[("Signals", "Unit 1")] == 50
+    assert scores[("Signals",)] == 67
+    assert ("Empty",) not in scores
@@ -0,0 +1,46 @@
+import datetime
+
+from modules.scheduler import ReviewQueue, next_due_day, review_interval
+
+TODAY = datetime.date(2025, 1, 10)
+
+
+def _day(iso):
+    return datetime.date.fromisoformat(iso).toordinal()
+
+
+def _lecture(*dates):
+    return {"type": "lecture", "revision_history": [{"date": d} for d in dates]}
+
+
+def test_interval_follows_stability_model():
+    assert [review_interval(n) for n in (1, 2, 3, 4)] == [1, 3, 5, 10]
+    assert next_due_day([{"date": "2025-01-08 14:30"}, {"date": "2025-01-01"}]) == _day("2025-01-11")
+    assert next_due_day([]) is None
+
+
+def test_due_list_is_ordered_and_capped():
+    data = {
+        "Signals": {
+            "type": "folder",
+            "A": _lecture("2025-01-01"),                 # due 01-02
+            "B": _lecture("2025-01-05", "2025-01-07"),   # due 01-10
+            "C": _lecture("2025-01-10"),                 # due 01-11
+            "D": _lecture(),                             # never studied
+        },
+    }
+    queue = ReviewQueue.build(data)
+    assert len(queue) == 3
+    assert queue.due(TODAY) == [(["Signals", "A"], 8), (["Signals", "B"], 0)]
+    assert queue.plan(TODAY, size=1) == [(["Signals", "A"], 8)]
+
+
+def test_logging_a_session_reschedules_incrementally():
+    lecture = _lecture("2025-01-01")
+    queue = ReviewQueue.build({"L": lecture})
+    lecture["revision_history"].append({"date": "2025-01-10 09:00"})
+    queue.log_session(["L"], lecture)
+
+    assert queue.due(TODAY) == []
+    assert queue.due_on(["L"]) == _day("2025-01-13")
+    assert queue.due(datetime.date(2025, 1, 13)) == [(["L"], 0)]
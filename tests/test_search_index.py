@@ -0,0 +1,57 @@
+from modules.data_manager import add_item_to_path
+from modules.search_index import NotesIndex, TrigramIndex
+
+
+def _library():
+    return {
+        "Signals": {
+            "type": "folder",
+            "Fourier Series": {"type": "lecture", "drive_ids": {}, "tasks": []},
+            "Laplace": {"type": "folder", "Laplace Transform": {"type": "lecture"}},
+        },
+        "Networks": {"type": "folder", "Transformers": {"type": "lecture"}},
+    }
+
+
+def test_ranks_exact_then_prefix_then_substring():
+    index = TrigramIndex.build(_library())
+    assert len(index) == 6
+    names = [name for name, _, _ in index.search("laplace")]
+    assert names == ["Laplace", "Laplace Transform"]
+    assert index.search("transform")[0] == ("Transformers", ["Networks", "Transformers"], "lecture")
+    assert [name for name, _, _ in index.search("ne")] == ["Networks"]
+
+
+def test_tolerates_typos():
+    index = TrigramIndex.build(_library())
+    assert index.search("fourer series")[0][0] == "Fourier Series"
+    assert index.search("zzzz") == []
+
+
+def test_add_item_to_path_updates_index(monkeypatch):
+    from modules import data_manager
+    monkeypatch.setattr(data_manager, "save_data", lambda data: None)
+    data = _library()
+    index = TrigramIndex.build(data)
+
+    add_item_to_path(data, ["Signals"], "Z Transform", "lecture", search_index=index)
+    assert ("Z Transform", ["Signals", "Z Transform"], "lecture") in index.search("z trans")
+
+
+def test_notes_index_ranks_with_bm25_and_reindexes(tmp_path):
+    index = NotesIndex(str(tmp_path / "search.db"))
+    index.add("n1", ["Signals", "Fourier"], "The Fourier transform maps signals to frequency. " * 3)
+    index.add("n2", ["Signals", "Laplace"], "Laplace transform generalises the Fourier transform.")
+    index.add("n3", ["Networks", "Nodes"], "Kirchhoff laws for nodes and meshes.")
+    assert not index.add("n3", ["Networks", "Nodes"], "Kirchhoff laws for nodes and meshes.")
+
+    hits = index.search("fourier frequency")
+    assert [hit["path"][-1] for hit in hits] == ["Fourier", "Laplace"]
+    assert "**Fourier**" in hits[0]["snippet"]
+
+    # Regenerated notes for the same lecture replace the old entry
+    index.add("n4", ["Signals", "Fourier"], "Now about sampling only.")
+    assert [hit["notes_id"] for hit in index.search("sampling")] == ["n4"]
+    assert [hit["notes_id"] for hit in index.search("frequency")] == []
+    assert len(index) == 3
+    assert index.search("the and") == []
@@ -0,0 +1,39 @@
+from modules.slide_selector import select_slides
+
+
+def _filler(i):
+    return f"Slide {i}: worked example number {i} with resistor values r{i} and generic circuit discussion.\n"
+
+
+def test_long_decks_keep_the_relevant_tail():
+    pages = [_filler(i) for i in range(300)]
+    pages[150] = "Fourier transform of a rectangular pulse gives a sinc spectrum.\n"
+    pages[299] = "Summary: Fourier transform pairs, sinc spectrum, duality. Important for exam.\n"
+    text = select_slides(pages, "Signals Fourier Transform", budget=2000)
+
+    assert len(text) <= 2000
+    assert "Summary: Fourier" in text and "rectangular pulse" in text
+    assert text.index("rectangular pulse") < text.index("Summary: Fourier")  # deck order
+
+
+def test_near_duplicate_pages_are_dropped():
+    slide = "Laplace transform converts differential equations into algebraic equations in s domain.\n"
+    pages = [slide, slide.replace("s domain", "s-domain"), "Laplace region of convergence rules.\n"]
+    text = select_slides(pages, "Laplace")
+    assert text.count("converts differential equations") == 1
+    assert "region of convergence" in text
+
+
+def test_deck_under_the_budget_is_kept_whole():
+    pages = [
+        "Fourier series represents a periodic signal as a sum of harmonics.\n",
+        "Dirichlet conditions: absolutely integrable, finite maxima and minima.\n",
+        "Trigonometric form: a0 plus sum of an cos(n w0 t) and bn sin(n w0 t).\n",
+        "Exponential form with complex coefficients cn.\n",
+        "Parseval: average power equals the sum of |cn| squared.\n",
+        "Gibbs phenomenon: about 9 percent overshoot near discontinuities.\n",
+        "Fourier series represents a periodic signal as a sum of harmonics.\n",  # repeated slide
+        "Summary: Fourier series coefficients and their properties.\n",
+    ]
+    text = select_slides(pages, "Signals Fourier Series")
+    assert text == "".join(pages[:6] + pages[7:])
@@ -0,0 +1,326 @@
+import datetime
+
+from modules.data_manager import DataRepository
+from modules.storage import LocalMirror, MirrorReplicator
+
+
+def _setup(tmp_path, fake_firestore):
+    mirror = LocalMirror(str(tmp_path / "mirror.db"))
+    repo = DataRepository(client=fake_firestore)
+    return mirror, MirrorReplicator(mirror, repo)
+
+
+def test_local_writes_survive_restart(tmp_path, fake_firestore):
+    mirror, _ = _setup(tmp_path, fake_firestore)
+    mirror.write_tree({"GATE": {"type": "folder"}})
+    mirror.close()
+
+    assert LocalMirror(str(tmp_path / "mirror.db")).load() == {"GATE": {"type": "folder"}}
+
+
+def test_push_and_pull(tmp_path, fake_firestore):
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    mirror.write_tree({"GATE": {"type": "folder"}, "UPSC": {"type": "folder"}})
+    assert replicator.sync_once()
+    assert set(fake_firestore.collection("users").docs) == {"GATE", "UPSC"}
+
+    # Another device edits GATE and deletes UPSC.
+    other = DataRepository(client=fake_firestore)
+    other.save_all({"GATE": {"type": "folder", "Lec": {"type": "lecture"}}})
+    assert replicator.sync_once()
+
+    assert mirror.load() == {"GATE": {"type": "folder", "Lec": {"type": "lecture"}}}
+    assert mirror.pending() == ({}, [], {})
+
+
+def test_offline_writes_are_queued(tmp_path, fake_firestore, monkeypatch):
+    monkeypatch.setattr("modules.data_manager.COMMIT_BACKOFF", 0)
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    fake_firestore.offline = True
+    fake_firestore.fail_commits = 100
+    mirror.write_tree({"GATE": {"type": "folder"}})
+
+    assert not replicator.sync_once()
+    assert mirror.load() == {"GATE": {"type": "folder"}}
+
+    fake_firestore.offline = False
+    fake_firestore.fail_commits = 0
+    assert replicator.sync_once()
+    assert fake_firestore.collection("users").docs["GATE"][0] == {"type": "folder"}
+
+
+def test_remote_delete_does_not_block_sync(tmp_path, fake_firestore, monkeypatch):
+    monkeypatch.setattr("modules.data_manager.COMMIT_BACKOFF", 0)
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    mirror.write_tree({"GATE": {"v": 1}, "UPSC": {"v": 1}})
+    assert replicator.sync_once()
+
+    # Another device deletes GATE and edits UPSC; we edit GATE and add ESE.
+    other = DataRepository(client=fake_firestore)
+    other.get_versions()
+    other.save_all({"UPSC": {"v": 2}})
+    mirror.write_tree({"GATE": {"v": 2}, "UPSC": {"v": 1}, "ESE": {"v": 1}})
+
+    assert replicator.sync_once()
+    docs = fake_firestore.collection("users").docs
+    assert docs["GATE"][0] == {"v": 2} and docs["ESE"][0] == {"v": 1}
+    assert mirror.load()["UPSC"] == {"v": 2}
+
+
+def test_pull_runs_when_push_fails(tmp_path, fake_firestore, monkeypatch):
+    monkeypatch.setattr("modules.data_manager.COMMIT_BACKOFF", 0)
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    mirror.write_tree({"GATE": {"v": 1}})
+    assert replicator.sync_once()
+
+    DataRepository(client=fake_firestore).save_student_data("UPSC", {"v": 1})
+    fake_firestore.fail_commits = 100
+    mirror.write_tree({"GATE": {"v": 2}})
+
+    assert not replicator.sync_once()
+    assert replicator.last_error
+    assert mirror.load() == {"GATE": {"v": 2}, "UPSC": {"v": 1}}
+
+
+def test_newer_side_wins_conflict(tmp_path, fake_firestore):
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    mirror.write_tree({"GATE": {"v": 1}})
+    replicator.sync_once()
+
+    old = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+    new = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+
+    mirror.write_tree({"GATE": {"v": 2}})  # unpushed local edit
+    mirror.apply_remote({"GATE": ({"v": 3}, old)})
+    assert mirror.load() == {"GATE": {"v": 2}}
+
+    mirror.apply_remote({"GATE": ({"v": 4}, new)})
+    assert mirror.load() == {"GATE": {"v": 4}}
+
+
+def test_node_layout_loads_one_folder_at_a_time(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    tree = {"GATE": {"type": "folder", "Signals": {"type": "folder",
+            "Lec 01": {"type": "lecture", "tasks": []}}}}
+    dm.NodeRepository(client=fake_firestore).save_documents(dm.explode_tree(tree))
+
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    data = dm.load_data()
+    assert data == {"GATE": {"type": "folder"}}
+
+    lecture_parent = dm.load_children(data, ["GATE", "Signals"])
+    assert lecture_parent["Lec 01"] == {"type": "lecture", "tasks": []}
+    assert data == tree
+
+    # Only the new node and its ancestor's roll-up stats are written.
+    dm.add_item_to_path(data, ["GATE"], "Analog", "folder")
+    upserts, deletes, _ = mirror.pending()
+    assert sorted(upserts) == sorted([dm.node_id(("GATE", "Analog")), dm.node_id(("GATE",))])
+    assert upserts[dm.node_id(("GATE",))]["fields"]["stats"]["lectures"] == 1
+    assert upserts[dm.node_id(("GATE", "Analog"))]["parent"] == dm.node_id(("GATE",))
+    assert deletes == []
+
+
+def test_listener_replaces_polling(tmp_path, fake_firestore):
+    fake_firestore.collection("users").document("GATE").set({"type": "folder"})
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    assert replicator.listen()
+    assert mirror.load() == {"GATE": {"type": "folder"}}
+
+    fake_firestore.collection("users").document("UPSC").set({"type": "folder"})
+    fake_firestore.collection("users").document("GATE").delete()
+    assert mirror.load() == {"UPSC": {"type": "folder"}}
+
+    assert replicator.sync_once()  # first round: full pull
+    streams = fake_firestore.collection("users").streams
+    assert replicator.sync_once()
+    assert fake_firestore.collection("users").streams == streams  # no re-read within TTL
+
+
+def test_burst_of_saves_is_one_commit(tmp_path, fake_firestore):
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    tree = {"GATE": {"type": "folder"}}
+    for i in range(5):
+        tree["GATE"][f"Lec {i}"] = {"type": "lecture"}
+        mirror.write_tree(tree)
+    assert replicator.metrics()["queue_depth"] == 1
+
+    assert replicator.flush()
+    metrics = replicator.metrics()
+    assert metrics["queue_depth"] == 0 and metrics["pushes"] == 1
+    assert fake_firestore.commits == [1]
+
+
+def test_dashboard_sees_unopened_folders_in_node_layout(tmp_path, fake_firestore, monkeypatch):
+    from datetime import date
+    from modules import data_manager as dm
+    from modules.dashboard_widgets import load_full_tree
+    from modules.retention import brain_battery_scores
+    from modules.scheduler import ReviewQueue
+
+    today = date(2025, 1, 10)
+    tree = {"GATE": {"type": "folder", "Signals": {"type": "folder", "Lec 01": {
+        "type": "lecture", "revision_daily": {"2025-01-09": {"sessions": 1, "minutes": 30.0}}}}}}
+    dm.NodeRepository(client=fake_firestore).save_documents(dm.explode_tree(tree))
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    data = dm.load_data()
+    assert brain_battery_scores(data, today).get(("GATE",), 0) == 0  # lecture not loaded yet
+
+    nodes = fake_firestore.collection("nodes")
+    streams = nodes.streams
+    load_full_tree(data)
+    assert nodes.streams == streams + 1  # one read for the whole tree
+    assert brain_battery_scores(data, today)[("GATE",)] > 0
+    assert len(ReviewQueue.build(data)) == 1
+
+
+def test_search_index_follows_folders_loaded_later(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+    from modules.search_index import TrigramIndex
+
+    tree = {"GATE": {"type": "folder", "Signals": {"type": "folder",
+            "Fourier Series": {"type": "lecture"}}}}
+    dm.NodeRepository(client=fake_firestore).save_documents(dm.explode_tree(tree))
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    data = dm.load_data()
+    index = TrigramIndex.build(data)
+    data.on_attach.append(lambda path, node: index.add_subtree(node, path))
+    assert index.search("fourier") == []
+
+    dm.load_children(data, ["GATE", "Signals"])
+    assert index.search("fourier") == [("Fourier Series", ["GATE", "Signals", "Fourier Series"], "lecture")]
+
+
+def test_node_layout_save_keeps_folders_added_elsewhere(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    tree = {"GATE": {"type": "folder"}}
+    dm.NodeRepository(client=fake_firestore).save_documents(dm.explode_tree(tree))
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    first, second = dm.load_data(), dm.load_data()
+    dm.add_item_to_path(second, [], "UPSC", "folder")
+    dm.add_item_to_path(first, ["GATE"], "Signals", "folder")
+
+    upserts, deletes, _ = mirror.pending()
+    assert dm.node_id(("UPSC",)) in upserts and deletes == []
+
+    del first["GATE"]
+    dm.save_data(first)
+    _, deletes, _ = mirror.pending()
+    assert sorted(deletes) == sorted([dm.node_id(("GATE",)), dm.node_id(("GATE", "Signals"))])
+
+
+def test_stale_session_only_writes_what_it_changed(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+    mirror.write_tree({"GATE": {"type": "folder", "stats": dm.empty_stats()},
+                       "UPSC": {"type": "folder", "stats": dm.empty_stats()}})
+    assert replicator.sync_once()
+    data = dm.load_data()
+    base_ts = mirror.snapshot()["GATE"][1]
+
+    # Another device adds a lecture to GATE; the mirror picks it up.
+    other = DataRepository(client=fake_firestore)
+    other.get_versions()
+    gate = {"type": "folder", "stats": dm.empty_stats(), "Lec 9": {"type": "lecture"}}
+    other.save_all({"GATE": gate, "UPSC": data["UPSC"]})
+    assert replicator.sync_once()
+
+    dm.add_item_to_path(data, ["UPSC"], "Polity", "folder")
+    upserts, deletes, _ = mirror.pending()
+    assert list(upserts) == ["UPSC"] and deletes == []
+    assert mirror.load()["GATE"] == gate
+
+    # A real conflict: the edit is stamped with the version it was made on.
+    data["GATE"]["type"] = "exam"
+    dm.save_data(data)
+    assert mirror.snapshot()["GATE"][1] == base_ts
+
+
+def test_node_layout_polls_only_the_folder_on_screen(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    tree = {"GATE": {"type": "folder", "Signals": {"type": "folder"}},
+            "UPSC": {"type": "folder", "Polity": {"type": "folder"}}}
+    remote = dm.NodeRepository(client=fake_firestore)
+    remote.save_documents(dm.explode_tree(tree))
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    data = dm.load_data()
+    dm.load_children(data, ["UPSC"])
+    dm.open_folder(data, ["GATE"])
+    remote.save_documents(dm.explode_tree({"GATE": {"type": "folder", "Analog": {"type": "folder"}}}))
+
+    nodes = fake_firestore.collection("nodes")
+    streams = nodes.streams
+    assert replicator.sync_once()
+    assert nodes.streams == streams + 1  # GATE only, not UPSC or the root
+    assert dm.node_id(("GATE", "Analog")) in mirror.children(dm.node_id(("GATE",)))
+
+    assert replicator.sync_once()
+    assert nodes.streams == streams + 1  # nothing browsed since
+
+
+def test_sessions_pick_up_remote_edits_they_did_not_touch(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    mirror, replicator = _setup(tmp_path, fake_firestore)
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+    stats = dm.empty_stats()
+    mirror.write_tree({"GATE": {"type": "folder", "stats": stats}, "UPSC": {"type": "folder", "stats": stats}})
+    assert replicator.sync_once()
+    data = dm.load_data()
+    assert dm.refresh_data(data) == []
+
+    data["UPSC"]["type"] = "exam"  # unsaved edit
+    other = DataRepository(client=fake_firestore)
+    other.get_versions()
+    other.save_all({"GATE": {"type": "folder", "stats": stats, "Lec 9": {"type": "lecture"}},
+                    "UPSC": {"type": "folder", "stats": stats, "Polity": {"type": "folder"}},
+                    "ESE": {"type": "folder", "stats": stats}})
+    assert replicator.sync_once()
+
+    assert sorted(dm.refresh_data(data)) == ["ESE", "GATE"]
+    assert "Lec 9" in data["GATE"] and "ESE" in data
+    assert data["UPSC"] == {"type": "exam", "stats": stats}
+
+
+def test_node_sessions_pick_up_remote_edits(tmp_path, fake_firestore, monkeypatch):
+    from modules import data_manager as dm
+
+    tree = {"GATE": {"type": "folder", "Signals": {"type": "folder"}, "Old": {"type": "folder"}}}
+    remote = dm.NodeRepository(client=fake_firestore)
+    remote.save_documents(dm.explode_tree(tree))
+    mirror = LocalMirror(str(tmp_path / "nodes.db"), parent_key="parent")
+    replicator = MirrorReplicator(mirror, dm.NodeRepository(client=fake_firestore))
+    monkeypatch.setattr(dm, "_default_mirror", lambda: (mirror, replicator))
+
+    data = dm.load_data()
+    dm.open_folder(data, ["GATE"])
+    remote.save_documents(
+        dm.explode_tree({"GATE": {"type": "folder", "Signals": {"type": "exam"},
+                                  "Analog": {"type": "folder"}}}),
+        [dm.node_id(("GATE", "Old"))])
+    assert replicator.sync_once()
+
+    dm.refresh_data(data)
+    assert data == {"GATE": {"type": "folder", "Signals": {"type": "exam"}, "Analog": {"type": "folder"}}}
+    dm.save_data(data)
+    assert mirror.pending() == ({}, [], {})
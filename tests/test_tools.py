@@ -0,0 +1,69 @@
+from modules import tools
+from modules.storage import KeyValueStore
+
+
+def test_codex_reparses_only_changed_notes(tmp_path, monkeypatch):
+    index = KeyValueStore("formula_index", str(tmp_path / "kv.db"))
+    notes = {"n1": ("v1", "$$a=b$$ text"), "n2": ("v1", "no maths"), "n3": ("v1", "$$x$$")}
+    reads = []
+
+    def read(notes_id, md5=None):
+        reads.append(notes_id)
+        return notes[notes_id][1]
+
+    monkeypatch.setattr(tools, "_formula_index", lambda: index)
+    monkeypatch.setattr(tools, "notes_version", lambda notes_id: notes[notes_id][0])
+    monkeypatch.setattr(tools, "read_notes_from_drive", read)
+    subject = {
+        "type": "folder",
+        "Unit 1": {"type": "lecture", "drive_ids": {"notes_id": "n1"}},
+        "Unit 2": {
+            "type": "folder",
+            "L1": {"type": "lecture", "drive_ids": {"notes_id": "n2"}},
+            "L2": {"type": "lecture", "drive_ids": {"notes_id": "n3"}},
+        },
+    }
+
+    report = tools.generate_formula_codex("Signals", subject)
+    assert sorted(reads) == ["n1", "n2", "n3"]
+    assert "*Compiled from 2 Lecture Notes · 2 unique formulas*" in report
+    assert report.index("Signals > Unit 1") < report.index("Signals > Unit 2 > L2")
+    assert "$$ a=b $$" in report and "$$ x $$" in report
+
+    reads.clear()
+    assert tools.generate_formula_codex("Signals", subject) == report
+    assert reads == []
+
+    notes["n3"] = ("v2", "$$y$$")
+    assert "$$ y $$" in tools.generate_formula_codex("Signals", subject)
+    assert reads == ["n3"]
+
+
+def test_scanner_handles_every_delimiter_in_one_pass():
+    text = (
+        "Cost is \\$5 or $10 and $20.\n"
+        "$$ E = mc^2 $$ then \\[ a+b \\] and $x_1$ and \\(y\\).\n"
+        "`$not math$` and\n```\n$$also not$$\n```\n"
+    )
+    assert list(tools.iter_math(text)) == [
+        ("display", " E = mc^2 "), ("display", " a+b "), ("inline", "x_1"), ("inline", "y"),
+    ]
+
+
+def test_unclosed_openers_are_literal_text():
+    assert tools.extract_formulas_from_text("Don`t $$a+b$$ \\(x^2\\)") == ["a+b", "x^2"]
+    assert tools.extract_formulas_from_text("Price: $$ only. \\[ c^2 \\] and $d$") == ["c^2", "d"]
+
+
+def test_inline_math_respects_blank_lines_and_escapes():
+    assert tools.extract_formulas_from_text("$a\n\nb$ and $c \\$ d$") == ["c \\$ d"]
+    assert tools.extract_formulas_from_text("$a " * 50000) == []
+
+
+def test_formulas_are_normalised_and_deduplicated_across_lectures():
+    assert tools.normalize_formula(r"a \, + \quad b") == tools.normalize_formula("a+b")
+    assert tools.normalize_formula(r"\alpha x") != tools.normalize_formula(r"\alphax")
+    assert tools.extract_formulas_from_text("$$a + b$$ and $a+b$") == ["a + b"]
+
+    unique = tools.dedupe_formulas([("L1", ["a + b", "c"]), ("L2", ["a+b"])])
+    assert [entry["sources"] for entry in unique.values()] == [["L1", "L2"], ["L1"]]